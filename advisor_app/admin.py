@@ -18,7 +18,8 @@ class UserAdmin(BaseUserAdmin):
     list_select_related = ('profile',) # Optimize query
 
     def get_location(self, instance):
-        return instance.profile.location
+        profile = getattr(instance, 'profile', None)  # Users imported without a profile have none yet.
+        return profile.location if profile else None
     get_location.short_description = 'Location'
 
 # Re-register UserAdmin
@@ -32,5 +33,5 @@ admin.site.register(User, UserAdmin)
 #     search_fields = ('user__username', 'location')
 #
 #     def has_google_credentials(self, obj):
-#         return bool(obj.google_credentials_json)
+#         return obj.has_google_credentials
 #     has_google_credentials.boolean = True
@@ -14,4 +14,4 @@ class AdvisorAppConfig(AppConfig):
             import advisor_app.signals  # Import signals to connect them
             logger.info("AdvisorApp signals loaded successfully.")
         except ImportError as e:
-            logger.error(f"Error importing AdvisorApp signals: {e}")
+            logger.error("Error importing AdvisorApp signals: %s", e)
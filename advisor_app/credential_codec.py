@@ -0,0 +1,80 @@
+# smart_advisor_project/advisor_app/credential_codec.py
+"""
+Binary form of stored Google credentials (GoogleCredential.payload):
+
+    version byte | 12-byte nonce | AES-256-GCM(zlib(compact JSON))
+
+The profile's primary key is bound in as associated data, so a payload copied
+to another user's row fails to decrypt. Migration 0005 holds its own frozen copy
+of format 1, so a new format needs a new FORMAT_VERSION, and decode() must keep
+reading version 1 payloads.
+"""
+
+import base64
+import datetime
+import hashlib
+import json
+import os
+import zlib
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+FORMAT_VERSION = b'\x01'
+NONCE_BYTES = 12
+
+
+class CredentialDecodeError(ValueError):
+    """The payload is corrupt, in an unknown format, or was encrypted under another key or row."""
+
+
+def _keys():
+    """The current key first, then retired ones that can still decrypt."""
+    configured = [settings.GOOGLE_CREDENTIALS_KEY, *settings.GOOGLE_CREDENTIALS_OLD_KEYS]
+    keys = []
+    for value in filter(None, configured):
+        key = base64.urlsafe_b64decode(value)
+        if len(key) != 32:
+            raise ImproperlyConfigured("GOOGLE_CREDENTIALS_KEY must be 32 bytes, urlsafe-base64 encoded.")
+        keys.append(key)
+    # Without a dedicated key, derive one from SECRET_KEY (rotating SECRET_KEY then needs re-encryption).
+    keys.append(hashlib.sha256(b'advisor_app.google-credentials:' + settings.SECRET_KEY.encode('utf-8')).digest())
+    return keys
+
+
+def encode(info: dict, profile_pk) -> bytes:
+    """Encrypts parsed Credentials.to_json() output for the given profile."""
+    compact = json.dumps(info, separators=(',', ':'))
+    nonce = os.urandom(NONCE_BYTES)
+    ciphertext = AESGCM(_keys()[0]).encrypt(nonce, zlib.compress(compact.encode('utf-8')), str(profile_pk).encode())
+    return FORMAT_VERSION + nonce + ciphertext
+
+
+def decode(payload: bytes, profile_pk) -> str:
+    """Returns the credentials JSON, or raises CredentialDecodeError."""
+    payload = bytes(payload)  # Some backends hand BinaryField values back as memoryview.
+    if payload[:1] != FORMAT_VERSION:
+        raise CredentialDecodeError(f"Unknown credential format {payload[:1]!r}.")
+    nonce, ciphertext = payload[1:1 + NONCE_BYTES], payload[1 + NONCE_BYTES:]
+    for key in _keys():
+        try:
+            return zlib.decompress(AESGCM(key).decrypt(nonce, ciphertext, str(profile_pk).encode())).decode('utf-8')
+        except InvalidTag:
+            continue
+    raise CredentialDecodeError("Credentials could not be decrypted with any configured key.")
+
+
+def expiry_of(info: dict):
+    """The token expiry in parsed Credentials.to_json() output as an aware UTC datetime, or None."""
+    value = info.get('expiry')
+    if not value:
+        return None
+    try:
+        expiry = datetime.datetime.fromisoformat(value.rstrip('Z'))
+    except ValueError:
+        return None
+    if expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=datetime.timezone.utc)
+    return expiry.astimezone(datetime.timezone.utc)
+
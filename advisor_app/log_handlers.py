@@ -0,0 +1,144 @@
+# smart_advisor_project/advisor_app/log_handlers.py
+"""
+Logging pieces wired up by settings.LOGGING. Only the standard library is
+imported here, since settings loads this module before Django is set up.
+"""
+
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+# LogRecord attributes that aren't user-supplied `extra` fields.
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message, thread, any `extra` fields and the traceback."""
+    def format(self, record):
+        document = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith('_'):
+                document[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            document['exc_info'] = record.exc_text
+        return json.dumps(document, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes 1 in `rate` records at or below `level` (DEBUG by default) per call site
+    (logger and message template), and everything above it. The first record
+    from each site always passes. With %-style calls the template is known
+    without formatting, so a dropped record costs a dict lookup.
+    """
+    def __init__(self, rate=1, level='DEBUG'):
+        super().__init__()
+        self.rate = max(1, int(rate))
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        self._counts = {}
+
+    def filter(self, record):
+        if self.rate == 1 or record.levelno > self.level:
+            return True
+        site = (record.name, record.msg)
+        count = self._counts.get(site, 0)
+        self._counts[site] = count + 1  # Unlocked: a lost increment just shifts the sample.
+        return count % self.rate == 0
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a bounded in-memory queue. A QueueListener thread formats
+    them and writes them to the wrapped StreamHandler, so request threads never
+    block on (or contend for) the stream. When the queue is full, records are
+    dropped and counted rather than blocking; the listener reports how many.
+
+    dictConfig's 'formatter' applies to the wrapped handler, so formatting also
+    happens on the listener thread.
+    """
+    def __init__(self, maxsize=10000, stream=None):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self.listener = None
+        self.start()
+        atexit.register(self.stop)
+        if hasattr(os, 'register_at_fork'):
+            # The listener thread doesn't survive fork(); pre-forking servers need a new one per worker.
+            os.register_at_fork(after_in_child=self._restart_in_child)
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Merge args into the message now (they may be mutated after this call returns),
+        # but leave the expensive formatting to the listener.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def start(self):
+        self.listener = _ReportingListener(self, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        """Flushes what's queued and stops the listener thread."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        self.target.flush()
+
+    def close(self):
+        # dictConfig closes the handlers it replaces; don't leave their listener threads behind.
+        self.stop()
+        super().close()
+
+    def _restart_in_child(self):
+        self.queue = queue.Queue(self.queue.maxsize)
+        self._dropped_lock = threading.Lock()
+        self.dropped = 0
+        self.start()
+
+
+class _ReportingListener(logging.handlers.QueueListener):
+    """Writes to the handler's target and says so when records were dropped on a full queue."""
+    def __init__(self, handler, respect_handler_level=False):
+        super().__init__(handler.queue, handler.target, respect_handler_level=respect_handler_level)
+        self._owner = handler
+
+    def handle(self, record):
+        if self._owner.dropped:
+            with self._owner._dropped_lock:
+                dropped, self._owner.dropped = self._owner.dropped, 0
+            super().handle(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': "Log queue full: %d records dropped.", 'args': (dropped,),
+            }))
+        super().handle(record)
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)  # Wait for room: the queue may be full of records still to write.
@@ -0,0 +1,40 @@
+# smart_advisor_project/advisor_app/management/commands/export_dashboard_snapshots.py
+
+import json
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from advisor_app.models import UserProfile
+from advisor_app.services.dashboard_snapshots import build_dashboard_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes the dashboard data (weather, Eventbrite events, upcoming calendar events) "
+        "for the given users, or all of them, as JSON Lines: one object per user, "
+        "streamed as each batch is built."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int, help="Users to export (default: every user with a profile).")
+        parser.add_argument('--output', help="Write to this file instead of stdout.")
+        parser.add_argument('--workers', type=int, default=settings.DASHBOARD_SNAPSHOT_WORKERS,
+                            help="Calendar syncs and Eventbrite fetches in flight at once.")
+        parser.add_argument('--batch-size', type=int, default=settings.DASHBOARD_SNAPSHOT_BATCH_SIZE,
+                            help="Users loaded, grouped by location and fetched together.")
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or (
+            UserProfile.objects.order_by('user_id').values_list('user_id', flat=True).iterator())
+        out = open(options['output'], 'w', encoding='utf-8') if options['output'] else self.stdout
+        count = 0
+        try:
+            for snapshot in build_dashboard_snapshots(user_ids, max_workers=options['workers'], batch_size=options['batch_size']):
+                out.write(json.dumps(snapshot, cls=DjangoJSONEncoder) + "\n")
+                count += 1
+        finally:
+            if options['output']:
+                out.close()
+        self.stderr.write(f"Exported {count} dashboard snapshots.")
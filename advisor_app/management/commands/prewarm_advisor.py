@@ -0,0 +1,116 @@
+# smart_advisor_project/advisor_app/management/commands/prewarm_advisor.py
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from advisor_app.models import UserProfile
+from advisor_app.services import caching, geo, rate_limit, weather_service, eventbrite_service
+
+
+class _Pacer:
+    """Spaces upstream calls at least 1/rate seconds apart across all worker threads."""
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Command(BaseCommand):
+    help = (
+        "Geocodes profiles that have no coordinates yet, then fetches weather and Eventbrite "
+        "data once for every distinct profile location (grid cell for geocoded profiles) "
+        "and writes it into the shared cache the dashboard reads. Schedule it a little "
+        "more often than WEATHER_CACHE_TTL so dashboard requests find warm entries. "
+        "Upstream calls run at background priority, behind dashboard requests in the shared rate limits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help="Locations fetched in parallel.")
+        parser.add_argument('--rate', type=float, default=5.0,
+                            help="Maximum upstream calls per second across all workers (0 = unlimited).")
+        parser.add_argument('--skip-events', action='store_true', help="Only prewarm weather.")
+
+    def handle(self, *args, **options):
+        if not caching.backend_is_shared():
+            raise CommandError(
+                f"The default cache ({settings.CACHES['default']['BACKEND']}) is process-local; prewarmed "
+                "entries would be gone when this command exits. Configure a shared CACHE_BACKEND."
+            )
+        with rate_limit.background():
+            self._prewarm(options)
+
+    def _prewarm(self, options):
+        # The dashboard doesn't geocode, so profiles saved before geocoding existed are placed here.
+        located = geo.locate_unplaced_profiles()
+        self.stdout.write(f"Geocoded {located['located']} profiles ({located['unplaced']} could not be placed).")
+        locations = self._distinct_locations()
+        self.stdout.write(f"Prewarming {len(locations)} distinct locations...")
+        pacer = _Pacer(options['rate'])
+        stats = {'weather_ok': 0, 'weather_error': 0, 'events_ok': 0, 'events_error': 0}
+        stats_lock = threading.Lock()
+
+        def record(kind, result):
+            outcome = 'error' if result.get('error') else 'ok'
+            with stats_lock:
+                stats[f'{kind}_{outcome}'] += 1
+
+        # Weather goes through the batch API, which dedupes and fans out on its own.
+        weather_items = [(coordinates['latitude'], coordinates['longitude']) if coordinates else location
+                         for location, coordinates in locations]
+        weather = weather_service.get_weather_batch(
+            weather_items, force_refresh=True, max_workers=options['concurrency'], throttle=pacer.wait)
+        for result in weather.values():
+            record('weather', result)
+
+        def prewarm_events(target):
+            location, coordinates = target
+            pacer.wait()
+            with rate_limit.background():  # Executor threads don't inherit the caller's context.
+                record('events', eventbrite_service.get_eventbrite_events(
+                    force_refresh=True, **(coordinates or {'location_address': location})))
+
+        if not options['skip_events']:
+            with ThreadPoolExecutor(max_workers=options['concurrency'], thread_name_prefix='advisor-prewarm') as executor:
+                list(executor.map(prewarm_events, locations))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Weather: {stats['weather_ok']} ok, {stats['weather_error']} errors. "
+            f"Events: {stats['events_ok']} ok, {stats['events_error']} errors."
+        ))
+
+    def _distinct_locations(self):
+        """
+        SELECT DISTINCT location and coordinates, then collapse rows that share a cache key:
+        the grid cell for geocoded profiles, the normalized spelling for the rest.
+        Returns [(location, latitude/longitude kwargs or {}), ...] as the dashboard passes them.
+        """
+        raw = (
+            UserProfile.objects
+            .exclude(location__isnull=True)
+            .exclude(location='')
+            .values_list('location', 'latitude', 'longitude')
+            .distinct()
+        )
+        by_key = {}
+        for location, latitude, longitude in raw:
+            if latitude is not None and longitude is not None:
+                key = ('cell', geo.snap(latitude, longitude)[0])
+                coordinates = {'latitude': latitude, 'longitude': longitude}
+            else:
+                key = ('text', caching.normalize_location(location))
+                coordinates = {}
+            by_key.setdefault(key, (location, coordinates))
+        return list(by_key.values())
@@ -0,0 +1,40 @@
+# smart_advisor_project/advisor_app/management/commands/refresh_google_tokens.py
+
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from advisor_app.services import token_refresher
+
+
+class Command(BaseCommand):
+    help = (
+        "Refreshes stored Google OAuth tokens that are about to expire, so dashboard "
+        "requests rarely have to refresh inline. Run it from cron, or with --loop as a worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=settings.GOOGLE_TOKEN_REFRESH_WINDOW,
+                            help="Refresh tokens expiring within this many seconds.")
+        parser.add_argument('--workers', type=int, default=settings.GOOGLE_TOKEN_REFRESH_WORKERS,
+                            help="Maximum refreshes in flight at once.")
+        parser.add_argument('--batch-size', type=int, default=settings.GOOGLE_TOKEN_REFRESH_BATCH_SIZE,
+                            help="Profiles refreshed and saved per bulk update.")
+        parser.add_argument('--loop', action='store_true', help="Keep running, scanning every --interval seconds.")
+        parser.add_argument('--interval', type=int, default=60, help="Seconds between scans with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            stats = token_refresher.refresh_expiring_credentials(
+                window_seconds=options['window'],
+                max_workers=options['workers'],
+                batch_size=options['batch_size'],
+            )
+            self.stdout.write(
+                f"Refreshed {stats['refreshed']}, cleared {stats['revoked']} revoked, {stats['failed']} failed."
+            )
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
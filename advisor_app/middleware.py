@@ -0,0 +1,94 @@
+# smart_advisor_project/advisor_app/middleware.py
+
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.utils.functional import SimpleLazyObject
+
+from .models import UserProfile
+from .services import metrics
+
+
+class ProfileMiddleware:
+    """
+    Adds a lazily evaluated request.profile: the signed-in user's UserProfile,
+    or None for anonymous requests. Nothing is queried unless a view uses it,
+    and with ProfileModelBackend the profile arrives with the user anyway.
+    Must come after AuthenticationMiddleware. Async views should resolve it
+    inside sync_to_async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.profile = SimpleLazyObject(lambda: _profile_for(request))
+        return self.get_response(request)  # An awaitable when the chain is async.
+
+
+def _profile_for(request):
+    if not request.user.is_authenticated:
+        return None
+    return UserProfile.objects.for_user(request.user)
+
+
+class RequestMetricsMiddleware:
+    """
+    Times every request (by resolved view) and the database queries it runs on
+    the request thread, alongside the phases recorded by the views and services
+    through services.metrics. With SERVER_TIMING_ENABLED the per-request phase
+    breakdown is also returned in a Server-Timing header.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(_time_query):
+                response = self.get_response(request)
+        finally:
+            timings = metrics.end_request(token)
+        return self._finish(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        # ORM calls run in sync_to_async threads here, so db time isn't broken out.
+        token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings = metrics.end_request(token)
+        return self._finish(request, response, timings, time.perf_counter() - started)
+
+    def _finish(self, request, response, timings: dict, elapsed: float):
+        if 'db' in timings:  # One sample per request, not per query.
+            metrics.observe('advisor_phase_seconds', timings['db'], phase='db')
+        match = request.resolver_match
+        metrics.observe('advisor_request_seconds', elapsed,
+                        view=match.view_name if match else 'unresolved', method=request.method)
+        if settings.SERVER_TIMING_ENABLED:
+            timings['total'] = elapsed
+            response['Server-Timing'] = metrics.server_timing(timings)
+        return response
+
+
+def _time_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_request_time('db', time.perf_counter() - started)
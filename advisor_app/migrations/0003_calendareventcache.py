@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("advisor_app", "0002_remove_userprofile_id_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CalendarEventCache",
+            fields=[
+                (
+                    "profile",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="calendar_cache",
+                        serialize=False,
+                        to="advisor_app.userprofile",
+                    ),
+                ),
+                ("sync_token", models.TextField(blank=True, null=True)),
+                (
+                    "events_json",
+                    models.TextField(
+                        default="[]", help_text="Cached Calendar events as a JSON list."
+                    ),
+                ),
+                ("window_start", models.DateTimeField(blank=True, null=True)),
+                ("window_end", models.DateTimeField(blank=True, null=True)),
+                ("synced_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="userprofile",
+            name="location",
+            field=models.CharField(
+                blank=True,
+                help_text="Enter a City (e.g., Mumbai, London) or a specific address. Country-level searches (e.g., 'India') may not yield Eventbrite results.",
+                max_length=100,
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("advisor_app", "0003_calendareventcache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GeocodedLocation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "query",
+                    models.CharField(
+                        help_text="Normalized location text.",
+                        max_length=255,
+                        unique=True,
+                    ),
+                ),
+                ("found", models.BooleanField(default=True)),
+                ("latitude", models.FloatField(blank=True, null=True)),
+                ("longitude", models.FloatField(blank=True, null=True)),
+                ("name", models.CharField(blank=True, default="", max_length=255)),
+                ("country", models.CharField(blank=True, default="", max_length=8)),
+                (
+                    "geocoded_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="userprofile",
+            name="latitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="userprofile",
+            name="longitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
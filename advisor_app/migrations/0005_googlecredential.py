@@ -0,0 +1,163 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:28
+
+import base64
+import datetime
+import hashlib
+import json
+import os
+import zlib
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Rows converted per query; the profile table is walked in primary-key order
+# one batch at a time, so it is never loaded whole.
+BATCH_SIZE = 500
+
+# A frozen copy of payload format 1 from advisor_app.credential_codec, so this
+# migration keeps writing the format it was written for whatever the codec
+# becomes: version byte | 12-byte nonce | AES-256-GCM(zlib(compact JSON)),
+# with the profile's primary key as associated data.
+FORMAT_VERSION = b"\x01"
+NONCE_BYTES = 12
+
+
+def _keys():
+    configured = [settings.GOOGLE_CREDENTIALS_KEY, *settings.GOOGLE_CREDENTIALS_OLD_KEYS]
+    keys = []
+    for value in filter(None, configured):
+        key = base64.urlsafe_b64decode(value)
+        if len(key) != 32:
+            raise ImproperlyConfigured(
+                "GOOGLE_CREDENTIALS_KEY must be 32 bytes, urlsafe-base64 encoded."
+            )
+        keys.append(key)
+    keys.append(
+        hashlib.sha256(
+            b"advisor_app.google-credentials:" + settings.SECRET_KEY.encode("utf-8")
+        ).digest()
+    )
+    return keys
+
+
+def _encode(info, profile_pk):
+    compact = json.dumps(info, separators=(",", ":"))
+    nonce = os.urandom(NONCE_BYTES)
+    ciphertext = AESGCM(_keys()[0]).encrypt(
+        nonce, zlib.compress(compact.encode("utf-8")), str(profile_pk).encode()
+    )
+    return FORMAT_VERSION + nonce + ciphertext
+
+
+def _decode(payload, profile_pk):
+    payload = bytes(payload)
+    if payload[:1] != FORMAT_VERSION:
+        raise ValueError(f"Unknown credential format {payload[:1]!r}.")
+    nonce, ciphertext = payload[1 : 1 + NONCE_BYTES], payload[1 + NONCE_BYTES :]
+    for key in _keys():
+        try:
+            plaintext = AESGCM(key).decrypt(nonce, ciphertext, str(profile_pk).encode())
+        except InvalidTag:
+            continue
+        return zlib.decompress(plaintext).decode("utf-8")
+    raise ValueError("Credentials could not be decrypted with any configured key.")
+
+
+def _expiry_of(info):
+    value = info.get("expiry")
+    if not value:
+        return None
+    try:
+        expiry = datetime.datetime.fromisoformat(value.rstrip("Z"))
+    except ValueError:
+        return None
+    if expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=datetime.timezone.utc)
+    return expiry.astimezone(datetime.timezone.utc)
+
+
+def _batches(queryset):
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        batch = list(page.order_by("pk")[:BATCH_SIZE])
+        if not batch:
+            return
+        last_pk = batch[-1][0]
+        yield batch
+
+
+def encrypt_credentials(apps, schema_editor):
+    """Moves UserProfile.google_credentials_json into encrypted GoogleCredential rows."""
+    UserProfile = apps.get_model("advisor_app", "UserProfile")
+    GoogleCredential = apps.get_model("advisor_app", "GoogleCredential")
+    profiles = (
+        UserProfile.objects.exclude(google_credentials_json__isnull=True)
+        .exclude(google_credentials_json="")
+        .values_list("pk", "google_credentials_json")
+    )
+    for batch in _batches(profiles):
+        rows = []
+        for pk, credentials_json in batch:
+            try:
+                info = json.loads(credentials_json)
+            except ValueError:
+                continue  # Unreadable blobs were already treated as "not connected".
+            if not isinstance(info, dict):
+                continue  # Nor could JSON that isn't an object ("null", "[]") build Credentials.
+            rows.append(
+                GoogleCredential(
+                    profile_id=pk,
+                    payload=_encode(info, pk),
+                    expiry=_expiry_of(info),
+                    has_refresh_token=bool(info.get("refresh_token")),
+                )
+            )
+        GoogleCredential.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def decrypt_credentials(apps, schema_editor):
+    UserProfile = apps.get_model("advisor_app", "UserProfile")
+    GoogleCredential = apps.get_model("advisor_app", "GoogleCredential")
+    for batch in _batches(GoogleCredential.objects.values_list("pk", "payload")):
+        profiles = [
+            UserProfile(
+                pk=pk, google_credentials_json=_decode(payload, pk)
+            )
+            for pk, payload in batch
+        ]
+        UserProfile.objects.bulk_update(profiles, ["google_credentials_json"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("advisor_app", "0004_geocoding"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GoogleCredential",
+            fields=[
+                (
+                    "profile",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="google_credential",
+                        serialize=False,
+                        to="advisor_app.userprofile",
+                    ),
+                ),
+                ("payload", models.BinaryField()),
+                ("expiry", models.DateTimeField(blank=True, db_index=True, null=True)),
+                ("has_refresh_token", models.BooleanField(default=False)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(encrypt_credentials, decrypt_credentials, elidable=True),
+    ]
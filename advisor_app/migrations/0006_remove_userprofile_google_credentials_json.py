@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:28
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("advisor_app", "0005_googlecredential"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="userprofile",
+            name="google_credentials_json",
+        ),
+    ]
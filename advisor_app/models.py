@@ -2,12 +2,89 @@
 
 from django.db import models
 from django.contrib.auth.models import User
+import copy
 import json
+import hashlib
 import logging
 import datetime
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.utils import timezone
+
+from . import credential_codec
 
 logger = logging.getLogger(__name__)
 
+
+class _CredentialsLRU:
+    """
+    Optional process-wide cache of decrypted Google credential info, keyed on
+    (profile pk, hash of the stored payload) so a changed blob never hits a stale entry.
+    Only the keyword arguments are cached: Credentials objects are mutable (refresh()
+    rewrites them), so every hit builds a fresh one rather than sharing it across requests.
+    Sized by GOOGLE_CREDENTIALS_LRU_SIZE; 0 disables it.
+    """
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(pk, payload: bytes):
+        return pk, hashlib.sha256(payload).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            info = self._entries[key]
+        from google.oauth2.credentials import Credentials
+        return Credentials(**copy.deepcopy(info))
+
+    def put(self, key, info: dict):
+        max_size = settings.GOOGLE_CREDENTIALS_LRU_SIZE
+        if max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = copy.deepcopy(info)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+credentials_lru = _CredentialsLRU()
+
+
+class UserProfileManager(models.Manager):
+    def for_user(self, user):
+        """
+        Returns the user's profile, creating it on first access if it's missing
+        (users imported without the post_save signal, or created before it existed).
+        The result is cached on user.profile, so repeat calls cost nothing.
+        """
+        try:
+            return user.profile
+        except UserProfile.DoesNotExist:
+            profile, created = self.get_or_create(user=user)
+            if created:
+                logger.info("UserProfile created on first access for user: %s", user.username)
+            user.profile = profile
+            return profile
+
+    def bulk_create_for_users(self, users, batch_size: int = 500):
+        """
+        Creates missing profiles for many users in batched INSERTs, e.g. after
+        User.objects.bulk_create(), which doesn't send post_save. Users that
+        already have a profile are skipped.
+        """
+        profiles = [self.model(user=user) for user in users]
+        return self.bulk_create(profiles, batch_size=batch_size, ignore_conflicts=True)
+
 class UserProfile(models.Model):
     user = models.OneToOneField(
         User,
@@ -21,41 +98,89 @@ class UserProfile(models.Model):
         null=True,
         help_text="Enter a City (e.g., Mumbai, London) or a specific address. Country-level searches (e.g., 'India') may not yield Eventbrite results."
     )
-    google_credentials_json = models.TextField(
-        blank=True,
-        null=True,
-        help_text="Stores Google OAuth credentials as JSON. Handle with care."
-    )
+    # Geocoded from `location` (see services/geo.py); cleared whenever the location changes.
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    objects = UserProfileManager()
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
+    def _google_credential(self):
+        """This profile's GoogleCredential row, loaded on first use; None if there isn't one."""
+        try:
+            return self.google_credential
+        except GoogleCredential.DoesNotExist:
+            return None
+
+    @property
+    def has_google_credentials(self) -> bool:
+        return self._google_credential() is not None
+
     def set_google_credentials(self, credentials):
+        """Stores the credentials (encrypted, in GoogleCredential). Anything that can't be serialized clears them."""
+        credentials_json = None
         if hasattr(credentials, 'to_json'):
             try:
-                self.google_credentials_json = credentials.to_json()
-                logger.debug(f"Successfully serialized and set Google credentials for user {self.user.username}")
+                credentials_json = credentials.to_json()
+                logger.debug("Successfully serialized and set Google credentials for user %s", self.user.username)
             except Exception as e:
-                logger.error(f"Error during credentials.to_json() for user {self.user.username}: {e}")
-                self.google_credentials_json = None
+                logger.error("Error during credentials.to_json() for user %s: %s", self.user.username, e)
         else:
             logger.error(
-                f"Attempted to set Google credentials for {self.user.username} "
-                f"with an object of type '{type(credentials).__name__}' which lacks a 'to_json' method."
+                "Attempted to set Google credentials for %s with an object of type '%s' which lacks a 'to_json' method.",
+                self.user.username, type(credentials).__name__,
             )
-            self.google_credentials_json = None
-        self.save()
+        if credentials_json is None:
+            self.clear_google_credentials()
+            return
+        row = self._google_credential() or GoogleCredential(profile=self)
+        row.store(json.loads(credentials_json))
+        row.save()
+        self.google_credential = row
+        # Remember the object we just serialized so the next get doesn't decode it again.
+        self._google_credentials_cache = (row.payload, credentials)
+
+    def clear_google_credentials(self):
+        """Deletes the stored credentials (revoked access, failed refresh, disconnect)."""
+        GoogleCredential.objects.filter(profile=self).delete()
+        self.google_credential = None
+        self._google_credentials_cache = (None, None)
 
     def get_google_credentials(self):
-        if not self.google_credentials_json:
-            logger.debug(f"No Google credentials JSON found for user {self.user.username}")
-            return None
+        """
+        Returns the decoded Credentials, memoized on this instance until the
+        stored payload changes, and optionally in a process-wide LRU.
+        """
+        row = self._google_credential()
+        payload = bytes(row.payload) if row is not None else None
+        cached = getattr(self, '_google_credentials_cache', None)
+        if cached is not None and cached[0] == payload:
+            return cached[1]
+        credentials = None
+        if payload is None:
+            logger.debug("No Google credentials stored for user %s", self.user_id)
+        else:
+            lru_key = None
+            if settings.GOOGLE_CREDENTIALS_LRU_SIZE > 0:
+                lru_key = _CredentialsLRU.key(self.pk, payload)
+                credentials = credentials_lru.get(lru_key)
+            if credentials is None:
+                credentials, info = self._decode_google_credentials(row)
+                if credentials is not None and lru_key is not None:
+                    credentials_lru.put(lru_key, info)
+        self._google_credentials_cache = (payload, credentials)
+        return credentials
+
+    def _decode_google_credentials(self, row):
+        """(Credentials, the keyword arguments they were built from), or (None, None) if unusable."""
         try:
             from google.oauth2.credentials import Credentials
-            creds_info_dict = json.loads(self.google_credentials_json)
+            creds_info_dict = json.loads(row.credentials_json())
             if 'expiry' in creds_info_dict and isinstance(creds_info_dict['expiry'], str):
                 expiry_str_value = creds_info_dict['expiry']
-                logger.debug(f"Found string expiry '{expiry_str_value}' for user {self.user.username}. Attempting to parse to naive UTC.")
+                logger.debug("Found string expiry '%s' for user %s. Attempting to parse to naive UTC.", expiry_str_value, self.user.username)
                 try:
                     parsed_datetime_aware = None
                     if expiry_str_value.endswith('Z'):
@@ -67,20 +192,122 @@ class UserProfile(models.Model):
                     if parsed_datetime_aware:
                         datetime_in_utc_aware = parsed_datetime_aware.astimezone(datetime.timezone.utc)
                         creds_info_dict['expiry'] = datetime_in_utc_aware.replace(tzinfo=None)
-                        logger.info(f"Successfully parsed expiry string to NAIVE UTC datetime for user {self.user.username}: {creds_info_dict['expiry']}")
-                    else: logger.warning(f"Could not create an aware datetime from expiry string '{expiry_str_value}' for user {self.user.username}.")
-                except ValueError as ve: logger.error(f"ValueError parsing expiry string '{expiry_str_value}' for user {self.user.username}: {ve}.")
+                        logger.debug("Successfully parsed expiry string to NAIVE UTC datetime for user %s: %s", self.user.username, creds_info_dict['expiry'])
+                    else: logger.warning("Could not create an aware datetime from expiry string '%s' for user %s.", expiry_str_value, self.user.username)
+                except ValueError as ve: logger.error("ValueError parsing expiry string '%s' for user %s: %s.", expiry_str_value, self.user.username, ve)
             credentials = Credentials(**creds_info_dict)
-            logger.debug(f"Successfully retrieved and constructed Google credentials object for user {self.user.username}")
-            return credentials
-        except json.JSONDecodeError as e: logger.error(f"JSONDecodeError loading Google credentials for {self.user.username}. Data (first 100 chars): '{self.google_credentials_json[:100] if self.google_credentials_json else 'None'}'. Error: {e}")
+            logger.debug("Successfully retrieved and constructed Google credentials object for user %s", self.user.username)
+            return credentials, creds_info_dict
+        except credential_codec.CredentialDecodeError as e: logger.error("Stored Google credentials for %s could not be decrypted: %s", self.user.username, e)
+        except json.JSONDecodeError as e: logger.error("JSONDecodeError loading Google credentials for %s: %s", self.user.username, e)
         except TypeError as e:
             dict_keys = list(creds_info_dict.keys()) if 'creds_info_dict' in locals() else "Unknown"
-            logger.error(f"TypeError creating Credentials object for {self.user.username}. Dict keys: {dict_keys}. Error: {e}")
-        except Exception as e: logger.error(f"Unexpected error loading Google credentials for {self.user.username}: {e}", exc_info=True)
-        return None
+            logger.error("TypeError creating Credentials object for %s. Dict keys: %s. Error: %s", self.user.username, dict_keys, e)
+        except Exception as e: logger.error("Unexpected error loading Google credentials for %s: %s", self.user.username, e, exc_info=True)
+        return None, None
 
     @property
     def has_valid_google_credentials(self):
         creds = self.get_google_credentials()
-        return creds and creds.valid
\ No newline at end of file
+        return creds and creds.valid
+
+    @property
+    def coordinates(self):
+        """(latitude, longitude), or None until the location has been geocoded."""
+        if self.latitude is None or self.longitude is None:
+            return None
+        return self.latitude, self.longitude
+
+
+class GoogleCredential(models.Model):
+    """
+    A user's Google OAuth credentials, kept off the profile row so loading or
+    saving a profile doesn't move them. `payload` is the encrypted, compressed
+    Credentials JSON (see credential_codec); `expiry` and `has_refresh_token`
+    are stored in the clear so refresh scans filter on an index instead of
+    decrypting every row.
+    """
+    profile = models.OneToOneField(
+        UserProfile,
+        on_delete=models.CASCADE,
+        related_name='google_credential',
+        primary_key=True,
+    )
+    payload = models.BinaryField()
+    expiry = models.DateTimeField(null=True, blank=True, db_index=True)
+    has_refresh_token = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Google credentials for {self.profile_id}"
+
+    def store(self, info: dict):
+        """Encrypts parsed Credentials.to_json() output into this row (not saved)."""
+        self.payload = credential_codec.encode(info, self.profile_id)
+        self.expiry = credential_codec.expiry_of(info)
+        self.has_refresh_token = bool(info.get('refresh_token'))
+        self.updated_at = timezone.now()  # auto_now doesn't apply to bulk_update().
+
+    def credentials_json(self) -> str:
+        return credential_codec.decode(self.payload, self.profile_id)
+
+
+class GeocodedLocation(models.Model):
+    """
+    Persistent geocoding cache: one row per normalized location string, shared
+    by every profile that spells the location that way. Misses are stored too
+    (found=False) so unknown places aren't looked up on every request.
+    """
+    query = models.CharField(max_length=255, unique=True, help_text="Normalized location text.")
+    found = models.BooleanField(default=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    name = models.CharField(max_length=255, blank=True, default='')
+    country = models.CharField(max_length=8, blank=True, default='')
+    geocoded_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        if not self.found:
+            return f"{self.query} (not found)"
+        return f"{self.query} -> {self.latitude:.4f},{self.longitude:.4f}"
+
+
+class CalendarEventCache(models.Model):
+    """
+    Last known upcoming Google Calendar events for a user, plus the Calendar
+    API sync token used to pull only what changed since. Events are kept for
+    the window [window_start, window_end] that the last full sync covered.
+    """
+    profile = models.OneToOneField(
+        UserProfile,
+        on_delete=models.CASCADE,
+        related_name='calendar_cache',
+        primary_key=True,
+    )
+    sync_token = models.TextField(blank=True, null=True)
+    events_json = models.TextField(default='[]', help_text="Cached Calendar events as a JSON list.")
+    window_start = models.DateTimeField(null=True, blank=True)
+    window_end = models.DateTimeField(null=True, blank=True)
+    synced_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Calendar cache for {self.profile_id}"
+
+    @property
+    def events(self):
+        return json.loads(self.events_json or '[]')
+
+    @events.setter
+    def events(self, value):
+        self.events_json = json.dumps(value)
+
+    def is_fresh(self, ttl_seconds: int) -> bool:
+        if not self.synced_at:
+            return False
+        return (timezone.now() - self.synced_at).total_seconds() < ttl_seconds
+
+    def needs_full_sync(self) -> bool:
+        """A full sync is needed without a token, or once half the cached window has elapsed."""
+        if not self.sync_token or not self.window_start or not self.window_end:
+            return True
+        return timezone.now() > self.window_start + (self.window_end - self.window_start) / 2
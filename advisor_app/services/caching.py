@@ -0,0 +1,409 @@
+# smart_advisor_project/advisor_app/services/caching.py
+
+import asyncio
+import hashlib
+import pickle
+import random
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+import logging
+
+from . import concurrency, metrics, rate_limit
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(namespace: str, *parts, version: int = 1) -> str:
+    """
+    Builds a backend-safe cache key. Parts are hashed so free-text input
+    (spaces, unicode, long addresses) never produces an invalid memcached key.
+    Bump `version` when the shape of a namespace's cached values changes, so old
+    entries are ignored; CACHES['default']['VERSION'] does the same for everything.
+    """
+    raw = "|".join(str(part) for part in parts)
+    digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    return f"advisor:{namespace}:v{version}:{digest}"
+
+
+def _count(key: str, result: str, tier: str = 'shared'):
+    metrics.inc('advisor_cache_requests_total', namespace=key.split(':')[1], result=result, tier=tier)
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU in front of the shared backend. Entries are stored
+    pickled, so callers can't mutate a cached value and its size is known;
+    least recently used entries are evicted once `max_bytes` is exceeded.
+    Copies live at most `max_ttl` seconds, which bounds how long this process
+    can miss a refresh or invalidation made by another one.
+    """
+    def __init__(self, max_bytes: int, max_ttl: float):
+        self.max_bytes = max_bytes
+        self.max_ttl = max_ttl
+        self._entries = OrderedDict()  # {key: (expires_at, pickled entry)}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if time.monotonic() >= item[0]:
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+        return pickle.loads(item[1])
+
+    def set(self, key: str, entry, timeout: float):
+        if self.max_bytes <= 0:
+            return
+        data = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes // 4:
+            return  # One oversized value shouldn't flush everything else.
+        expires_at = time.monotonic() + min(timeout, self.max_ttl)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (expires_at, data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def _discard(self, key: str):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self._bytes -= len(item[1])
+
+
+# Backends whose entries live in (or never leave) the current process.
+PROCESS_LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+
+def backend_is_shared() -> bool:
+    """Whether the default cache is visible to other processes (web workers, management commands)."""
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+# In front of a process-local backend the local tier would only keep a second copy, so it's off.
+local = LocalCache(settings.ADVISOR_LOCAL_CACHE_MAX_BYTES if backend_is_shared() else 0, settings.ADVISOR_LOCAL_CACHE_TTL)
+
+
+def _get_entry(key: str):
+    """Returns (entry, tier): a fresh local copy if there is one, else the shared backend's entry (or None)."""
+    entry = local.get(key)
+    if entry is not None and time.time() < entry['fresh_until']:
+        return entry, 'local'
+    entry = cache.get(key)
+    _remember(key, entry)
+    return entry, 'shared'
+
+
+def _remember(key: str, entry):
+    """Copies a fresh shared entry into the local tier, for no longer than it stays fresh."""
+    if entry is not None:
+        remaining = entry['fresh_until'] - time.time()
+        if remaining > 0:
+            local.set(key, entry, remaining)
+
+
+def _jittered(ttl: float) -> float:
+    """Spreads TTLs by +/- CACHE_TTL_JITTER so entries written together don't all expire together."""
+    return ttl * random.uniform(1 - settings.CACHE_TTL_JITTER, 1 + settings.CACHE_TTL_JITTER)
+
+
+def invalidate(key: str, errors_only: bool = False):
+    """
+    Drops a key from both tiers (only if it holds a cached error, with `errors_only`).
+    Other processes' local copies go when their ADVISOR_LOCAL_CACHE_TTL runs out.
+    """
+    if errors_only:
+        entry = cache.get(key)
+        if entry is None or not entry['negative']:
+            return
+    local.delete(key)
+    cache.delete(key)
+
+
+def clear():
+    """Empties both tiers (tests, or after changing cached formats by hand)."""
+    local.clear()
+    cache.clear()
+
+
+def stats() -> dict:
+    """
+    Lookups recorded by this process, per namespace: {'weather': {'local': n, 'shared': n,
+    'stale': n, 'miss': n, 'hit_ratio': fresh hits / lookups, 'local_ratio': local hits / lookups}}.
+    """
+    results = {}
+    for labels, value in metrics.counter_values('advisor_cache_requests_total').items():
+        labels = dict(labels)
+        counts = results.setdefault(labels['namespace'], {'local': 0, 'shared': 0, 'stale': 0, 'miss': 0})
+        outcome = labels.get('tier', 'shared') if labels['result'] == 'hit' else labels['result']
+        counts[outcome] += value
+    for counts in results.values():
+        lookups = sum(counts.values())
+        counts['hit_ratio'] = (counts['local'] + counts['shared']) / lookups if lookups else 0.0
+        counts['local_ratio'] = counts['local'] / lookups if lookups else 0.0
+    return results
+
+
+def normalize_location(location: str) -> str:
+    """'  London , UK ' and 'london,uk' should share one cache entry."""
+    return ",".join(" ".join(part.split()) for part in location.split(",")).lower()
+
+
+class _Flight:
+    """One in-progress upstream call that concurrent callers can wait on."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _single_flight(key: str, fn):
+    """
+    Runs fn() once per key at a time within this process. Callers that arrive
+    while a call is in flight wait for it and share its result.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+    try:
+        flight.result = fn()
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+def _make_entry(key: str, value, ttl_for, stale_ttl: int):
+    """Returns (entry, backend_timeout) for a fetched value, or None if it shouldn't be cached."""
+    ttl = ttl_for(value)
+    if ttl is None:
+        logger.debug("Not caching result for %s.", key)
+        return None
+    ttl = _jittered(ttl)
+    negative = isinstance(value, dict) and bool(value.get('error'))
+    entry = {'value': value, 'fresh_until': time.time() + ttl, 'negative': negative}
+    # Negative entries expire outright; positive ones linger as stale fallbacks.
+    return entry, (ttl if negative else ttl + stale_ttl)
+
+
+def _fetch_and_store(key: str, fetch, ttl_for, stale_ttl: int):
+    value = fetch()
+    store(key, value, ttl_for, stale_ttl)
+    return value
+
+
+def get_fresh_many(keys) -> dict:
+    """
+    Returns {key: value} for the keys that have a fresh entry, in one cache round trip.
+    For batch callers that fetch the misses together; stale entries count as misses.
+    Keys with a local copy don't reach the shared backend at all.
+    """
+    fresh, remote = {}, []
+    now = time.time()
+    for key in keys:
+        entry = local.get(key)
+        if entry is not None and now < entry['fresh_until']:
+            fresh[key] = entry['value']
+            _count(key, 'hit', 'local')
+        else:
+            remote.append(key)
+    if not remote:
+        return fresh
+    for key, entry in cache.get_many(remote).items():
+        if now < entry['fresh_until']:
+            fresh[key] = entry['value']
+            _remember(key, entry)
+    for key in remote:
+        _count(key, 'hit' if key in fresh else 'miss')
+    return fresh
+
+
+def get_fresh(key: str):
+    """The value of a fresh entry for `key`, or None. Never fetches."""
+    return get_fresh_many([key]).get(key)
+
+
+def store(key: str, value, ttl_for, stale_ttl: int = 0):
+    """Caches a value fetched outside get_or_fetch (e.g. one item of a bulk response) the same way it would."""
+    made = _make_entry(key, value, ttl_for, stale_ttl)
+    if made is not None:
+        cache.set(key, made[0], timeout=made[1])
+        _remember(key, made[0])
+    else:
+        local.delete(key)  # Don't keep serving a local copy the fetch just superseded.
+
+
+def get_or_fetch(key: str, fetch, ttl_for, stale_ttl: int = 0, force: bool = False):
+    """
+    Returns the cached value for `key`, calling `fetch()` on a miss.
+    Fresh values are served from this process's LocalCache when possible,
+    then from the shared backend.
+
+    `ttl_for(value)` decides how long a fetched value stays fresh, or returns
+    None to skip caching it (e.g. transient upstream errors). Within
+    `stale_ttl` seconds after expiry a stale value is served immediately while
+    one background refresh runs. Concurrent misses for the same key in this
+    process are coalesced into a single upstream call. With `force`, the
+    cached value is ignored and replaced by a fresh fetch.
+    """
+    if force:
+        return _single_flight(key, lambda: _fetch_and_store(key, fetch, ttl_for, stale_ttl))
+
+    entry, tier = _get_entry(key)
+    if entry is not None:
+        if time.time() < entry['fresh_until']:
+            logger.debug("Cache hit for %s (%s).", key, tier)
+            _count(key, 'hit', tier)
+            return entry['value']
+        if not entry['negative']:
+            logger.debug("Serving stale value for %s while revalidating.", key)
+            _count(key, 'stale')
+            _revalidate_in_background(key, fetch, ttl_for, stale_ttl)
+            return entry['value']
+
+    def load():
+        # Another caller may have filled the cache while we waited for the flight.
+        entry, _ = _get_entry(key)
+        if entry is not None and time.time() < entry['fresh_until']:
+            return entry['value']
+        return _fetch_and_store(key, fetch, ttl_for, stale_ttl)
+
+    logger.debug("Cache miss for %s.", key)
+    _count(key, 'miss')
+    return _single_flight(key, load)
+
+
+def _revalidate_in_background(key: str, fetch, ttl_for, stale_ttl: int):
+    with _flights_lock:
+        if key in _flights:
+            return  # A refresh is already running for this key.
+
+    def refresh():
+        try:
+            with rate_limit.background():  # The caller already has a value; dashboard requests go first.
+                _single_flight(key, lambda: _fetch_and_store(key, fetch, ttl_for, stale_ttl))
+        except Exception as e:
+            logger.error("Background refresh failed for %s: %s", key, e)
+
+    concurrency.submit(refresh)
+
+
+# Async variants, for the async service clients. Coalescing is per event loop:
+# {(loop id, key): Future}. Background revalidation tasks are kept referenced until done.
+_async_flights = {}
+_background_tasks = set()
+
+
+class FlightCancelled(Exception):
+    """Raised to callers waiting on a coalesced fetch whose leading caller was cancelled."""
+
+
+async def _async_single_flight(key: str, afn):
+    loop = asyncio.get_running_loop()
+    flight_key = (id(loop), key)
+    future = _async_flights.get(flight_key)
+    if future is not None:
+        return await asyncio.shield(future)
+    future = _async_flights[flight_key] = loop.create_future()
+    try:
+        result = await afn()
+        future.set_result(result)
+        return result
+    except BaseException as e:  # Includes cancellation at the page deadline.
+        if not isinstance(e, Exception):
+            # Followers aren't cancelled with the leader; give them an error rather than a future that never resolves.
+            e = FlightCancelled(f"Fetch for {key} was cancelled.")
+        future.set_exception(e)
+        future.exception()  # Mark retrieved so asyncio doesn't warn when nobody else was waiting.
+        raise
+    finally:
+        _async_flights.pop(flight_key, None)
+
+
+async def _afetch_and_store(key: str, afetch, ttl_for, stale_ttl: int):
+    value = await afetch()
+    made = _make_entry(key, value, ttl_for, stale_ttl)
+    if made is not None:
+        await cache.aset(key, made[0], timeout=made[1])
+        _remember(key, made[0])
+    else:
+        local.delete(key)
+    return value
+
+
+async def _arevalidate(key: str, afetch, ttl_for, stale_ttl: int):
+    try:
+        with rate_limit.background():
+            await _async_single_flight(key, lambda: _afetch_and_store(key, afetch, ttl_for, stale_ttl))
+    except Exception as e:
+        logger.error("Background refresh failed for %s: %s", key, e)
+
+
+async def aget_or_fetch(key: str, afetch, ttl_for, stale_ttl: int = 0, force: bool = False):
+    """Async version of get_or_fetch(); `afetch` is a coroutine function."""
+    if force:
+        return await _async_single_flight(key, lambda: _afetch_and_store(key, afetch, ttl_for, stale_ttl))
+
+    entry, tier = local.get(key), 'local'
+    if entry is None or time.time() >= entry['fresh_until']:
+        entry, tier = await cache.aget(key), 'shared'
+        _remember(key, entry)
+    if entry is not None:
+        if time.time() < entry['fresh_until']:
+            logger.debug("Cache hit for %s (%s).", key, tier)
+            _count(key, 'hit', tier)
+            return entry['value']
+        if not entry['negative']:
+            logger.debug("Serving stale value for %s while revalidating.", key)
+            _count(key, 'stale')
+            if (id(asyncio.get_running_loop()), key) not in _async_flights:
+                task = asyncio.ensure_future(_arevalidate(key, afetch, ttl_for, stale_ttl))
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
+            return entry['value']
+
+    async def load():
+        entry = local.get(key) or await cache.aget(key)
+        if entry is not None and time.time() < entry['fresh_until']:
+            return entry['value']
+        return await _afetch_and_store(key, afetch, ttl_for, stale_ttl)
+
+    logger.debug("Cache miss for %s.", key)
+    _count(key, 'miss')
+    return await _async_single_flight(key, load)
@@ -0,0 +1,81 @@
+# smart_advisor_project/advisor_app/services/calendar_store.py
+
+import datetime
+from django.utils import timezone
+import logging
+
+from ..models import CalendarEventCache
+
+logger = logging.getLogger(__name__)
+
+# Number of upcoming events shown on the dashboard.
+DISPLAY_LIMIT = 10
+
+
+def load(user_profile) -> CalendarEventCache:
+    """Returns the user's event store, or an unsaved empty one."""
+    try:
+        return user_profile.calendar_cache
+    except CalendarEventCache.DoesNotExist:
+        return CalendarEventCache(profile=user_profile)
+
+
+def sync_arguments(store: CalendarEventCache) -> dict:
+    """
+    Keyword arguments for google_calendar_service.sync_calendar_events:
+    the stored sync token, or nothing (a full sync) when the store needs one.
+    """
+    if store.needs_full_sync():
+        return {}
+    return {'sync_token': store.sync_token}
+
+
+def apply_sync_result(store: CalendarEventCache, result: dict):
+    """Merges a successful sync result into the store and saves it."""
+    if result['full_sync']:
+        # Also covers the 410 fallback, where the caller asked for an incremental sync.
+        events_by_id = {}
+        store.window_start, store.window_end = result['window']
+    else:
+        events_by_id = {event['id']: event for event in store.events}
+
+    for event in result['items']:
+        if event.get('status') == 'cancelled':
+            events_by_id.pop(event.get('id'), None)
+        else:
+            events_by_id[event['id']] = event
+
+    # Keep only events that are still relevant to the cached window.
+    now = timezone.now()
+    kept = [
+        event for event in events_by_id.values()
+        if _event_end(event) > now and _event_start(event) < store.window_end
+    ]
+    kept.sort(key=_event_start)
+    store.events = kept
+    store.sync_token = result.get('next_sync_token')
+    store.synced_at = now
+    store.save()
+    logger.debug("Calendar store for profile %s now holds %s events.", store.profile_id, len(kept))
+
+
+def upcoming_events(store: CalendarEventCache, limit: int = DISPLAY_LIMIT) -> list:
+    now = timezone.now()
+    return [event for event in store.events if _event_end(event) > now][:limit]
+
+
+def _parse_event_time(value: dict) -> datetime.datetime:
+    if value.get('dateTime'):
+        return datetime.datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+    if value.get('date'):
+        # All-day events carry only a date; treat them as starting at UTC midnight.
+        return datetime.datetime.fromisoformat(value['date']).replace(tzinfo=datetime.timezone.utc)
+    return timezone.now()
+
+
+def _event_start(event: dict) -> datetime.datetime:
+    return _parse_event_time(event.get('start', {}))
+
+
+def _event_end(event: dict) -> datetime.datetime:
+    return _parse_event_time(event.get('end') or event.get('start', {}))
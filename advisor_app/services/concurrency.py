@@ -0,0 +1,63 @@
+# smart_advisor_project/advisor_app/services/concurrency.py
+
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Returns the process-wide, bounded executor used for upstream fetches.
+    Created lazily so management commands that never fetch don't spawn threads.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.ADVISOR_FETCH_MAX_WORKERS,
+                    thread_name_prefix='advisor-fetch',
+                )
+    return _executor
+
+
+def submit(fn, *args, **kwargs):
+    """
+    Schedules fn(*args, **kwargs) on the shared executor and returns its Future.
+    The caller's context variables (e.g. the request's metrics timings) are carried over.
+    """
+    return get_executor().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def gather(pending: dict, deadline: float) -> dict:
+    """
+    Waits for a {name: Future} mapping until the monotonic `deadline`.
+    Returns {name: result} for every future that finished successfully in time.
+    Futures that are still running or that raised are left out of the result,
+    so callers can render an "unavailable" state for just those widgets.
+    """
+    if not pending:
+        return {}
+    timeout = max(0.0, deadline - time.monotonic())
+    done, not_done = wait(pending.values(), timeout=timeout)
+
+    results = {}
+    for name, future in pending.items():
+        if future in not_done:
+            future.cancel()  # Only helps if it hasn't started; a running fetch finishes in the background.
+            logger.warning("Fetch '%s' missed the page deadline and was skipped.", name)
+            continue
+        error = future.exception()
+        if error is not None:
+            logger.error("Fetch '%s' raised an unexpected error: %s", name, error, exc_info=error)
+            continue
+        results[name] = future.result()
+    return results
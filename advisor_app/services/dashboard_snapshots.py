@@ -0,0 +1,138 @@
+# smart_advisor_project/advisor_app/services/dashboard_snapshots.py
+"""
+The data home_view shows, for many users at once, as plain dicts (for the
+notifications pipeline and reports; see the export_dashboard_snapshots command).
+
+Users are processed DASHBOARD_SNAPSHOT_BATCH_SIZE at a time: one query loads a
+batch's profiles with their credentials and calendar stores, weather and
+Eventbrite are fetched once per distinct location (grid cell or normalized text)
+in the batch, and calendar syncs run on a bounded thread pool. Upstream calls run
+at background priority, behind dashboard requests in the shared rate limits.
+"""
+
+import contextvars
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.utils import timezone
+import logging
+
+from ..models import UserProfile
+from . import caching, calendar_store, eventbrite_service, geo, google_calendar_service, rate_limit, weather_service
+
+logger = logging.getLogger(__name__)
+
+
+def build_dashboard_snapshots(user_ids, max_workers: int = None, batch_size: int = None):
+    """
+    Yields one snapshot per user ID, in the order given:
+    {"user_id", "username", "location", "generated_at", "weather", "events", "calendar"}.
+    `user_ids` may be any iterable (e.g. a queryset iterator); it is consumed a
+    batch at a time. Unknown IDs yield {"user_id": id, "error": "..."}.
+    """
+    max_workers = max_workers or settings.DASHBOARD_SNAPSHOT_WORKERS
+    batch_size = batch_size or settings.DASHBOARD_SNAPSHOT_BATCH_SIZE
+    user_ids = iter(user_ids)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='advisor-snapshot') as executor:
+        while True:
+            batch = list(itertools.islice(user_ids, batch_size))
+            if not batch:
+                return
+            # Set per batch rather than around the loop, so the priority doesn't leak into the consumer between yields.
+            with rate_limit.background():
+                snapshots = _build_batch(batch, executor, max_workers)
+            yield from snapshots
+
+
+def _submit(executor, fn, *args, **kwargs):
+    # Pool threads don't inherit the caller's context (its rate-limit priority), so pass a copy.
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def _build_batch(user_ids: list, executor, max_workers: int) -> list:
+    profiles = {
+        profile.user_id: profile
+        for profile in UserProfile.objects.filter(user_id__in=user_ids).select_related('user', 'google_credential', 'calendar_cache')
+    }
+
+    # Calendar syncs are the slowest calls, so they start first and run while weather and events are fetched.
+    stores, syncs = {}, {}
+    for user_id, profile in profiles.items():
+        credentials = profile.get_google_credentials()
+        if credentials is None:
+            continue
+        store = stores[user_id] = calendar_store.load(profile)
+        if not store.is_fresh(settings.GOOGLE_CALENDAR_SYNC_TTL):
+            syncs[user_id] = _submit(executor, google_calendar_service.sync_calendar_events,
+                                     credentials, **calendar_store.sync_arguments(store))
+
+    targets = {user_id: _location_target(profile) for user_id, profile in profiles.items() if profile.location}
+    weather = weather_service.get_weather_batch(
+        list({target['weather'] for target in targets.values()}), max_workers=max_workers)
+    distinct_events = {target['events_key']: target['events'] for target in targets.values()}
+    event_futures = {key: _submit(executor, eventbrite_service.get_eventbrite_events, **arguments)
+                     for key, arguments in distinct_events.items()}
+    events = {key: future.result() for key, future in event_futures.items()}
+
+    generated_at = timezone.now().isoformat()
+    snapshots = []
+    for user_id in user_ids:
+        profile = profiles.get(user_id)
+        if profile is None:
+            snapshots.append({'user_id': user_id, 'error': "No profile for this user."})
+            continue
+        target = targets.get(user_id)
+        snapshots.append({
+            'user_id': user_id,
+            'username': profile.user.username,
+            'location': profile.location,
+            'generated_at': generated_at,
+            'weather': weather[target['weather']] if target else None,
+            'events': _events_snapshot(events[target['events_key']]) if target else None,
+            'calendar': _calendar_snapshot(profile, stores.get(user_id), syncs.get(user_id)),
+        })
+    return snapshots
+
+
+def _location_target(profile) -> dict:
+    """
+    How the services are called for a profile, with the key that groups users sharing a result:
+    the grid cell for geocoded profiles, the normalized spelling for the rest. No geocoding
+    happens here; profiles not geocoded yet use their text location, as the dashboard does.
+    """
+    coordinates = profile.coordinates
+    if coordinates is not None:
+        return {'weather': coordinates, 'events_key': ('cell', geo.snap(*coordinates)[0]),
+                'events': {'latitude': coordinates[0], 'longitude': coordinates[1]}}
+    return {'weather': profile.location, 'events_key': ('text', caching.normalize_location(profile.location)),
+            'events': {'location_address': profile.location}}
+
+
+def _events_snapshot(result: dict) -> dict:
+    if result.get('error'):
+        return result
+    return {'events': [event._asdict() for event in result['events']]}
+
+
+def _calendar_snapshot(profile, store, sync) -> dict:
+    """Applies a finished sync to the user's store (as home_view does) and returns the upcoming events."""
+    if store is None:
+        return {'connected': False, 'events': None}
+    if sync is None:
+        return {'connected': True, 'events': calendar_store.upcoming_events(store)}
+    try:
+        result = sync.result()
+    except Exception as e:
+        logger.error("Calendar sync raised for %s: %s", profile.user.username, e, exc_info=e)
+        result = dict(google_calendar_service.CALENDAR_UNAVAILABLE)
+    if result.get('refreshed_credentials'):
+        profile.set_google_credentials(result['refreshed_credentials'])
+    if not result.get('error'):
+        calendar_store.apply_sync_result(store, result)
+        return {'connected': True, 'events': calendar_store.upcoming_events(store)}
+    logger.warning("Calendar sync failed for %s: %s", profile.user.username, result['error'])
+    snapshot = {'connected': True, 'error': result['error'], 'needs_reauth': bool(result.get('needs_reauth')), 'events': None}
+    if store.synced_at and not result.get('needs_reauth'):
+        snapshot['events'] = calendar_store.upcoming_events(store)  # Last known events, as the dashboard serves them.
+        snapshot['synced_at'] = store.synced_at.isoformat()
+    return snapshot
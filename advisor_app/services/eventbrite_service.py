@@ -1,77 +1,232 @@
 # smart_advisor_project/advisor_app/services/eventbrite_service.py
 
+import datetime
 import requests
+from typing import NamedTuple, Optional
 from django.conf import settings
 import logging
 
+from . import caching, geo, http_sessions, resilience
+
 logger = logging.getLogger(__name__)
 
-def get_eventbrite_events(location_address: str = None, latitude: float = None, longitude: float = None):
+# Bump when the cached result shape changes, so old entries in a shared cache are ignored.
+CACHE_FORMAT = 2
+
+# Upper bound for the adaptive per-page timeout (the old fixed timeout).
+EVENTBRITE_MAX_TIMEOUT = 15
+EVENTBRITE_UNAVAILABLE = {"error": "Eventbrite service is temporarily unavailable."}
+
+class EventSummary(NamedTuple):
+    """The few fields the dashboard shows; the raw Eventbrite event is dropped after parsing."""
+    name: str
+    start: Optional[datetime.datetime]
+    url: str
+    venue_name: Optional[str]
+    venue_address: Optional[str]
+
+def _summarize(event: dict) -> EventSummary:
+    start_local = (event.get('start') or {}).get('local')
+    try:
+        start = datetime.datetime.fromisoformat(start_local) if start_local else None
+    except ValueError:
+        start = None
+    venue = event.get('venue') or {}  # Only present when the 'venue' expansion is requested.
+    return EventSummary(
+        name=(event.get('name') or {}).get('text') or "Unnamed Event",
+        start=start,
+        url=event.get('url', ''),
+        venue_name=venue.get('name'),
+        venue_address=(venue.get('address') or {}).get('localized_address_display'),
+    )
+
+def _parse_page(data: dict):
+    """Returns (summaries, has_more_items) for one page of search results."""
+    summaries = [_summarize(event) for event in data.get('events', [])]
+    has_more = bool((data.get('pagination') or {}).get('has_more_items'))
+    return summaries, has_more
+
+def get_eventbrite_events(location_address: str = None, latitude: float = None, longitude: float = None, force_refresh: bool = False):
+    """
+    Fetches Eventbrite events near an address or coordinates, through the shared cache.
+    Coordinates are snapped to the centre of their geo.snap() grid cell, so nearby
+    users share one search and one cache entry.
+    force_refresh bypasses a cached value and stores a fresh one (used by prewarming).
+    Returns {"events": [EventSummary, ...]} (at most EVENTBRITE_MAX_EVENTS) or {"error": "message"}.
+    """
     api_key = settings.EVENTBRITE_API_KEY
     if not api_key:
         logger.error("Eventbrite API key is not configured in settings.py.")
         return {"error": "Eventbrite service is not configured (API key missing)."}
 
-    if not location_address and not (latitude and longitude):
+    if not location_address and (latitude is None or longitude is None):
         logger.warning("get_eventbrite_events called with no location information.")
         return {"error": "Location (address or lat/lon) must be provided for Eventbrite."}
+    if not location_address:
+        _, latitude, longitude = geo.snap(latitude, longitude)
+
+    return caching.get_or_fetch(
+        _cache_key(location_address, latitude, longitude),
+        lambda: resilience.call('eventbrite', EVENTBRITE_MAX_TIMEOUT,
+                                lambda timeout: _fetch_eventbrite_events(location_address, latitude, longitude, timeout),
+                                EVENTBRITE_UNAVAILABLE),
+        ttl_for=_cache_ttl_for,
+        stale_ttl=settings.EVENTBRITE_CACHE_STALE_TTL,
+        force=force_refresh,
+    )
+
+def get_cached_events(location_address: str = None, latitude: float = None, longitude: float = None):
+    """The fresh cached result get_eventbrite_events would return, or None; never calls the API."""
+    if not settings.EVENTBRITE_API_KEY or (not location_address and (latitude is None or longitude is None)):
+        return None
+    return caching.get_fresh(_cache_key(location_address, latitude, longitude))
+
+def _cache_key(location_address: str, latitude: float, longitude: float) -> str:
+    if location_address:
+        return caching.make_key('eventbrite', 'address', caching.normalize_location(location_address), version=CACHE_FORMAT)
+    cell, _, _ = geo.snap(latitude, longitude)
+    return caching.make_key('eventbrite', 'cell', cell, version=CACHE_FORMAT)
+
+def forget_errors(location_address: str = None, latitude: float = None, longitude: float = None):
+    """Drops a cached error for this location, so the next search retries upstream."""
+    caching.invalidate(_cache_key(location_address, latitude, longitude), errors_only=True)
+
+def _cache_ttl_for(result: dict):
+    """Events use the normal TTL, location errors a short one, anything else isn't cached."""
+    if not result.get('error'):
+        return settings.EVENTBRITE_CACHE_TTL
+    if result.get('location_error'):
+        return settings.EVENTBRITE_NEGATIVE_CACHE_TTL
+    return None
+
+def _search_url() -> str:
+    return f"{settings.EVENTBRITE_API_URL}/events/search/"
 
-    base_url = "https://www.eventbriteapi.com/v3/events/search/"
+def _build_request(location_address: str, latitude: float, longitude: float):
+    """Returns (headers, params, description of the searched location)."""
+    api_key = settings.EVENTBRITE_API_KEY
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Accept": "application/json",
     }
     params = {
         'sort_by': 'date',
-        'expand': 'venue,organizer,ticket_availability,format'
+        'page_size': settings.EVENTBRITE_PAGE_SIZE,
     }
+    if settings.EVENTBRITE_EXPAND:
+        params['expand'] = settings.EVENTBRITE_EXPAND
 
     current_search_location = ""
     if location_address:
         params['location.address'] = location_address
         current_search_location = location_address
-        logger.debug(f"Requesting Eventbrite events for address: {location_address} using API key ending with ...{api_key[-4:] if api_key else 'N/A'}")
-    elif latitude and longitude:
+        logger.debug("Requesting Eventbrite events for address: %s using API key ending with ...%s", location_address, api_key[-4:] if api_key else 'N/A')
+    elif latitude is not None and longitude is not None:
         params['location.latitude'] = str(latitude)
         params['location.longitude'] = str(longitude)
         params['location.within'] = '25km' # Default radius
         current_search_location = f"lat/lon: {latitude},{longitude}"
-        logger.debug(f"Requesting Eventbrite events for {current_search_location} using API key ending with ...{api_key[-4:] if api_key else 'N/A'}")
+        logger.debug("Requesting Eventbrite events for %s using API key ending with ...%s", current_search_location, api_key[-4:] if api_key else 'N/A')
+    return headers, params, current_search_location
 
+def _error_for_response(response, current_search_location: str) -> dict:
+    """Maps a 4XX/5XX Eventbrite response (requests or httpx) to an error dict."""
+    error_content = response.text
+    status_code = response.status_code
+    if resilience.is_transient_status(status_code):
+        logger.error("Eventbrite HTTP error %s for location: %s.", status_code, current_search_location)
+        return {"error": f"Eventbrite service error (HTTP {status_code}).", "transient": True}
+    logger.error("Eventbrite HTTP error %s for location: %s. Response: %s", status_code, current_search_location, error_content[:500])
     try:
-        response = requests.get(base_url, headers=headers, params=params, timeout=15)
-        response.raise_for_status() # Raises HTTPError for bad responses (4XX or 5XX)
-        data = response.json()
-        events = data.get('events', [])
-        logger.info(f"Successfully fetched {len(events)} Eventbrite events for location: {current_search_location}.")
+        error_json = response.json()
+        error_desc = error_json.get('error_description', error_json.get('error', 'Unknown Eventbrite API error'))
+
+        # Specific handling for the "path does not exist" 404 error from Eventbrite
+        if error_json.get('error') == "NOT_FOUND" and "path you requested does not exist" in error_desc.lower():
+            # This is the error you are seeing. It means Eventbrite doesn't like the location.address value.
+            return {"error": "Eventbrite could not find events for the specified location. Please try a more specific city or area. (Hint: country names like 'India' might be too broad for Eventbrite's address search).", "location_error": True}
+        elif "LOCATION_INVALID" in error_json.get('error', ''):
+             return {"error": "Invalid location format for Eventbrite. Please try a specific city name. (API: Location Invalid)", "location_error": True}
+
+        return {"error": f"Eventbrite API Error: {error_desc}"}
+    except ValueError: # If response from Eventbrite isn't valid JSON
+        if status_code == 404:
+             # Generic 404 if not the specific "path does not exist" message
+             return {"error": "Eventbrite could not find information for the specified location (404). Please try being more specific.", "location_error": True}
+        return {"error": f"Eventbrite service error (HTTP {status_code}). Response was not valid JSON."}
+
+def _fetch_eventbrite_events(location_address: str, latitude: float, longitude: float, timeout: float = EVENTBRITE_MAX_TIMEOUT):
+    """Performs the actual Eventbrite search. Callers should go through get_eventbrite_events."""
+    headers, params, current_search_location = _build_request(location_address, latitude, longitude)
+    try:
+        events = []
+        for page in range(1, settings.EVENTBRITE_MAX_PAGES + 1):
+            params['page'] = page
+            response = http_sessions.get_session('eventbrite').get(_search_url(), headers=headers, params=params, timeout=timeout)
+            response.raise_for_status() # Raises HTTPError for bad responses (4XX or 5XX)
+            summaries, has_more = _parse_page(response.json())  # The raw page is discarded here.
+            events.extend(summaries)
+            if not has_more or len(events) >= settings.EVENTBRITE_MAX_EVENTS:
+                break
+        events = events[:settings.EVENTBRITE_MAX_EVENTS]
+        logger.info("Successfully fetched %s Eventbrite events for location: %s.", len(events), current_search_location)
         return {"events": events}
     except requests.exceptions.Timeout:
-        logger.error(f"Request to Eventbrite API timed out for location: {current_search_location}.")
-        return {"error": "Eventbrite service request timed out."}
+        logger.error("Request to Eventbrite API timed out for location: %s.", current_search_location)
+        return {"error": "Eventbrite service request timed out.", "transient": True}
     except requests.exceptions.HTTPError as http_err:
-        error_content = http_err.response.text
-        status_code = http_err.response.status_code
-        logger.error(f"Eventbrite HTTP error {status_code} for location: {current_search_location}: {http_err}. Response: {error_content[:500]}")
-        try:
-            error_json = http_err.response.json()
-            error_desc = error_json.get('error_description', error_json.get('error', 'Unknown Eventbrite API error'))
-            
-            # Specific handling for the "path does not exist" 404 error from Eventbrite
-            if error_json.get('error') == "NOT_FOUND" and "path you requested does not exist" in error_desc.lower():
-                # This is the error you are seeing. It means Eventbrite doesn't like the location.address value.
-                return {"error": "Eventbrite could not find events for the specified location. Please try a more specific city or area. (Hint: country names like 'India' might be too broad for Eventbrite's address search)."}
-            elif "LOCATION_INVALID" in error_json.get('error', ''):
-                 return {"error": "Invalid location format for Eventbrite. Please try a specific city name. (API: Location Invalid)"}
-            
-            return {"error": f"Eventbrite API Error: {error_desc}"}
-        except ValueError: # If response from Eventbrite isn't valid JSON
-            if status_code == 404:
-                 # Generic 404 if not the specific "path does not exist" message
-                 return {"error": "Eventbrite could not find information for the specified location (404). Please try being more specific."}
-            return {"error": f"Eventbrite service error (HTTP {status_code}). Response was not valid JSON."}
+        return _error_for_response(http_err.response, current_search_location)
     except requests.exceptions.RequestException as req_err:
-        logger.error(f"Eventbrite request exception for location: {current_search_location}: {req_err}")
-        return {"error": "Could not connect to Eventbrite service."}
+        logger.error("Eventbrite request exception for location: %s: %s", current_search_location, req_err)
+        return {"error": "Could not connect to Eventbrite service.", "transient": True}
     except ValueError as json_err: # Includes JSONDecodeError if response.json() fails
-        logger.error(f"Eventbrite JSON decode error for location: {current_search_location}: {json_err}")
-        return {"error": "Invalid response format from Eventbrite service."}
\ No newline at end of file
+        logger.error("Eventbrite JSON decode error for location: %s: %s", current_search_location, json_err)
+        return {"error": "Invalid response format from Eventbrite service."}
+
+async def get_eventbrite_events_async(location_address: str = None, latitude: float = None, longitude: float = None, force_refresh: bool = False):
+    """Async version of get_eventbrite_events, sharing its cache entries and pooled async client."""
+    if not settings.EVENTBRITE_API_KEY:
+        logger.error("Eventbrite API key is not configured in settings.py.")
+        return {"error": "Eventbrite service is not configured (API key missing)."}
+
+    if not location_address and (latitude is None or longitude is None):
+        logger.warning("get_eventbrite_events_async called with no location information.")
+        return {"error": "Location (address or lat/lon) must be provided for Eventbrite."}
+    if not location_address:
+        _, latitude, longitude = geo.snap(latitude, longitude)
+
+    return await caching.aget_or_fetch(
+        _cache_key(location_address, latitude, longitude),
+        lambda: resilience.acall('eventbrite', EVENTBRITE_MAX_TIMEOUT,
+                                 lambda timeout: _fetch_eventbrite_events_async(location_address, latitude, longitude, timeout),
+                                 EVENTBRITE_UNAVAILABLE),
+        ttl_for=_cache_ttl_for,
+        stale_ttl=settings.EVENTBRITE_CACHE_STALE_TTL,
+        force=force_refresh,
+    )
+
+async def _fetch_eventbrite_events_async(location_address: str, latitude: float, longitude: float, timeout: float = EVENTBRITE_MAX_TIMEOUT):
+    headers, params, current_search_location = _build_request(location_address, latitude, longitude)
+    try:
+        events = []
+        for page in range(1, settings.EVENTBRITE_MAX_PAGES + 1):
+            params['page'] = page
+            response = await http_sessions.async_request('eventbrite', 'GET', _search_url(), headers=headers, params=params, timeout=timeout)
+            if response.status_code >= 400:
+                return _error_for_response(response, current_search_location)
+            summaries, has_more = _parse_page(response.json())
+            events.extend(summaries)
+            if not has_more or len(events) >= settings.EVENTBRITE_MAX_EVENTS:
+                break
+        events = events[:settings.EVENTBRITE_MAX_EVENTS]
+        logger.info("Successfully fetched %s Eventbrite events for location: %s.", len(events), current_search_location)
+        return {"events": events}
+    except http_sessions.ASYNC_TIMEOUT_ERRORS:
+        logger.error("Request to Eventbrite API timed out for location: %s.", current_search_location)
+        return {"error": "Eventbrite service request timed out.", "transient": True}
+    except http_sessions.ASYNC_TRANSPORT_ERRORS as req_err:
+        logger.error("Eventbrite request exception for location: %s: %s", current_search_location, req_err)
+        return {"error": "Could not connect to Eventbrite service.", "transient": True}
+    except ValueError as json_err:
+        logger.error("Eventbrite JSON decode error for location: %s: %s", current_search_location, json_err)
+        return {"error": "Invalid response format from Eventbrite service."}
@@ -0,0 +1,179 @@
+# smart_advisor_project/advisor_app/services/geo.py
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+import logging
+
+from . import caching, http_sessions, resilience
+from ..models import GeocodedLocation, UserProfile
+
+logger = logging.getLogger(__name__)
+
+GEOCODING_MAX_TIMEOUT = 10
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash(latitude: float, longitude: float, precision: int) -> str:
+    """Standard base-32 geohash of a point; longer hashes are smaller cells."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        axis, point = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (axis[0] + axis[1]) / 2
+        value <<= 1
+        if point >= middle:
+            value |= 1
+            axis[0] = middle
+        else:
+            axis[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_center(cell: str):
+    """(latitude, longitude) of the centre of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in cell:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            axis = lon_range if even else lat_range
+            middle = (axis[0] + axis[1]) / 2
+            if value >> shift & 1:
+                axis[0] = middle
+            else:
+                axis[1] = middle
+            even = not even
+    return round((lat_range[0] + lat_range[1]) / 2, 5), round((lon_range[0] + lon_range[1]) / 2, 5)
+
+
+def snap(latitude: float, longitude: float):
+    """
+    Snaps a point to its GEO_CELL_PRECISION grid cell. Returns (cell, latitude, longitude)
+    of the cell centre; callers key caches on the cell and query upstreams with the centre,
+    so everyone in one cell shares a single cached result.
+    """
+    cell = geohash(latitude, longitude, settings.GEO_CELL_PRECISION)
+    return (cell, *cell_center(cell))
+
+
+def geocode(location: str):
+    """
+    Returns (latitude, longitude) for a free-text location, or None if it can't be placed.
+    Results live in GeocodedLocation, so each spelling is looked up upstream once;
+    misses are retried after GEOCODE_NOT_FOUND_TTL seconds, transient errors on the next call.
+    """
+    if not location:
+        return None
+    query = caching.normalize_location(location)
+    stored = GeocodedLocation.objects.filter(query=query).first()
+    if stored is not None:
+        if stored.found:
+            return stored.latitude, stored.longitude
+        if (timezone.now() - stored.geocoded_at).total_seconds() < settings.GEOCODE_NOT_FOUND_TTL:
+            return None
+    if not settings.OPENWEATHERMAP_API_KEY:
+        logger.debug("OpenWeatherMap API key is not configured; skipping geocoding.")
+        return None
+
+    result = resilience.call('openweathermap_geo', GEOCODING_MAX_TIMEOUT,
+                             lambda timeout: _fetch_geocode(location, timeout),
+                             {"error": "Geocoding service is temporarily unavailable."})
+    if result.get('error'):
+        return None
+    defaults = {'found': result['found'], 'latitude': result.get('lat'), 'longitude': result.get('lon'),
+                'name': result.get('name', ''), 'country': result.get('country', ''), 'geocoded_at': timezone.now()}
+    GeocodedLocation.objects.update_or_create(query=query, defaults=defaults)
+    if not result['found']:
+        logger.info("Geocoding found no match for '%s'.", location)
+        return None
+    return result['lat'], result['lon']
+
+
+def _fetch_geocode(location: str, timeout: float = GEOCODING_MAX_TIMEOUT) -> dict:
+    """One OpenWeatherMap direct-geocoding lookup. Returns the best match, {'found': False} or an error dict."""
+    params = {'q': location, 'limit': 1, 'appid': settings.OPENWEATHERMAP_API_KEY}
+    try:
+        response = http_sessions.get_session('openweathermap').get(
+            f"{settings.OPENWEATHERMAP_GEOCODING_URL}/direct", params=params, timeout=timeout)
+        response.raise_for_status()
+        matches = response.json()
+    except requests.exceptions.Timeout:
+        logger.error("Timeout when geocoding %s.", location)
+        return {"error": "Geocoding request timed out.", "transient": True}
+    except requests.exceptions.HTTPError as http_err:
+        status_code = http_err.response.status_code
+        logger.error("HTTP error %s when geocoding %s.", status_code, location)
+        return {"error": f"Geocoding service error (HTTP {status_code}).",
+                "transient": resilience.is_transient_status(status_code)}
+    except requests.exceptions.RequestException as req_err:
+        logger.error("Request exception when geocoding %s: %s", location, req_err)
+        return {"error": "Could not connect to geocoding service.", "transient": True}
+    except ValueError as json_err:
+        logger.error("JSON decode error for %s geocoding response: %s", location, json_err)
+        return {"error": "Invalid response from geocoding service."}
+    if not matches:
+        return {'found': False}
+    match = matches[0]
+    return {'found': True, 'lat': match['lat'], 'lon': match['lon'],
+            'name': match.get('name', ''), 'country': match.get('country', '')}
+
+
+def locate_profile(user_profile):
+    """
+    Returns the profile's coordinates, geocoding its location (and saving the result)
+    the first time. None when there's no location or it couldn't be geocoded.
+    """
+    coordinates = user_profile.coordinates
+    if coordinates is not None or not user_profile.location:
+        return coordinates
+    coordinates = geocode(user_profile.location)
+    if coordinates is not None:
+        user_profile.latitude, user_profile.longitude = coordinates
+        user_profile.save(update_fields=['latitude', 'longitude'])
+    return coordinates
+
+
+def locate_unplaced_profiles() -> dict:
+    """
+    Geocodes profiles that have a location but no coordinates (saved before geocoding
+    existed, or whose lookup failed transiently), one geocode() per distinct spelling.
+    Run from prewarm_advisor, since the dashboard only reads stored coordinates.
+    Returns {'located': profiles, 'unplaced': profiles}.
+    """
+    pending = (
+        UserProfile.objects
+        .filter(latitude__isnull=True)
+        .exclude(location__isnull=True)
+        .exclude(location='')
+        .values_list('pk', 'location')
+    )
+    by_query = {}
+    for pk, location in pending:
+        by_query.setdefault(caching.normalize_location(location), (location, []))[1].append(pk)
+    stats = {'located': 0, 'unplaced': 0}
+    for location, pks in by_query.values():
+        coordinates = geocode(location)
+        if coordinates is None:
+            stats['unplaced'] += len(pks)
+            continue
+        UserProfile.objects.filter(pk__in=pks, latitude__isnull=True).update(latitude=coordinates[0], longitude=coordinates[1])
+        stats['located'] += len(pks)
+    return stats
+
+
+def location_arguments(user_profile) -> dict:
+    """
+    latitude/longitude keyword arguments for the weather and Eventbrite services, or {}.
+    Only stored coordinates are used: geocoding can take GEOCODING_MAX_TIMEOUT, so it happens
+    when the location is saved or in prewarm_advisor, never on the dashboard.
+    """
+    coordinates = user_profile.coordinates
+    if coordinates is None:
+        return {}
+    return {'latitude': coordinates[0], 'longitude': coordinates[1]}
@@ -2,14 +2,29 @@
 
 from django.conf import settings
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build, HttpError
+from googleapiclient.discovery import build_from_document, HttpError
+from googleapiclient.discovery_cache import get_static_doc
+from google.auth.exceptions import RefreshError
 from google.auth.transport.requests import Request as GoogleAuthRequest
 from google.oauth2.credentials import Credentials # Ensure this is the Credentials object you're using
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
 import datetime
+import json
 import logging
+import threading
+from asgiref.sync import sync_to_async
+
+from . import http_sessions, metrics, resilience
 
 logger = logging.getLogger(__name__)
 
+_events_resource = None
+_events_resource_lock = threading.Lock()
+
+
+CALENDAR_UNAVAILABLE = {"error": "Google Calendar is temporarily unavailable.", "needs_reauth": False}
+
 def get_google_auth_flow():
     """
     Initializes and returns the Google OAuth flow object.
@@ -39,70 +54,241 @@ def get_google_auth_flow():
         )
         return flow
     except Exception as e:
-        logger.error(f"Error creating Google OAuth Flow: {e}")
+        logger.error("Error creating Google OAuth Flow: %s", e)
         raise ValueError(f"Could not initialize Google OAuth Flow: {e}")
 
 
-def get_calendar_events(credentials: Credentials):
+def get_events_resource():
+    """
+    Returns the process-wide Calendar v3 `events` resource.
+    It is built once from the discovery document that ships with
+    google-api-python-client and is not bound to any user; per-request
+    credentials are supplied through authorized_http() at execute time.
+    """
+    global _events_resource
+    if _events_resource is None:
+        with _events_resource_lock:
+            if _events_resource is None:
+                discovery_doc = json.loads(get_static_doc('calendar', 'v3'))
+                service = build_from_document(
+                    discovery_doc, http=httplib2.Http(),
+                    client_options={'api_endpoint': settings.GOOGLE_CALENDAR_API_URL.rstrip('/') + '/'},
+                )
+                _events_resource = service.events()
+                logger.info("Built shared Google Calendar resource from the static discovery document.")
+    return _events_resource
+
+
+def authorized_http(credentials: Credentials, timeout: float = None) -> AuthorizedHttp:
+    """Cheaply binds credentials to a fresh HTTP transport with a bounded timeout."""
+    return AuthorizedHttp(credentials, http=httplib2.Http(timeout=timeout or settings.GOOGLE_CALENDAR_TIMEOUT))
+
+
+def _refresh_if_needed(credentials: Credentials):
+    """
+    Refreshes expired credentials in place.
+    Returns (was_refreshed, error_dict_or_None).
+    """
+    if credentials.valid: # .valid property checks expiry and other validity aspects
+        return False, None
+    if credentials.expired and credentials.refresh_token:
+        try:
+            logger.info("Google token expired or invalid, attempting refresh.")
+            with metrics.timed('token_refresh'):
+                credentials.refresh(GoogleAuthRequest(session=http_sessions.get_session('google')))
+            logger.info("Google token refreshed successfully within the calendar service.")
+            return True, None
+        except RefreshError as e:
+            logger.error("Google rejected the token refresh: %s", e)
+            return False, {"error": "Your Google session has expired and could not be refreshed. Please connect again.",
+                           "needs_reauth": True, "revoked": True}
+        except Exception as e:
+            logger.error("Failed to refresh Google token within the calendar service: %s", e)
+            return False, {"error": f"Could not refresh Google token. Please re-authenticate. ({e})", "needs_reauth": True}
+    logger.warning("Google credentials invalid and no refresh token, or not expired but still invalid.")
+    return False, {"error": "Google credentials invalid. Please re-authenticate.", "needs_reauth": True}
+
+
+def _api_error(status: int, reason: str) -> dict:
+    if status == 401:
+        return {"error": "Google Calendar access denied (401). Please re-authenticate.", "needs_reauth": True}
+    return {"error": f"An error occurred with Google Calendar API: {reason}", "needs_reauth": False,
+            "transient": resilience.is_transient_status(status)}
+
+
+def _transport_error(e: Exception) -> dict:
+    """Timeouts and connection failures; these count against the circuit breaker."""
+    logger.error("Could not reach Google Calendar: %s", e)
+    return {"error": "Could not connect to Google Calendar.", "needs_reauth": False, "transient": True}
+
+
+def sync_calendar_events(credentials: Credentials, sync_token: str = None, time_min: datetime.datetime = None, time_max: datetime.datetime = None):
     """
-    Fetches upcoming events from Google Calendar using provided credentials.
-    Handles token refresh if necessary.
-    Returns a dictionary like {"events": [...], "refreshed_credentials": Credentials_object_if_refreshed_else_None}
-    or {"error": "message", "needs_reauth": True/False}.
+    Lists primary-calendar events for a local event store.
+    With a sync_token only the changes since that token are returned (including
+    cancelled events); otherwise a full listing of [time_min, time_max] is done.
+    A sync token the server no longer accepts (410 Gone) triggers a full sync.
+    The full-sync window defaults to now .. now + GOOGLE_CALENDAR_SYNC_WINDOW_DAYS.
+    Returns {"items": [...], "next_sync_token": str, "full_sync": bool,
+             "window": (time_min, time_max) or None, "refreshed_credentials": ...}
+    or {"error": "message", "needs_reauth": True/False}, with "revoked": True when
+    Google rejected the refresh token.
     """
     if not credentials:
-        logger.warning("get_calendar_events called with no credentials.")
+        logger.warning("sync_calendar_events called with no credentials.")
         return {"error": "Google credentials not provided.", "needs_reauth": True}
 
-    was_refreshed = False # Flag to track if a refresh occurred in this call
+    was_refreshed, error = _refresh_if_needed(credentials)
+    if error:
+        return error
+
+    return resilience.call(
+        'google_calendar', settings.GOOGLE_CALENDAR_TIMEOUT,
+        lambda timeout: _sync(authorized_http(credentials, timeout), sync_token, time_min, time_max,
+                              refreshed_credentials=credentials if was_refreshed else None),
+        CALENDAR_UNAVAILABLE,
+    )
 
-    if not credentials.valid: # .valid property checks expiry and other validity aspects
-        if credentials.expired and credentials.refresh_token:
-            try:
-                logger.info("Google token expired or invalid, attempting refresh.")
-                # Store token before refresh to compare later if needed, though not strictly necessary for this fix
-                # original_token = credentials.token 
-                credentials.refresh(GoogleAuthRequest())
-                was_refreshed = True # Mark that a refresh happened
-                logger.info("Google token refreshed successfully within get_calendar_events.")
-            except Exception as e: # Includes google.auth.exceptions.RefreshError
-                logger.error(f"Failed to refresh Google token within get_calendar_events: {e}")
-                return {"error": f"Could not refresh Google token. Please re-authenticate. ({e})", "needs_reauth": True}
-        else:
-            logger.warning("Google credentials invalid and no refresh token, or not expired but still invalid.")
-            return {"error": "Google credentials invalid. Please re-authenticate.", "needs_reauth": True}
 
+def _sync(http, sync_token, time_min, time_max, refreshed_credentials):
     try:
-        service = build('calendar', 'v3', credentials=credentials, cache_discovery=False)
-        now_utc = datetime.datetime.utcnow().isoformat() + 'Z'
+        if sync_token:
+            try:
+                items, next_sync_token = _list_all_pages(http, syncToken=sync_token)
+                logger.info("Incremental Google Calendar sync returned %s changes.", len(items))
+                full_sync = False
+            except HttpError as e:
+                if e.resp.status != 410:
+                    raise
+                logger.info("Google Calendar sync token expired (410). Falling back to a full sync.")
+                sync_token = None
+        window = None
+        if not sync_token:
+            time_min = time_min or datetime.datetime.now(datetime.timezone.utc)
+            time_max = time_max or time_min + datetime.timedelta(days=settings.GOOGLE_CALENDAR_SYNC_WINDOW_DAYS)
+            window = (time_min, time_max)
+            items, next_sync_token = _list_all_pages(
+                http,
+                timeMin=time_min.isoformat(),
+                timeMax=time_max.isoformat(),
+            )
+            logger.info("Full Google Calendar sync returned %s events.", len(items))
+            full_sync = True
+        return {
+            "items": items,
+            "next_sync_token": next_sync_token,
+            "full_sync": full_sync,
+            "window": window,
+            "refreshed_credentials": refreshed_credentials,
+        }
+    except HttpError as e:
+        logger.error("Google Calendar API HttpError during sync: %s - %s", e.status_code, e._get_reason())
+        return _api_error(e.resp.status, e._get_reason())
+    except (OSError, httplib2.HttpLib2Error) as e:  # socket timeouts, refused connections
+        return _transport_error(e)
+    except Exception as e:
+        logger.error("Unexpected error syncing Google Calendar events: %s", e, exc_info=True)
+        return {"error": f"An unexpected error occurred with Google Calendar: {e}", "needs_reauth": False}
 
-        logger.debug(f"Fetching Google Calendar events from: {now_utc}")
-        events_result = service.events().list(
+
+def _list_all_pages(http, **params):
+    """Follows nextPageToken until the final page, which carries nextSyncToken."""
+    items, page_token = [], None
+    while True:
+        result = get_events_resource().list(
             calendarId='primary',
-            timeMin=now_utc,
-            maxResults=10,
             singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-
-        events = events_result.get('items', [])
-        logger.info(f"Successfully fetched {len(events)} Google Calendar events.")
-        
-        # If a refresh occurred during this function call, return the updated credentials object
-        # The .valid property is the main check for usability.
+            maxResults=250,
+            pageToken=page_token,
+            **params
+        ).execute(http=http)
+        items.extend(result.get('items', []))
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            return items, result.get('nextSyncToken')
+
+
+class _AsyncCalendarError(Exception):
+    def __init__(self, status: int, reason: str):
+        super().__init__(f"{status} - {reason}")
+        self.status = status
+        self.reason = reason
+
+
+async def _alist_page(credentials: Credentials, timeout: float = None, **params) -> dict:
+    response = await http_sessions.async_request(
+        'google_calendar', 'GET', f"{settings.GOOGLE_CALENDAR_API_URL}/calendars/primary/events",  # REST; the discovery client is sync-only
+        params={name: value for name, value in params.items() if value is not None},
+        headers={'Authorization': f'Bearer {credentials.token}'},
+        timeout=timeout or settings.GOOGLE_CALENDAR_TIMEOUT,
+    )
+    if response.status_code >= 400:
+        try:
+            reason = response.json().get('error', {}).get('message', response.reason_phrase)
+        except ValueError:
+            reason = response.reason_phrase
+        raise _AsyncCalendarError(response.status_code, reason)
+    return response.json()
+
+
+async def _alist_all_pages(credentials: Credentials, timeout: float = None, **params):
+    items, page_token = [], None
+    while True:
+        result = await _alist_page(credentials, timeout, calendarId='primary', singleEvents=True, maxResults=250, pageToken=page_token, **params)
+        items.extend(result.get('items', []))
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            return items, result.get('nextSyncToken')
+
+
+async def sync_calendar_events_async(credentials: Credentials, sync_token: str = None, time_min: datetime.datetime = None, time_max: datetime.datetime = None):
+    """Async version of sync_calendar_events, with the same result shape and 410 fallback."""
+    if not credentials:
+        logger.warning("sync_calendar_events_async called with no credentials.")
+        return {"error": "Google credentials not provided.", "needs_reauth": True}
+
+    was_refreshed, error = await sync_to_async(_refresh_if_needed, thread_sensitive=False)(credentials)
+    if error:
+        return error
+    return await resilience.acall(
+        'google_calendar', settings.GOOGLE_CALENDAR_TIMEOUT,
+        lambda timeout: _async_sync(credentials, timeout, sync_token, time_min, time_max, was_refreshed),
+        CALENDAR_UNAVAILABLE,
+    )
+
+
+async def _async_sync(credentials, timeout, sync_token, time_min, time_max, was_refreshed):
+    try:
+        if sync_token:
+            try:
+                items, next_sync_token = await _alist_all_pages(credentials, timeout, syncToken=sync_token)
+                logger.info("Incremental Google Calendar sync returned %s changes.", len(items))
+                full_sync = False
+            except _AsyncCalendarError as e:
+                if e.status != 410:
+                    raise
+                logger.info("Google Calendar sync token expired (410). Falling back to a full sync.")
+                sync_token = None
+        window = None
+        if not sync_token:
+            time_min = time_min or datetime.datetime.now(datetime.timezone.utc)
+            time_max = time_max or time_min + datetime.timedelta(days=settings.GOOGLE_CALENDAR_SYNC_WINDOW_DAYS)
+            window = (time_min, time_max)
+            items, next_sync_token = await _alist_all_pages(credentials, timeout, timeMin=time_min.isoformat(), timeMax=time_max.isoformat())
+            logger.info("Full Google Calendar sync returned %s events.", len(items))
+            full_sync = True
         return {
-            "events": events,
-            "refreshed_credentials": credentials if was_refreshed else None
+            "items": items,
+            "next_sync_token": next_sync_token,
+            "full_sync": full_sync,
+            "window": window,
+            "refreshed_credentials": credentials if was_refreshed else None,
         }
-
-    except HttpError as e:
-        logger.error(f"Google Calendar API HttpError: {e.status_code} - {e._get_reason()}")
-        if e.resp.status == 401:
-            return {"error": "Google Calendar access denied (401). Please re-authenticate.", "needs_reauth": True}
-        return {"error": f"An error occurred with Google Calendar API: {e._get_reason()}", "needs_reauth": False}
-    except AttributeError as ae: # Catch specific AttributeError if it occurs elsewhere
-        logger.error(f"AttributeError during Google Calendar API call: {ae}", exc_info=True)
-        return {"error": f"A configuration or object error occurred with Google Calendar: {ae}", "needs_reauth": False}
+    except _AsyncCalendarError as e:
+        logger.error("Google Calendar API error during sync: %s", e)
+        return _api_error(e.status, e.reason)
+    except http_sessions.ASYNC_TIMEOUT_ERRORS + http_sessions.ASYNC_TRANSPORT_ERRORS as e:
+        return _transport_error(e)
     except Exception as e:
-        logger.error(f"Unexpected error fetching Google Calendar events: {e}", exc_info=True)
-        return {"error": f"An unexpected error occurred with Google Calendar: {e}", "needs_reauth": False}
\ No newline at end of file
+        logger.error("Unexpected error syncing Google Calendar events: %s", e, exc_info=True)
+        return {"error": f"An unexpected error occurred with Google Calendar: {e}", "needs_reauth": False}
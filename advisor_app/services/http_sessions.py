@@ -0,0 +1,163 @@
+# smart_advisor_project/advisor_app/services/http_sessions.py
+
+import asyncio
+import random
+import threading
+import weakref
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+import logging
+
+from . import metrics
+
+try:
+    import httpx
+except ImportError:  # Only the async service clients need httpx.
+    httpx = None
+
+# Exception families the async callers catch; empty (matching nothing) without httpx.
+ASYNC_TIMEOUT_ERRORS = (httpx.TimeoutException,) if httpx else ()
+ASYNC_TRANSPORT_ERRORS = (httpx.HTTPError,) if httpx else ()
+
+logger = logging.getLogger(__name__)
+
+# Upstream statuses worth retrying: rate limiting and transient server errors.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Async clients are bound to the event loop they were created on: {loop: {name: client}}.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class JitteredRetry(Retry):
+    """
+    Retry with "full jitter" backoff: a random delay between 0 and the
+    exponential backoff, so workers that failed together don't retry together.
+    A Retry-After header from the server still takes precedence, up to
+    HTTP_RETRY_AFTER_MAX seconds; asked to wait longer, it gives up and the
+    response goes back to the caller (raise_on_status is off).
+    """
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if response is not None:
+            retry_after = self.get_retry_after(response)
+            if retry_after is not None and retry_after > settings.HTTP_RETRY_AFTER_MAX:
+                raise MaxRetryError(_pool, url, ResponseError(f"Retry-After of {retry_after:g}s is too long to wait"))
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+def _build_session(name: str) -> requests.Session:
+    retries = JitteredRetry(
+        total=settings.HTTP_MAX_RETRIES,
+        connect=settings.HTTP_MAX_RETRIES,
+        read=False,  # Don't multiply read timeouts; surface them to the caller straight away.
+        status=settings.HTTP_MAX_RETRIES,
+        status_forcelist=RETRY_STATUSES,
+        backoff_factor=settings.HTTP_BACKOFF_FACTOR,
+        raise_on_status=False,  # Hand the final response back so callers' raise_for_status() handles it.
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+        max_retries=retries,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.hooks['response'].append(lambda response, *args, **kwargs: _count_response(name, response.status_code))
+    return session
+
+
+def _count_response(name: str, status_code: int):
+    metrics.inc('advisor_upstream_responses_total', session=name, status=status_code)
+
+
+def get_session(name: str) -> requests.Session:
+    """
+    Returns the process-wide session registered under `name` (one per upstream
+    provider), creating it on first use. Sessions keep per-host connection
+    pools alive, so repeat calls skip the TCP and TLS handshakes.
+    """
+    session = _sessions.get(name)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(name)
+            if session is None:
+                session = _sessions[name] = _build_session(name)
+                logger.debug("Created pooled HTTP session '%s'.", name)
+    return session
+
+
+def close_all():
+    """Closes every pooled session, e.g. at shutdown or between tests."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def get_async_client(name: str) -> 'httpx.AsyncClient':
+    """
+    Async counterpart of get_session(): one pooled keep-alive httpx.AsyncClient
+    per provider and event loop. Connection errors are retried by the transport;
+    status-based retries are handled by async_request(). Callers running on a
+    short-lived loop must aclose_all() before it ends.
+    """
+    if httpx is None:
+        raise ImproperlyConfigured("The async service clients require httpx (pip install httpx).")
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(name)
+    if client is None:
+        client = clients[name] = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_POOL_CONNECTIONS * settings.HTTP_POOL_MAXSIZE,
+                max_keepalive_connections=settings.HTTP_POOL_MAXSIZE,
+            ),
+            transport=httpx.AsyncHTTPTransport(retries=settings.HTTP_MAX_RETRIES),
+        )
+        logger.debug("Created pooled async HTTP client '%s'.", name)
+    return client
+
+
+async def async_request(name: str, method: str, url: str, **kwargs) -> 'httpx.Response':
+    """
+    Sends a request on the named async client, retrying idempotent requests on
+    RETRY_STATUSES with the same full-jitter backoff as the sync sessions.
+    The final response is returned whatever its status, including when the
+    server asks (Retry-After) for a longer wait than HTTP_RETRY_AFTER_MAX.
+    """
+    client = get_async_client(name)
+    retryable = method.upper() in Retry.DEFAULT_ALLOWED_METHODS
+    for attempt in range(settings.HTTP_MAX_RETRIES + 1):
+        response = await client.request(method, url, **kwargs)
+        _count_response(name, response.status_code)
+        if not retryable or response.status_code not in RETRY_STATUSES or attempt == settings.HTTP_MAX_RETRIES:
+            return response
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            delay = float(retry_after)
+            if delay > settings.HTTP_RETRY_AFTER_MAX:
+                logger.debug("Not retrying %s %s: Retry-After %ss is too long.", method, url, retry_after)
+                return response
+        else:
+            delay = random.uniform(0, settings.HTTP_BACKOFF_FACTOR * (2 ** attempt))
+        logger.debug("Retrying %s %s after HTTP %s in %.2fs.", method, url, response.status_code, delay)
+        await asyncio.sleep(delay)
+    return response
+
+
+async def aclose_all():
+    """Closes the async clients that belong to the running event loop."""
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
@@ -0,0 +1,208 @@
+# smart_advisor_project/advisor_app/services/metrics.py
+
+import bisect
+import contextvars
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+# Counters and histograms are written to a per-thread shard, so recording never
+# takes a lock; the shards are only summed when /metrics/ is scraped. When a thread
+# goes away its shard is folded into _retired, so short-lived pool threads don't pile up.
+
+# Histogram upper bounds in seconds (Prometheus' defaults).
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'advisor_request_seconds': ('histogram', "Time spent handling a request, by view and method."),
+    'advisor_phase_seconds': ('histogram', "Time spent in each phase of a request (weather, eventbrite, calendar, token_refresh, db, render)."),
+    'advisor_upstream_seconds': ('histogram', "Upstream provider call latency, by provider and outcome."),
+    'advisor_upstream_responses_total': ('counter', "Upstream HTTP responses, by session and status code."),
+    'advisor_cache_requests_total': ('counter', "Cache lookups, by namespace, result (hit, stale, miss) and tier (local, shared)."),
+    'advisor_circuit_rejections_total': ('counter', "Calls failed fast because a provider's circuit was open."),
+    'advisor_rate_limited_total': ('counter', "Upstream calls delayed or shed by the shared rate limiter, by provider and priority."),
+    'advisor_rate_limit_tokens': ('gauge', "Tokens left in each shared rate-limit bucket (remaining request budget)."),
+}
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+
+# {name: callable returning {labels: value}}; gauges are read when /metrics/ is scraped.
+_gauges = {}
+
+# {phase: seconds} for the request being handled; None outside a request.
+_request_timings = contextvars.ContextVar('advisor_request_timings', default=None)
+
+
+class _Shard:
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}  # {key: [count per bucket..., count above the last bucket, sum]}
+
+
+_retired = _Shard()  # Totals from threads that have exited.
+
+
+def _shard() -> _Shard:
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        with _shards_lock:  # Once per thread.
+            _shards.append(shard)
+        weakref.finalize(threading.current_thread(), _retire, shard)
+    return shard
+
+
+def _retire(shard: _Shard):
+    with _shards_lock:
+        _shards.remove(shard)
+        _add(_retired, shard)
+
+
+def _add(total: _Shard, shard: _Shard):
+    for key, value in shard.counters.copy().items():
+        total.counters[key] = total.counters.get(key, 0) + value
+    for key, values in shard.histograms.copy().items():
+        histogram = total.histograms.setdefault(key, [0] * (len(BUCKETS) + 2))
+        for i, value in enumerate(list(values)):
+            histogram[i] += value
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def inc(name: str, amount: float = 1, **labels):
+    key = _key(name, labels)
+    counters = _shard().counters
+    counters[key] = counters.get(key, 0) + amount
+
+
+def observe(name: str, value: float, **labels):
+    key = _key(name, labels)
+    histograms = _shard().histograms
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = [0] * (len(BUCKETS) + 2)
+    histogram[bisect.bisect_left(BUCKETS, value)] += 1
+    histogram[-1] += value
+
+
+def register_gauge(name: str, read):
+    """Registers `read()` as the source of a gauge; it returns {sorted (label, value) pairs: value}."""
+    _gauges[name] = read
+
+
+def reset():
+    """Drops all recorded values (tests)."""
+    with _shards_lock:
+        for shard in _shards + [_retired]:
+            shard.counters.clear()
+            shard.histograms.clear()
+
+
+def start_request():
+    """Starts collecting phase timings for the current request; returns a token for end_request()."""
+    return _request_timings.set({})
+
+
+def end_request(token) -> dict:
+    timings = _request_timings.get() or {}
+    _request_timings.reset(token)
+    return timings
+
+
+def add_request_time(phase: str, seconds: float):
+    """Adds to the current request's breakdown only (no histogram sample)."""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+def record_phase(phase: str, seconds: float):
+    observe('advisor_phase_seconds', seconds, phase=phase)
+    add_request_time(phase, seconds)
+
+
+@contextmanager
+def timed(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+
+
+def timed_call(phase: str, fn):
+    """Wraps fn so each call is recorded as `phase`; handy for work submitted to the executor."""
+    def wrapper(*args, **kwargs):
+        with timed(phase):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+async def timed_await(phase: str, awaitable):
+    with timed(phase):
+        return await awaitable
+
+
+def server_timing(timings: dict) -> str:
+    """Formats phase timings as a Server-Timing header value (durations in ms)."""
+    return ", ".join(f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in timings.items())
+
+
+def _snapshot():
+    total = _Shard()
+    with _shards_lock:
+        shards = list(_shards)
+        _add(total, _retired)
+    for shard in shards:
+        _add(total, shard)
+    return total.counters, total.histograms
+
+
+def counter_values(name: str) -> dict:
+    """{labels: total} for one counter, summed across threads; labels are sorted (label, value) pairs."""
+    counters, _ = _snapshot()
+    return {labels: value for (metric, labels), value in counters.items() if metric == name}
+
+
+def _format_labels(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    counters, histograms = _snapshot()
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            continue
+        if kind == 'gauge':
+            read = _gauges.get(name)
+            for labels, value in sorted(read().items() if read else ()):
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+            continue
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-1]:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,201 @@
+# smart_advisor_project/advisor_app/services/rate_limit.py
+"""
+Outbound rate limiting shared by every worker process. Each provider quota is a
+token bucket (RATE_LIMITS: refill rate per second and burst size) kept in a small
+SQLite file (RATE_LIMIT_DB); an upstream call takes one token.
+
+Calls carry a priority, held in a context variable: interactive (the default,
+dashboard requests) or background (prewarming, stale-entry revalidation).
+Background calls only take tokens while more than RATE_LIMIT_BACKGROUND_RESERVE
+of the burst is left, so they can't spend the budget interactive requests need.
+A call that finds no token waits up to RATE_LIMIT_MAX_WAIT[priority] seconds for
+one and is shed after that.
+"""
+
+import asyncio
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+import logging
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE, BACKGROUND = 'interactive', 'background'
+
+# Seconds to wait for another process's bucket update before giving up on the limiter.
+LOCK_TIMEOUT = 1.0
+
+_priority = contextvars.ContextVar('advisor_call_priority', default=INTERACTIVE)
+_local = threading.local()
+
+
+@contextmanager
+def priority(level: str):
+    """Runs the enclosed upstream calls at `level` (INTERACTIVE or BACKGROUND)."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def background():
+    return priority(BACKGROUND)
+
+
+def _connection() -> sqlite3.Connection:
+    """This thread's connection to RATE_LIMIT_DB, creating the table on first use."""
+    path = str(settings.RATE_LIMIT_DB)
+    connection = getattr(_local, 'connection', None)
+    if connection is None or _local.path != path:
+        connection = sqlite3.connect(path, timeout=LOCK_TIMEOUT, isolation_level=None)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+        _local.connection, _local.path = connection, path
+    return connection
+
+
+def _reset_after_fork():
+    global _local
+    _local = threading.local()  # SQLite connections must not be shared with a forked child.
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _limit_for(provider: str):
+    """(bucket name, rate, burst) for a provider, or None if it isn't limited."""
+    bucket = settings.RATE_LIMIT_BUCKETS.get(provider, provider)
+    limit = settings.RATE_LIMITS.get(bucket)
+    if limit is None or limit[0] <= 0:
+        return None
+    return (bucket, *limit)
+
+
+def _refilled(tokens: float, updated: float, rate: float, burst: float, now: float) -> float:
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+def _try_take(bucket: str, rate: float, burst: float, floor: float) -> float:
+    """
+    Takes a token if that leaves at least `floor` in the bucket. Returns 0 on
+    success, otherwise the seconds until one would be available.
+    """
+    connection = _connection()
+    now = time.time()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        row = connection.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (bucket,)).fetchone()
+        tokens = burst if row is None else _refilled(row[0], row[1], rate, burst, now)
+        wait = 0.0
+        if tokens - 1 >= floor:
+            tokens -= 1
+        else:
+            wait = (floor + 1 - tokens) / rate
+        connection.execute(
+            "INSERT INTO buckets (name, tokens, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+            (bucket, tokens, now))
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    return wait
+
+
+def _attempt(provider: str, limit, level: str):
+    """One try at the bucket: returns the seconds to wait (0 = token taken), failing open on SQLite errors."""
+    bucket, rate, burst = limit
+    floor = burst * settings.RATE_LIMIT_BACKGROUND_RESERVE if level == BACKGROUND else 0.0
+    try:
+        return _try_take(bucket, rate, burst, floor)
+    except sqlite3.Error as e:
+        logger.warning("Rate limiter unavailable for '%s'; allowing the call: %s", provider, e)
+        return 0.0
+
+
+def _shed(provider: str, level: str) -> bool:
+    logger.warning("Rate limit for '%s' exhausted; shedding a %s call.", provider, level)
+    metrics.inc('advisor_rate_limited_total', provider=provider, priority=level, outcome='shed')
+    return False
+
+
+def acquire(provider: str) -> bool:
+    """
+    Takes a token from the provider's bucket, waiting for one if the current
+    priority's RATE_LIMIT_MAX_WAIT allows. Returns False if the call should be shed.
+    """
+    limit = _limit_for(provider)
+    if limit is None:
+        return True
+    level = _priority.get()
+    deadline = time.monotonic() + settings.RATE_LIMIT_MAX_WAIT[level]
+    delayed = False
+    while True:
+        wait = _attempt(provider, limit, level)
+        if not wait:
+            if delayed:
+                metrics.inc('advisor_rate_limited_total', provider=provider, priority=level, outcome='delayed')
+            return True
+        if time.monotonic() + wait > deadline:
+            return _shed(provider, level)
+        delayed = True
+        time.sleep(wait)
+
+
+async def aacquire(provider: str) -> bool:
+    """
+    Async version of acquire(). Bucket updates (which may wait up to LOCK_TIMEOUT
+    for another process's lock) run in a worker thread, so the event loop never blocks.
+    """
+    limit = _limit_for(provider)
+    if limit is None:
+        return True
+    level = _priority.get()
+    deadline = time.monotonic() + settings.RATE_LIMIT_MAX_WAIT[level]
+    delayed = False
+    while True:
+        wait = await asyncio.to_thread(_attempt, provider, limit, level)
+        if not wait:
+            if delayed:
+                metrics.inc('advisor_rate_limited_total', provider=provider, priority=level, outcome='delayed')
+            return True
+        if time.monotonic() + wait > deadline:
+            return _shed(provider, level)
+        delayed = True
+        await asyncio.sleep(wait)
+
+
+def remaining() -> dict:
+    """{bucket: tokens left now} for every configured bucket (full for ones not used yet)."""
+    budgets = {bucket: float(burst) for bucket, (rate, burst) in settings.RATE_LIMITS.items() if rate > 0}
+    try:
+        rows = _connection().execute("SELECT name, tokens, updated FROM buckets").fetchall()
+    except sqlite3.Error as e:
+        logger.warning("Could not read rate limit buckets: %s", e)
+        return budgets
+    now = time.time()
+    for bucket, tokens, updated in rows:
+        if bucket in budgets:
+            rate, burst = settings.RATE_LIMITS[bucket]
+            budgets[bucket] = round(_refilled(tokens, updated, rate, burst, now), 3)
+    return budgets
+
+
+def reset():
+    """Refills every bucket (tests, or after changing RATE_LIMITS)."""
+    _connection().execute("DELETE FROM buckets")
+
+
+metrics.register_gauge(
+    'advisor_rate_limit_tokens',
+    lambda: {(('bucket', bucket),): tokens for bucket, tokens in remaining().items()},
+)
@@ -0,0 +1,190 @@
+# smart_advisor_project/advisor_app/services/resilience.py
+
+import threading
+import time
+from collections import deque
+from django.conf import settings
+import logging
+
+from . import metrics, rate_limit
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# How often (seconds) the latency percentile behind timeout() is recomputed.
+TIMEOUT_RECOMPUTE_INTERVAL = 1.0
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker with a rolling window of call outcomes.
+
+    Closed: calls go through. Once at least CIRCUIT_BREAKER_MIN_REQUESTS calls
+    in the last CIRCUIT_BREAKER_WINDOW seconds failed at a rate of
+    CIRCUIT_BREAKER_FAILURE_RATE or more, it opens.
+    Open: calls fail fast for CIRCUIT_BREAKER_OPEN_SECONDS, then it half-opens.
+    Half-open: a single probe call is let through; success closes the circuit,
+    failure opens it again.
+
+    timeout() derives a request timeout from recent successful latencies
+    (p95 x ADAPTIVE_TIMEOUT_MULTIPLIER), clamped between ADAPTIVE_TIMEOUT_FLOOR
+    and the provider's configured maximum.
+    """
+    def __init__(self, name: str, max_timeout: float):
+        self.name = name
+        self.max_timeout = max_timeout
+        self.state = CLOSED
+        self._calls = deque()  # (monotonic timestamp, ok, latency seconds)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._timeout = max_timeout
+        self._timeout_computed_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now - self._opened_at < settings.CIRCUIT_BREAKER_OPEN_SECONDS:
+                    return False
+                self.state = HALF_OPEN
+                logger.info("Circuit '%s' half-open; probing upstream.", self.name)
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def release(self):
+        """Hands back an allow() that didn't lead to a call, so a half-open circuit can probe again."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+
+    def record(self, ok: bool, latency: float):
+        with self._lock:
+            now = time.monotonic()
+            self._calls.append((now, ok, latency))
+            self._prune(now)
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                if ok:
+                    self.state = CLOSED
+                    self._calls.clear()
+                    logger.info("Circuit '%s' closed; upstream recovered.", self.name)
+                else:
+                    self._open(now)
+            elif self.state == CLOSED and not ok:
+                failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+                if (len(self._calls) >= settings.CIRCUIT_BREAKER_MIN_REQUESTS
+                        and failures / len(self._calls) >= settings.CIRCUIT_BREAKER_FAILURE_RATE):
+                    self._open(now)
+
+    def timeout(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._timeout_computed_at >= TIMEOUT_RECOMPUTE_INTERVAL:
+                self._prune(now)
+                self._timeout = self._compute_timeout()
+                self._timeout_computed_at = now
+            return self._timeout
+
+    def _compute_timeout(self) -> float:
+        latencies = sorted(latency for _, ok, latency in self._calls if ok)
+        if len(latencies) < settings.CIRCUIT_BREAKER_MIN_REQUESTS:
+            return self.max_timeout
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        adaptive = p95 * settings.ADAPTIVE_TIMEOUT_MULTIPLIER
+        return min(self.max_timeout, max(settings.ADAPTIVE_TIMEOUT_FLOOR, adaptive))
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self._opened_at = now
+        logger.warning("Circuit '%s' opened; failing fast for %ss.", self.name, settings.CIRCUIT_BREAKER_OPEN_SECONDS)
+
+    def _prune(self, now: float):
+        horizon = now - settings.CIRCUIT_BREAKER_WINDOW
+        while self._calls and self._calls[0][0] < horizon:
+            self._calls.popleft()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str, max_timeout: float) -> CircuitBreaker:
+    """Returns the process-wide breaker for a provider; max_timeout applies on first use."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name, max_timeout))
+    return breaker
+
+
+def reset_all():
+    """Forgets all breaker state (tests, or after a configuration change)."""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def is_transient_status(status_code: int) -> bool:
+    """Rate limiting and server errors count against the breaker; other 4XX responses don't."""
+    return status_code == 429 or status_code >= 500
+
+
+def _is_failure(result) -> bool:
+    return isinstance(result, dict) and bool(result.get('transient'))
+
+
+def _record(breaker: CircuitBreaker, ok: bool, started: float):
+    latency = time.monotonic() - started
+    breaker.record(ok, latency)
+    metrics.observe('advisor_upstream_seconds', latency, provider=breaker.name, outcome='ok' if ok else 'failure')
+
+
+def call(name: str, max_timeout: float, fetch, unavailable: dict):
+    """
+    Runs fetch(timeout) through the provider's breaker and records the outcome.
+    Results flagged {"transient": True} (timeouts, connection errors, 429/5xx)
+    count as failures. While the circuit is open a copy of `unavailable` is
+    returned without calling the upstream; the same goes for calls the shared
+    rate limiter sheds (rate_limited=True), which don't count against the breaker.
+    """
+    breaker = get_breaker(name, max_timeout)
+    if not breaker.allow():
+        logger.debug("Circuit '%s' is open; skipping upstream call.", name)
+        metrics.inc('advisor_circuit_rejections_total', provider=name)
+        return dict(unavailable, transient=True, circuit_open=True)
+    if not rate_limit.acquire(name):
+        breaker.release()
+        return dict(unavailable, transient=True, rate_limited=True)
+    started = time.monotonic()
+    try:
+        result = fetch(breaker.timeout())
+    except Exception:
+        _record(breaker, False, started)
+        raise
+    _record(breaker, not _is_failure(result), started)
+    return result
+
+
+async def acall(name: str, max_timeout: float, afetch, unavailable: dict):
+    """Async version of call(); afetch(timeout) is a coroutine function."""
+    breaker = get_breaker(name, max_timeout)
+    if not breaker.allow():
+        logger.debug("Circuit '%s' is open; skipping upstream call.", name)
+        metrics.inc('advisor_circuit_rejections_total', provider=name)
+        return dict(unavailable, transient=True, circuit_open=True)
+    if not await rate_limit.aacquire(name):
+        breaker.release()
+        return dict(unavailable, transient=True, rate_limited=True)
+    started = time.monotonic()
+    try:
+        result = await afetch(breaker.timeout())
+    except BaseException:  # Includes cancellation at the page deadline.
+        _record(breaker, False, started)
+        raise
+    _record(breaker, not _is_failure(result), started)
+    return result
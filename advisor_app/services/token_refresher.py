@@ -0,0 +1,100 @@
+# smart_advisor_project/advisor_app/services/token_refresher.py
+
+import datetime
+import json
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.utils import timezone
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request as GoogleAuthRequest
+import logging
+
+from ..models import GoogleCredential
+from . import http_sessions
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of a single refresh attempt.
+REFRESHED, REVOKED, FAILED = 'refreshed', 'revoked', 'failed'
+
+
+def _expiring_profiles(window: datetime.timedelta, chunk_size: int):
+    """
+    Yields (profile, credentials) for stored refreshable credentials that expire within `window`.
+    The indexed expiry column does the filtering, so only those rows are decrypted.
+    Rows are read in primary-key order one chunk at a time (keyset pagination),
+    so the table is never loaded whole and writes between chunks are safe.
+    """
+    rows = (
+        GoogleCredential.objects
+        .filter(has_refresh_token=True, expiry__lte=timezone.now() + window)
+        .select_related('profile__user')
+        .order_by('pk')
+    )
+    last_pk = None
+    while True:
+        chunk = list((rows.filter(pk__gt=last_pk) if last_pk is not None else rows)[:chunk_size])
+        if not chunk:
+            return
+        last_pk = chunk[-1].pk
+        for row in chunk:
+            profile = row.profile
+            profile.google_credential = row  # So get_google_credentials() doesn't load it again.
+            credentials = profile.get_google_credentials()
+            if credentials and credentials.refresh_token:
+                yield profile, credentials
+
+
+def _refresh_one(item):
+    profile, credentials = item
+    try:
+        credentials.refresh(GoogleAuthRequest(session=http_sessions.get_session('google')))
+        return profile, credentials, REFRESHED
+    except RefreshError as e:
+        logger.warning("Background refresh rejected for %s; clearing credentials: %s", profile.user.username, e)
+        return profile, None, REVOKED
+    except Exception as e:
+        logger.error("Background refresh failed for %s: %s", profile.user.username, e)
+        return profile, None, FAILED
+
+
+def _refresh_batch(executor, batch, stats):
+    changed, revoked = [], []
+    for profile, credentials, outcome in executor.map(_refresh_one, batch):
+        stats[outcome] += 1
+        if outcome == REFRESHED:
+            row = profile.google_credential
+            row.store(json.loads(credentials.to_json()))
+            changed.append(row)
+        elif outcome == REVOKED:
+            revoked.append(profile.pk)
+    if changed:
+        GoogleCredential.objects.bulk_update(changed, ['payload', 'expiry', 'has_refresh_token', 'updated_at'])
+    if revoked:
+        GoogleCredential.objects.filter(pk__in=revoked).delete()
+
+
+def refresh_expiring_credentials(window_seconds: int = None, max_workers: int = None, batch_size: int = None) -> dict:
+    """
+    Refreshes every stored Google token that expires within `window_seconds`,
+    `batch_size` profiles at a time with up to `max_workers` refreshes in
+    parallel. Each batch is persisted with one bulk update. Tokens Google
+    rejects (revoked access) are cleared, as the request path would do.
+    Returns counts per outcome.
+    """
+    window = datetime.timedelta(seconds=window_seconds if window_seconds is not None else settings.GOOGLE_TOKEN_REFRESH_WINDOW)
+    max_workers = max_workers or settings.GOOGLE_TOKEN_REFRESH_WORKERS
+    batch_size = batch_size or settings.GOOGLE_TOKEN_REFRESH_BATCH_SIZE
+
+    stats = {REFRESHED: 0, REVOKED: 0, FAILED: 0}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='advisor-token-refresh') as executor:
+        batch = []
+        for item in _expiring_profiles(window, chunk_size=batch_size):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                _refresh_batch(executor, batch, stats)
+                batch = []
+        if batch:
+            _refresh_batch(executor, batch, stats)
+    logger.info("Background token refresh finished: %s", stats)
+    return stats
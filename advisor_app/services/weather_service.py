@@ -1,50 +1,257 @@
+import contextvars
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 import logging
 
+from . import caching, geo, http_sessions, resilience
+
 logger = logging.getLogger(__name__) # advisor_app.services.weather_service
 
-def get_weather_data(location: str):
+# Errors that won't fix themselves on retry; cached briefly so a bad location doesn't hammer the API.
+NEGATIVE_CACHE_STATUSES = (401, 404)
+
+# Upper bound for the adaptive request timeout (the old fixed timeout).
+WEATHER_MAX_TIMEOUT = 10
+WEATHER_UNAVAILABLE = {"error": "Weather service is temporarily unavailable."}
+# OpenWeatherMap's group endpoint takes at most this many city IDs per call.
+GROUP_MAX_IDS = 20
+
+def get_weather_data(location: str, units: str = 'metric', force_refresh: bool = False, latitude: float = None, longitude: float = None):
     """
-    Fetches weather data from OpenWeatherMap API.
+    Fetches weather data from OpenWeatherMap API, through the shared cache.
+    With coordinates, they are snapped to a geo.snap() grid cell and results are
+    keyed on the cell, so nearby users share one upstream call per WEATHER_CACHE_TTL;
+    otherwise results are keyed on the normalized location text.
+    force_refresh bypasses a cached value and stores a fresh one (used by prewarming).
     Returns a dictionary with weather data or an error message.
     """
     api_key = settings.OPENWEATHERMAP_API_KEY
     if not api_key:
         logger.error("OpenWeatherMap API key is not configured.")
         return {"error": "Weather service is not configured."}
-    if not location:
+    if not location and latitude is None:
         logger.warning("get_weather_data called with no location.")
         return {"error": "Location not provided."}
 
-    base_url = "https://api.openweathermap.org/data/2.5/weather"
+    key, coordinates = _cache_key(location, units, latitude, longitude)
+    return caching.get_or_fetch(
+        key,
+        lambda: resilience.call('openweathermap', WEATHER_MAX_TIMEOUT,
+                                lambda timeout: _fetch_weather_data(location, units, timeout, coordinates),
+                                WEATHER_UNAVAILABLE),
+        ttl_for=_cache_ttl_for,
+        stale_ttl=settings.WEATHER_CACHE_STALE_TTL,
+        force=force_refresh,
+    )
+
+def get_cached_weather(location: str, units: str = 'metric', latitude: float = None, longitude: float = None):
+    """The fresh cached result get_weather_data would return, or None; never calls the API."""
+    if not settings.OPENWEATHERMAP_API_KEY or (not location and latitude is None):
+        return None
+    return caching.get_fresh(_cache_key(location, units, latitude, longitude)[0])
+
+def get_weather_batch(locations, units: str = 'metric', force_refresh: bool = False, max_workers: int = None, throttle=None) -> dict:
+    """
+    Weather for many locations at once. Each item is a location name, an
+    OpenWeatherMap city ID (int) or a (latitude, longitude) pair; returns
+    {item: weather dict or error dict} for every item passed.
+
+    Items are deduplicated on their cache key first (normalized name, city ID,
+    grid cell), and fresh cache entries are read in one round trip. Missing city
+    IDs are fetched through the group endpoint, GROUP_MAX_IDS per request; names
+    and coordinates have no bulk endpoint and fan out over at most `max_workers`
+    threads (WEATHER_BATCH_MAX_WORKERS by default) through get_weather_data.
+    `throttle`, if given, is called before each upstream request (e.g. a rate limiter).
+    """
+    if not settings.OPENWEATHERMAP_API_KEY:
+        logger.error("OpenWeatherMap API key is not configured.")
+        return {item: {"error": "Weather service is not configured."} for item in locations}
+
+    keys = {}  # item -> cache key
+    for item in locations:
+        if item in keys:
+            continue
+        if isinstance(item, int):
+            keys[item] = caching.make_key('weather', units, 'id', item)
+        elif isinstance(item, tuple):
+            keys[item] = _cache_key(None, units, *item)[0]
+        elif item:
+            keys[item] = _cache_key(item, units, None, None)[0]
+    by_key = {}  # cache key -> first item seen, which is what gets fetched
+    for item, key in keys.items():
+        by_key.setdefault(key, item)
+
+    results = {} if force_refresh else caching.get_fresh_many(list(by_key))
+    missing = [item for key, item in by_key.items() if key not in results]
+    city_ids = [item for item in missing if isinstance(item, int)]
+    others = [item for item in missing if not isinstance(item, int)]
+    logger.debug("Weather batch: %s items, %s distinct, %s cached, %s city IDs in groups, %s fanned out.",
+                 len(locations), len(by_key), len(by_key) - len(missing), len(city_ids), len(others))
+
+    for start in range(0, len(city_ids), GROUP_MAX_IDS):
+        chunk = city_ids[start:start + GROUP_MAX_IDS]
+        if throttle:
+            throttle()
+        for city_id, weather in _fetch_weather_group(chunk, units).items():
+            results[keys[city_id]] = weather
+            caching.store(keys[city_id], weather, _cache_ttl_for, settings.WEATHER_CACHE_STALE_TTL)
+
+    def fetch_one(item):
+        if throttle:
+            throttle()
+        if isinstance(item, tuple):
+            return get_weather_data(None, units, force_refresh, latitude=item[0], longitude=item[1])
+        return get_weather_data(item, units, force_refresh)
+
+    if others:
+        workers = min(len(others), max_workers or settings.WEATHER_BATCH_MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='advisor-weather-batch') as executor:
+            # Each task runs in a copy of the caller's context, so e.g. its rate-limit priority carries over.
+            futures = [executor.submit(contextvars.copy_context().run, fetch_one, item) for item in others]
+            for item, future in zip(others, futures):
+                results[keys[item]] = future.result()
+
+    return {item: results[keys[item]] if item in keys else {"error": "Location not provided."} for item in locations}
+
+def _fetch_weather_group(city_ids, units: str) -> dict:
+    """One group-endpoint call through the circuit breaker. Returns {city ID: weather or error dict}."""
+    result = resilience.call('openweathermap', WEATHER_MAX_TIMEOUT,
+                             lambda timeout: _request_weather_group(city_ids, units, timeout),
+                             WEATHER_UNAVAILABLE)
+    if result.get('error'):
+        return {city_id: result for city_id in city_ids}
+    by_id = {entry.get('id'): entry for entry in result.get('list', [])}
+    return {city_id: by_id.get(city_id) or {"error": f"City not found: {city_id}.", "status": 404} for city_id in city_ids}
+
+def _request_weather_group(city_ids, units: str, timeout: float = WEATHER_MAX_TIMEOUT) -> dict:
+    params = {'id': ','.join(str(city_id) for city_id in city_ids), 'appid': settings.OPENWEATHERMAP_API_KEY, 'units': units}
+    description = f"{len(city_ids)} city IDs"
+    try:
+        response = http_sessions.get_session('openweathermap').get(f"{settings.OPENWEATHERMAP_API_URL}/group", params=params, timeout=timeout)
+        response.raise_for_status()
+        weather_json = response.json()
+        logger.info("Successfully fetched weather for %s.", description)
+        return weather_json
+    except requests.exceptions.Timeout:
+        logger.error("Timeout when fetching weather for %s.", description)
+        return {"error": "Weather service request timed out.", "transient": True}
+    except requests.exceptions.HTTPError as http_err:
+        status_code = http_err.response.status_code
+        logger.error("HTTP error %s for %s: %s.", status_code, description, http_err)
+        return _error_for_status(status_code, description)
+    except requests.exceptions.RequestException as req_err:
+        logger.error("Request exception for %s: %s", description, req_err)
+        return {"error": "Could not connect to weather service.", "transient": True}
+    except ValueError as json_err: # Includes JSONDecodeError
+        logger.error("JSON decode error for %s weather response: %s", description, json_err)
+        return {"error": "Invalid response from weather service."}
+
+def _cache_key(location: str, units: str, latitude: float, longitude: float):
+    """Returns (cache key, snapped (lat, lon) or None)."""
+    if latitude is not None and longitude is not None:
+        cell, cell_latitude, cell_longitude = geo.snap(latitude, longitude)
+        return caching.make_key('weather', units, 'cell', cell), (cell_latitude, cell_longitude)
+    return caching.make_key('weather', units, caching.normalize_location(location)), None
+
+def forget_errors(location: str, units: str = 'metric', latitude: float = None, longitude: float = None):
+    """Drops a cached error for this location, so the next lookup retries upstream."""
+    caching.invalidate(_cache_key(location, units, latitude, longitude)[0], errors_only=True)
+
+def _cache_ttl_for(weather: dict):
+    """Fresh data uses the normal TTL, permanent errors a short one, transient errors aren't cached."""
+    if not weather.get('error'):
+        return settings.WEATHER_CACHE_TTL
+    if weather.get('status') in NEGATIVE_CACHE_STATUSES:
+        return settings.WEATHER_NEGATIVE_CACHE_TTL
+    return None
+
+def _weather_url() -> str:
+    return f"{settings.OPENWEATHERMAP_API_URL}/weather"
+
+def _request_params(location: str, units: str, coordinates=None) -> dict:
     params = {
-        'q': location,
-        'appid': api_key,
-        'units': 'metric'  # Use 'imperial' for Fahrenheit
+        'appid': settings.OPENWEATHERMAP_API_KEY,
+        'units': units  # Use 'imperial' for Fahrenheit
     }
+    if coordinates is not None:
+        params['lat'], params['lon'] = coordinates
+    else:
+        params['q'] = location
+    return params
+
+def _error_for_status(status_code: int, location: str) -> dict:
+    if status_code == 401:
+        return {"error": "Invalid API key for weather service.", "status": status_code}
+    elif status_code == 404:
+        return {"error": f"City not found: {location}.", "status": status_code}
+    else:
+        return {"error": f"Weather service error (HTTP {status_code}).",
+                "transient": resilience.is_transient_status(status_code)}
+
+def _fetch_weather_data(location: str, units: str, timeout: float = WEATHER_MAX_TIMEOUT, coordinates=None):
+    """Performs the actual OpenWeatherMap request. Callers should go through get_weather_data."""
+    params = _request_params(location, units, coordinates)
     try:
-        logger.debug(f"Requesting weather for {location} with params: {params}")
-        response = requests.get(base_url, params=params, timeout=10) # 10-second timeout
+        logger.debug("Requesting weather for %s with params: %s", location, params)
+        response = http_sessions.get_session('openweathermap').get(_weather_url(), params=params, timeout=timeout)
         response.raise_for_status()  # Raises HTTPError for bad responses (4XX or 5XX)
         weather_json = response.json()
-        logger.info(f"Successfully fetched weather for {location}.")
+        logger.info("Successfully fetched weather for %s.", location)
         return weather_json
     except requests.exceptions.Timeout:
-        logger.error(f"Timeout when fetching weather for {location}.")
-        return {"error": "Weather service request timed out."}
+        logger.error("Timeout when fetching weather for %s.", location)
+        return {"error": "Weather service request timed out.", "transient": True}
     except requests.exceptions.HTTPError as http_err:
         status_code = http_err.response.status_code
-        logger.error(f"HTTP error {status_code} for {location}: {http_err}. Response: {http_err.response.text}")
-        if status_code == 401:
-            return {"error": "Invalid API key for weather service."}
-        elif status_code == 404:
-            return {"error": f"City not found: {location}."}
-        else:
-            return {"error": f"Weather service error (HTTP {status_code})."}
+        logger.error("HTTP error %s for %s: %s. Response: %s", status_code, location, http_err, http_err.response.text)
+        return _error_for_status(status_code, location)
     except requests.exceptions.RequestException as req_err:
-        logger.error(f"Request exception for {location}: {req_err}")
-        return {"error": "Could not connect to weather service."}
+        logger.error("Request exception for %s: %s", location, req_err)
+        return {"error": "Could not connect to weather service.", "transient": True}
+    except ValueError as json_err: # Includes JSONDecodeError
+        logger.error("JSON decode error for %s weather response: %s", location, json_err)
+        return {"error": "Invalid response from weather service."}
+
+async def get_weather_data_async(location: str, units: str = 'metric', force_refresh: bool = False, latitude: float = None, longitude: float = None):
+    """
+    Async version of get_weather_data, sharing its cache entries.
+    Uses the pooled async HTTP client, so no thread waits on the upstream.
+    """
+    if not settings.OPENWEATHERMAP_API_KEY:
+        logger.error("OpenWeatherMap API key is not configured.")
+        return {"error": "Weather service is not configured."}
+    if not location and latitude is None:
+        logger.warning("get_weather_data_async called with no location.")
+        return {"error": "Location not provided."}
+
+    key, coordinates = _cache_key(location, units, latitude, longitude)
+    return await caching.aget_or_fetch(
+        key,
+        lambda: resilience.acall('openweathermap', WEATHER_MAX_TIMEOUT,
+                                 lambda timeout: _fetch_weather_data_async(location, units, timeout, coordinates),
+                                 WEATHER_UNAVAILABLE),
+        ttl_for=_cache_ttl_for,
+        stale_ttl=settings.WEATHER_CACHE_STALE_TTL,
+        force=force_refresh,
+    )
+
+async def _fetch_weather_data_async(location: str, units: str, timeout: float = WEATHER_MAX_TIMEOUT, coordinates=None):
+    try:
+        logger.debug("Requesting weather (async) for %s", location)
+        response = await http_sessions.async_request('openweathermap', 'GET', _weather_url(), params=_request_params(location, units, coordinates), timeout=timeout)
+        if response.status_code >= 400:
+            logger.error("HTTP error %s for %s. Response: %s", response.status_code, location, response.text)
+            return _error_for_status(response.status_code, location)
+        weather_json = response.json()
+        logger.info("Successfully fetched weather for %s.", location)
+        return weather_json
+    except http_sessions.ASYNC_TIMEOUT_ERRORS:
+        logger.error("Timeout when fetching weather for %s.", location)
+        return {"error": "Weather service request timed out.", "transient": True}
+    except http_sessions.ASYNC_TRANSPORT_ERRORS as req_err:
+        logger.error("Request exception for %s: %s", location, req_err)
+        return {"error": "Could not connect to weather service.", "transient": True}
     except ValueError as json_err: # Includes JSONDecodeError
-        logger.error(f"JSON decode error for {location} weather response: {json_err}")
-        return {"error": "Invalid response from weather service."}
\ No newline at end of file
+        logger.error("JSON decode error for %s weather response: %s", location, json_err)
+        return {"error": "Invalid response from weather service."}
@@ -1,26 +1,57 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
 from django.db.models.signals import post_save
 from django.contrib.auth.models import User
-from django.dispatch import receiver
+from django.dispatch import Signal, receiver
 from .models import UserProfile
 import logging
 
 logger = logging.getLogger(__name__) # advisor_app.signals
 
+# Sent by profile_view after a user changes their location (sender=UserProfile, profile=, old_location=).
+location_changed = Signal()
+
 @receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    """
+    Creates the UserProfile when a User is created, and does nothing otherwise.
+    Later User saves (including the last_login update on every login) don't touch
+    the profile; a profile that is missing for an older user is created on first
+    access by UserProfile.objects.for_user(). Fixture loading (raw) is skipped,
+    since fixtures carry their own profile rows.
+    """
+    if not created or raw:
+        return
+    UserProfile.objects.create(user=instance)
+    logger.info("UserProfile created for new user: %s", instance.username)
+
+@receiver(location_changed)
+def forget_cached_location_errors(sender, profile, **kwargs):
     """
-    Signal handler to create or update a UserProfile when a User instance is saved.
+    Changing location is an explicit retry: drop cached errors (e.g. "location not found"
+    from an earlier lookup of the same place) so the next dashboard asks upstream again.
+    Successful results are shared with other users and stay cached.
     """
-    if created:
-        UserProfile.objects.create(user=instance)
-        logger.info(f"UserProfile created for new user: {instance.username}")
+    from .services import eventbrite_service, weather_service
+    coordinates = profile.coordinates
+    if coordinates is not None:
+        weather_service.forget_errors(profile.location, latitude=coordinates[0], longitude=coordinates[1])
+        eventbrite_service.forget_errors(latitude=coordinates[0], longitude=coordinates[1])
     else:
-        # Ensure profile exists for existing users, perhaps created before this signal
-        try:
-            instance.profile.save() # Trigger save on existing profile if needed
-            # logger.debug(f"UserProfile updated for existing user: {instance.username}")
-        except UserProfile.DoesNotExist:
-            UserProfile.objects.create(user=instance) # Create if it somehow doesn't exist
-            logger.warning(f"UserProfile was missing for existing user {instance.username} and has been created.")
-        except Exception as e:
-            logger.error(f"Error saving profile for user {instance.username} in signal: {e}")
\ No newline at end of file
+        weather_service.forget_errors(profile.location)
+        eventbrite_service.forget_errors(location_address=profile.location)
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    """
+    Applies SQLITE_PRAGMAS (per-connection settings) to every new SQLite connection.
+    SQLITE_JOURNAL_MODE, when set, is applied after busy_timeout so the switch can wait
+    for other connections; unlike the rest it is persisted in the database file.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        if settings.SQLITE_JOURNAL_MODE:
+            cursor.execute(f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}")
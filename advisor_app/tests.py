@@ -1,8 +1,39 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
 from django.urls import reverse
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .models import UserProfile, CalendarEventCache
 from unittest.mock import patch # For mocking API calls
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.conf import settings
+from django.core.cache import cache
+from unittest.mock import MagicMock, AsyncMock
+import datetime
+import json
+import logging
+import threading
+import time
+from django.utils import timezone
+from .services import caching, rate_limit, weather_service, http_sessions, google_calendar_service, eventbrite_service, resilience, metrics, geo
+from .services.eventbrite_service import EventSummary
+
+
+def setUpModule():
+    # Keep rate-limit buckets and cache entries out of the repository's RATE_LIMIT_DB and cache
+    # directory: fresh ones per run, so tests never see state left by earlier runs (or by a
+    # development server).
+    import tempfile
+    global _state_dir, _state_settings
+    _state_dir = tempfile.TemporaryDirectory()
+    caches = {'default': dict(settings.CACHES['default'], LOCATION=f'{_state_dir.name}/cache')}
+    _state_settings = override_settings(RATE_LIMIT_DB=f'{_state_dir.name}/rate_limits.sqlite3', CACHES=caches)
+    _state_settings.enable()
+
+
+def tearDownModule():
+    _state_settings.disable()
+    _state_dir.cleanup()
 
 class UserProfileModelTests(TestCase):
     def test_profile_creation_signal(self):
@@ -11,6 +42,170 @@ class UserProfileModelTests(TestCase):
         self.assertIsNotNone(user.profile)
         self.assertEqual(user.profile.user, user)
 
+class UserProfileSignalTests(TestCase):
+    def test_later_user_saves_do_not_touch_the_profile(self):
+        user = User.objects.create_user(username='quietuser', password='password123')
+        with self.assertNumQueries(1):  # Just the UPDATE of auth_user.
+            user.save(update_fields=['last_login'])
+        with self.assertNumQueries(1):
+            user.save()
+
+    def test_missing_profile_is_created_on_first_access(self):
+        user = User.objects.create_user(username='legacyuser', password='password123')
+        UserProfile.objects.filter(user=user).delete()
+        user = User.objects.get(pk=user.pk)
+        profile = UserProfile.objects.for_user(user)
+        self.assertEqual(profile.user, user)
+        with self.assertNumQueries(0):
+            self.assertIs(UserProfile.objects.for_user(user), profile)
+
+    def test_bulk_imported_users_get_profiles_in_one_batch(self):
+        User.objects.bulk_create([User(username=f'import{i}') for i in range(5)])
+        users = list(User.objects.filter(username__startswith='import'))
+        UserProfile.objects.create(user=users[0])  # Already has one; skipped.
+        with self.assertNumQueries(1):
+            UserProfile.objects.bulk_create_for_users(users)
+        self.assertEqual(UserProfile.objects.filter(user__in=users).count(), 5)
+
+
+class RequestProfileTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='profileuser', password='password123')
+        self.client.login(username='profileuser', password='password123')
+
+    def test_profile_is_loaded_with_the_session_user(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, 200)
+        standalone = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'FROM "advisor_app_userprofile"' in q['sql']]
+        self.assertEqual(standalone, [])
+
+    def test_location_update_does_not_rewrite_credentials(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('profile'), {'location': 'Nairobi'})
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "advisor_app_userprofile"')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('google_credentials_json', updates[0])
+        self.assertEqual(UserProfile.objects.get(pk=self.user.pk).location, 'Nairobi')
+
+
+class SqliteTuningTests(TestCase):
+    def test_new_connections_get_the_configured_pragmas(self):
+        from django.db import connections
+        from .signals import tune_sqlite_connection
+        self.addCleanup(connection.cursor().execute, f"PRAGMA busy_timeout = {settings.SQLITE_PRAGMAS['busy_timeout']}")
+        with override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234, 'temp_store': 'MEMORY'}):
+            tune_sqlite_connection(sender=None, connection=connections['default'])
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA busy_timeout")
+                self.assertEqual(cursor.fetchone()[0], 1234)
+                cursor.execute("PRAGMA temp_store")
+                self.assertEqual(cursor.fetchone()[0], 2)  # MEMORY
+
+    def test_journal_mode_is_only_changed_when_configured(self):
+        from django.db import connections
+        from .signals import tune_sqlite_connection
+        for journal_mode, expected in (('', False), ('WAL', True)):
+            with override_settings(SQLITE_PRAGMAS={}, SQLITE_JOURNAL_MODE=journal_mode), CaptureQueriesContext(connection) as queries:
+                tune_sqlite_connection(sender=None, connection=connections['default'])
+            self.assertEqual(any('journal_mode' in query['sql'] for query in queries), expected)
+
+
+@override_settings(OPENWEATHERMAP_API_KEY='test-key', EVENTBRITE_API_KEY='test-key')
+class WidgetFragmentCacheTests(TestCase):
+    def setUp(self):
+        caching.clear()
+        geocode = patch('advisor_app.services.geo._fetch_geocode', return_value={'found': False})
+        geocode.start()
+        self.addCleanup(geocode.stop)
+        self.weather = {'main': {'temp': 11, 'feels_like': 10, 'humidity': 80}, 'weather': [{'description': 'rain'}], 'wind': {'speed': 4}}
+        self.events = {'events': [EventSummary('Jazz Night', None, 'https://example.com/jazz', None, None)]}
+
+    def _login(self, username):
+        user = User.objects.create_user(username=username, password='password123')
+        user.profile.location = "London"
+        user.profile.save()
+        self.client.login(username=username, password='password123')
+        return user
+
+    @patch('advisor_app.views.eventbrite_service.get_eventbrite_events')
+    @patch('advisor_app.views.weather_service.get_weather_data')
+    def test_users_in_one_location_share_the_weather_and_events_fragments(self, mock_weather, mock_events):
+        from django.core.cache.utils import make_template_fragment_key
+        from .views import _fingerprint
+        mock_weather.return_value = self.weather
+        mock_events.return_value = self.events
+        self._login('alice')
+        self.client.get(reverse('home'))
+        weather_key = make_template_fragment_key('weather_widget', ["London", _fingerprint(self.weather)])
+        self.assertIn('Rain', cache.get(weather_key))
+        cache.set(weather_key, '<p>cached weather fragment</p>')
+
+        self._login('bob')
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'cached weather fragment')
+        self.assertContains(response, 'Jazz Night')
+
+    @patch('advisor_app.views.eventbrite_service.get_eventbrite_events')
+    @patch('advisor_app.views.weather_service.get_weather_data')
+    def test_new_data_renders_a_new_fragment(self, mock_weather, mock_events):
+        mock_weather.return_value = self.weather
+        mock_events.return_value = self.events
+        self._login('carol')
+        self.client.get(reverse('home'))
+        mock_weather.return_value = dict(self.weather, weather=[{'description': 'snow'}])
+        self.assertContains(self.client.get(reverse('home')), 'Snow')
+
+
+class ProgressiveDashboardTests(TestCase):
+    def setUp(self):
+        caching.clear()
+        user = User.objects.create_user(username='dana', password='password123')
+        user.profile.location = "London"
+        user.profile.save()
+        self.client.login(username='dana', password='password123')
+
+    @override_settings(ADVISOR_PROGRESSIVE_DASHBOARD=True)
+    @patch('advisor_app.views.weather_service.get_weather_data')
+    def test_shell_renders_without_calling_upstreams(self, mock_weather):
+        response = self.client.get(reverse('home'))
+        mock_weather.assert_not_called()
+        self.assertContains(response, reverse('dashboard_widget', args=['weather']))
+        self.assertContains(response, 'dashboard_widgets.js')
+
+    @patch('advisor_app.views.eventbrite_service.get_eventbrite_events')
+    @patch('advisor_app.views.weather_service.get_weather_data')
+    def test_widget_revalidates_with_etag(self, mock_weather, mock_events):
+        mock_weather.return_value = {'main': {'temp': 11}, 'weather': [{'description': 'rain'}], 'dt': 1700000000}
+        response = self.client.get(reverse('dashboard_widget', args=['weather']))
+        self.assertContains(response, 'Rain')
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(response['Last-Modified'], 'Tue, 14 Nov 2023 22:13:20 GMT')
+        mock_events.assert_not_called()
+
+        again = self.client.get(reverse('dashboard_widget', args=['weather']), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b'')
+
+    @override_settings(OPENWEATHERMAP_API_KEY='test-key')
+    @patch('advisor_app.services.weather_service.http_sessions.get_session')
+    def test_cached_widget_revalidates_without_a_fetch(self, mock_session):
+        mock_get = mock_session.return_value.get
+        mock_get.return_value = MagicMock(status_code=200, text='')
+        mock_get.return_value.json.return_value = {'main': {'temp': 11}, 'weather': [{'description': 'rain'}], 'dt': 1700000000}
+        response = self.client.get(reverse('dashboard_widget', args=['weather']))
+        self.assertContains(response, 'Rain')
+        with patch('advisor_app.views.concurrency.submit') as mock_submit:
+            again = self.client.get(reverse('dashboard_widget', args=['weather']), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], response['ETag'])
+        mock_submit.assert_not_called()
+        self.assertEqual(mock_get.call_count, 1)
+
+    def test_unknown_widget_is_404(self):
+        self.assertEqual(self.client.get(reverse('dashboard_widget', args=['stocks'])).status_code, 404)
+
+
 class ViewTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -25,13 +220,11 @@ class ViewTests(TestCase):
         self.assertRedirects(response, f"{reverse('login')}?next=/")
 
     @patch('advisor_app.services.weather_service.get_weather_data')
-    @patch('advisor_app.services.google_calendar_service.get_calendar_events')
     @patch('advisor_app.services.eventbrite_service.get_eventbrite_events')
-    def test_home_view_authenticated(self, mock_eventbrite, mock_calendar, mock_weather):
+    def test_home_view_authenticated(self, mock_eventbrite, mock_weather):
         # Mock API responses
         mock_weather.return_value = {'main': {'temp': 15}, 'weather': [{'description': 'cloudy', 'icon': '04d'}]}
-        mock_calendar.return_value = {'events': [{'summary': 'Test Event'}]}
-        mock_eventbrite.return_value = {'events': [{'name': {'text': 'Local Fair'}}]}
+        mock_eventbrite.return_value = {'events': [EventSummary('Local Fair', None, 'https://example.com/fair', None, None)]}
 
         self.client.login(username='testuser2', password='password123')
         response = self.client.get(reverse('home'))
@@ -39,6 +232,7 @@ class ViewTests(TestCase):
         self.assertTemplateUsed(response, 'advisor_app/home.html')
         self.assertContains(response, "London,UK")
         self.assertContains(response, "cloudy") # From mock weather
+        self.assertContains(response, "Local Fair") # From mock Eventbrite
         # mock_weather.assert_called_once_with("London,UK") # Check service call
 
     def test_profile_view_get(self):
@@ -54,4 +248,959 @@ class ViewTests(TestCase):
         response = self.client.post(reverse('profile'), {'location': new_location})
         self.assertRedirects(response, reverse('profile'))
         self.profile.refresh_from_db()
-        self.assertEqual(self.profile.location, new_location)
\ No newline at end of file
+        self.assertEqual(self.profile.location, new_location)
+
+class DashboardConcurrencyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser3', password='password123')
+        self.user.profile.location = "London,UK"
+        self.user.profile.save()
+        self.client.login(username='testuser3', password='password123')
+
+    @override_settings(ADVISOR_DASHBOARD_DEADLINE=0.2)
+    @patch('advisor_app.services.weather_service.get_weather_data')
+    @patch('advisor_app.services.eventbrite_service.get_eventbrite_events')
+    def test_slow_provider_renders_unavailable_widget(self, mock_eventbrite, mock_weather):
+        release = threading.Event()
+        def slow_events(**kwargs):
+            release.wait(5)
+            return {'events': []}
+        mock_eventbrite.side_effect = slow_events
+        mock_weather.return_value = {'main': {'temp': 15}, 'weather': [{'description': 'cloudy', 'icon': '04d'}]}
+        try:
+            response = self.client.get(reverse('home'))
+        finally:
+            release.set()
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "cloudy")
+        self.assertContains(response, "Local events are temporarily unavailable.")
+
+    @patch('advisor_app.services.weather_service.get_weather_data')
+    @patch('advisor_app.services.eventbrite_service.get_eventbrite_events')
+    def test_fetches_run_concurrently(self, mock_eventbrite, mock_weather):
+        # Each fetch waits for the other to start; run one after another this would deadlock until timeout.
+        barrier = threading.Barrier(2, timeout=5)
+        def weather(location):
+            barrier.wait()
+            return {'main': {'temp': 15}, 'weather': [{'description': 'sunny', 'icon': '01d'}]}
+        def events(**kwargs):
+            barrier.wait()
+            return {'events': []}
+        mock_weather.side_effect = weather
+        mock_eventbrite.side_effect = events
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, "sunny")
+        self.assertNotContains(response, "temporarily unavailable")
+
+    @override_settings(OPENWEATHERMAP_API_KEY='test-key', ADVISOR_DASHBOARD_DEADLINE=0.5)
+    @patch('advisor_app.services.weather_service.get_weather_data')
+    @patch('advisor_app.services.eventbrite_service.get_eventbrite_events')
+    def test_hanging_geocoder_does_not_hold_the_page(self, mock_eventbrite, mock_weather):
+        release = threading.Event()
+        def hang(location, timeout=None):
+            release.wait(5)
+            return {'found': False}
+        mock_weather.return_value = {'main': {'temp': 15}, 'weather': [{'description': 'cloudy', 'icon': '04d'}]}
+        mock_eventbrite.return_value = {'events': []}
+        with patch('advisor_app.services.geo._fetch_geocode', side_effect=hang) as mock_geocode:
+            started = time.monotonic()
+            try:
+                responses = [self.client.get(reverse('home')), self.client.get(reverse('dashboard_widget', args=['weather']))]
+            finally:
+                release.set()
+        self.assertLess(time.monotonic() - started, 2)
+        for response in responses:
+            self.assertContains(response, "cloudy")
+        # Not geocoded yet, so the services get the text location.
+        mock_weather.assert_called_with("London,UK")
+        mock_geocode.assert_not_called()
+
+    @patch('googleapiclient.http.HttpRequest.execute')
+    @patch('advisor_app.services.weather_service.get_weather_data')
+    @patch('advisor_app.services.eventbrite_service.get_eventbrite_events')
+    def test_expired_token_is_refreshed_by_the_calendar_task(self, mock_eventbrite, mock_weather, mock_execute):
+        from google.oauth2.credentials import Credentials
+        mock_weather.return_value = {'main': {'temp': 15}, 'weather': [{'description': 'sunny', 'icon': '01d'}]}
+        mock_eventbrite.return_value = {'events': []}
+        mock_execute.return_value = {'items': [], 'nextSyncToken': 'tok'}
+        self.user.profile.set_google_credentials(Credentials(token='old', refresh_token='r', expiry=datetime.datetime(2000, 1, 1)))
+        refresh_threads = []
+        def fake_refresh(credentials, request):
+            refresh_threads.append(threading.current_thread())
+            credentials.token, credentials.expiry = 'new', datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        with patch('google.oauth2.credentials.Credentials.refresh', autospec=True, side_effect=fake_refresh):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        # The refresh ran on the executor under the page deadline, not inline in the request thread.
+        self.assertEqual(len(refresh_threads), 1)
+        self.assertIsNot(refresh_threads[0], threading.current_thread())
+        self.assertEqual(UserProfile.objects.get(pk=self.user.pk).get_google_credentials().token, 'new')
+
+    @patch('advisor_app.services.weather_service.get_weather_data')
+    @patch('advisor_app.services.eventbrite_service.get_eventbrite_events')
+    def test_rejected_refresh_shows_the_reconnect_state(self, mock_eventbrite, mock_weather):
+        from google.auth.exceptions import RefreshError
+        from google.oauth2.credentials import Credentials
+        mock_weather.return_value = {'main': {'temp': 15}, 'weather': [{'description': 'sunny', 'icon': '01d'}]}
+        mock_eventbrite.return_value = {'events': []}
+        self.user.profile.set_google_credentials(Credentials(token='old', refresh_token='r', expiry=datetime.datetime(2000, 1, 1)))
+        with patch('google.oauth2.credentials.Credentials.refresh', side_effect=RefreshError('invalid_grant')):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, "Connect to Google Calendar")
+        self.assertFalse(UserProfile.objects.get(pk=self.user.pk).has_google_credentials)
+
+
+@override_settings(OPENWEATHERMAP_API_KEY='test-key', WEATHER_CACHE_TTL=600, WEATHER_CACHE_STALE_TTL=600, WEATHER_NEGATIVE_CACHE_TTL=60)
+class WeatherCacheTests(TestCase):
+    def setUp(self):
+        caching.clear()
+        resilience.reset_all()
+
+    def _response(self, status_code=200, payload=None):
+        response = MagicMock(status_code=status_code, text='')
+        response.json.return_value = payload or {'main': {'temp': 15}, 'weather': [{'description': 'cloudy'}]}
+        if status_code >= 400:
+            import requests
+            response.raise_for_status.side_effect = requests.exceptions.HTTPError(response=response)
+        return response
+
+    @patch('advisor_app.services.weather_service.http_sessions.get_session')
+    def test_equivalent_locations_share_cache_entry(self, mock_session):
+        mock_get = mock_session.return_value.get
+        mock_get.return_value = self._response()
+        weather_service.get_weather_data("London,UK")
+        result = weather_service.get_weather_data("  london , uk ")
+        self.assertEqual(result['main']['temp'], 15)
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('advisor_app.services.weather_service.http_sessions.get_session')
+    def test_batch_uses_group_endpoint_for_city_ids(self, mock_session):
+        mock_get = mock_session.return_value.get
+        mock_get.return_value = self._response(payload={'cnt': 2, 'list': [
+            {'id': 2643743, 'name': 'London', 'main': {'temp': 12}},
+            {'id': 2988507, 'name': 'Paris', 'main': {'temp': 14}},
+        ]})
+        result = weather_service.get_weather_batch([2643743, 2988507, 2643743, 1])
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertTrue(mock_get.call_args.args[0].endswith('/group'))
+        self.assertEqual(mock_get.call_args.kwargs['params']['id'], '2643743,2988507,1')
+        self.assertEqual(result[2988507]['name'], 'Paris')
+        self.assertEqual(result[1]['status'], 404)
+        # Each city is cached on its own, so the next batch is served without a call.
+        weather_service.get_weather_batch([2643743, 2988507])
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('advisor_app.services.weather_service.http_sessions.get_session')
+    def test_batch_dedupes_names_and_skips_cached_ones(self, mock_session):
+        mock_get = mock_session.return_value.get
+        mock_get.return_value = self._response()
+        weather_service.get_weather_data("Paris,FR")
+        result = weather_service.get_weather_batch(["London,UK", " london , uk", "paris,fr", ""])
+        self.assertEqual(mock_get.call_count, 2)  # Paris was already cached; London is fetched once.
+        self.assertEqual(result[" london , uk"]['main']['temp'], 15)
+        self.assertIn('error', result[""])
+
+    @patch('advisor_app.services.weather_service.http_sessions.get_session')
+    def test_city_not_found_is_negatively_cached(self, mock_session):
+        mock_get = mock_session.return_value.get
+        mock_get.return_value = self._response(status_code=404)
+        first = weather_service.get_weather_data("Atlantis")
+        second = weather_service.get_weather_data("Atlantis")
+        self.assertIn("City not found", first['error'])
+        self.assertEqual(first, second)
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('advisor_app.services.weather_service.http_sessions.get_session')
+    def test_transient_errors_are_not_cached(self, mock_session):
+        mock_get = mock_session.return_value.get
+        mock_get.return_value = self._response(status_code=503)
+        weather_service.get_weather_data("Paris,FR")
+        weather_service.get_weather_data("Paris,FR")
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('advisor_app.services.weather_service.http_sessions.get_session')
+    def test_concurrent_misses_coalesce(self, mock_session):
+        mock_get = mock_session.return_value.get
+        release = threading.Event()
+        def slow_get(*args, **kwargs):
+            release.wait(5)
+            return self._response()
+        mock_get.side_effect = slow_get
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(weather_service.get_weather_data("Mumbai"))) for _ in range(5)]
+        for t in threads: t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads: t.join(5)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(mock_get.call_count, 1)
+
+    @override_settings(OPENWEATHERMAP_API_URL='http://127.0.0.1:8765/weather/data/2.5')
+    @patch('advisor_app.services.weather_service.http_sessions.get_session')
+    def test_base_url_is_configurable(self, mock_session):
+        mock_get = mock_session.return_value.get
+        mock_get.return_value = self._response()
+        weather_service.get_weather_data("Lima")
+        self.assertEqual(mock_get.call_args.args[0], 'http://127.0.0.1:8765/weather/data/2.5/weather')
+
+    @override_settings(WEATHER_CACHE_TTL=0)
+    @patch('advisor_app.services.weather_service.http_sessions.get_session')
+    def test_stale_value_served_while_revalidating(self, mock_session):
+        mock_get = mock_session.return_value.get
+        mock_get.return_value = self._response(payload={'main': {'temp': 1}, 'weather': []})
+        weather_service.get_weather_data("Oslo")
+        mock_get.return_value = self._response(payload={'main': {'temp': 2}, 'weather': []})
+        stale = weather_service.get_weather_data("Oslo")
+        self.assertEqual(stale['main']['temp'], 1)
+        for _ in range(50):
+            if mock_get.call_count == 2: break
+            time.sleep(0.02)
+        self.assertEqual(mock_get.call_count, 2)
+
+
+class TwoTierCacheTests(TestCase):
+    def setUp(self):
+        caching.clear()
+        metrics.reset()
+
+    def test_local_tier_serves_repeat_lookups_without_the_shared_backend(self):
+        fetch = MagicMock(return_value={'main': {'temp': 9}})
+        key = caching.make_key('weather', 'tier-test')
+        caching.get_or_fetch(key, fetch, ttl_for=lambda value: 60)
+        with patch('advisor_app.services.caching.cache.get') as shared_get:
+            value = caching.get_or_fetch(key, fetch, ttl_for=lambda value: 60)
+        shared_get.assert_not_called()
+        value['main']['temp'] = 100  # Callers get their own copy.
+        self.assertEqual(caching.get_or_fetch(key, fetch, ttl_for=lambda value: 60)['main']['temp'], 9)
+        self.assertEqual(fetch.call_count, 1)
+        stats = caching.stats()['weather']
+        self.assertEqual((stats['miss'], stats['local']), (1, 2))
+        self.assertAlmostEqual(stats['hit_ratio'], 2 / 3)
+
+    def test_local_cache_evicts_least_recently_used_by_size(self):
+        local = caching.LocalCache(max_bytes=1000, max_ttl=60)
+        for name in ('a', 'b', 'c', 'd'):
+            local.set(name, 'x' * 200, 60)
+        local.get('a')
+        local.set('e', 'x' * 200, 60)  # Over budget: 'b' is the least recently used.
+        self.assertIsNone(local.get('b'))
+        self.assertEqual(local.get('a'), 'x' * 200)
+        self.assertLessEqual(local.size_bytes, 1000)
+        local.set('huge', 'x' * 600, 60)  # Larger than a quarter of the budget: not kept.
+        self.assertIsNone(local.get('huge'))
+
+    @override_settings(OPENWEATHERMAP_API_KEY='test-key')
+    @patch('advisor_app.services.geo._fetch_geocode', return_value={'found': False})
+    def test_location_change_drops_cached_errors_for_the_new_location(self, mock_geocode):
+        error_key, _ = weather_service._cache_key('Atlantis', 'metric', None, None)
+        events_key = eventbrite_service._cache_key('Atlantis', None, None)
+        caching.store(error_key, {'error': 'City not found.'}, lambda value: 120)
+        caching.store(events_key, {'events': []}, lambda value: 600)
+        User.objects.create_user(username='mover', password='password123')
+        self.client.login(username='mover', password='password123')
+        self.client.post(reverse('profile'), {'location': 'Atlantis'})
+        self.assertIsNone(cache.get(error_key))
+        self.assertIsNone(caching.local.get(error_key))
+        self.assertEqual(cache.get(events_key)['value'], {'events': []})
+
+class HttpSessionRegistryTests(TestCase):
+    def tearDown(self):
+        http_sessions.close_all()
+
+    def test_sessions_are_reused_per_provider(self):
+        self.assertIs(http_sessions.get_session('weather'), http_sessions.get_session('weather'))
+        self.assertIsNot(http_sessions.get_session('weather'), http_sessions.get_session('eventbrite'))
+
+    @override_settings(HTTP_MAX_RETRIES=3, HTTP_POOL_MAXSIZE=7)
+    def test_adapter_pools_and_retries_on_rate_limits(self):
+        adapter = http_sessions.get_session('weather').get_adapter('https://api.openweathermap.org/')
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertEqual(adapter.max_retries.total, 3)
+        self.assertIn(429, adapter.max_retries.status_forcelist)
+        self.assertFalse(adapter.max_retries.is_retry('POST', 503))
+
+    def test_backoff_is_jittered_below_exponential_ceiling(self):
+        from urllib3.util.retry import RequestHistory
+        history = tuple(RequestHistory('GET', '/', None, 503, None) for _ in range(3))
+        ceiling = http_sessions.Retry(total=5, backoff_factor=1.0, history=history).get_backoff_time()
+        retry = http_sessions.JitteredRetry(total=5, backoff_factor=1.0, history=history)
+        delays = {retry.get_backoff_time() for _ in range(20)}
+        self.assertTrue(all(0 <= delay <= ceiling for delay in delays))
+        self.assertGreater(len(delays), 1)
+
+    @override_settings(HTTP_RETRY_AFTER_MAX=2)
+    def test_long_retry_after_is_not_waited_for(self):
+        import asyncio
+        import httpx
+        from urllib3.exceptions import MaxRetryError
+        from urllib3.response import HTTPResponse
+        retry = http_sessions.JitteredRetry(total=2, status_forcelist=[429], raise_on_status=False)
+        with self.assertRaises(MaxRetryError):  # urllib3 then returns the 429 response without sleeping.
+            retry.increment('GET', '/', response=HTTPResponse(status=429, headers={'Retry-After': '3600'}))
+        retry.increment('GET', '/', response=HTTPResponse(status=429, headers={'Retry-After': '1'}))
+
+        client = MagicMock()
+        client.request = AsyncMock(return_value=httpx.Response(429, headers={'Retry-After': '3600'}))
+        with patch('advisor_app.services.http_sessions.get_async_client', return_value=client), \
+                patch('asyncio.sleep', new_callable=AsyncMock) as sleep:
+            response = asyncio.run(http_sessions.async_request('weather', 'GET', 'https://example.com/'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(client.request.await_count, 1)
+        sleep.assert_not_awaited()
+
+
+class CalendarResourceTests(TestCase):
+    def test_events_resource_is_built_once(self):
+        self.assertIs(google_calendar_service.get_events_resource(), google_calendar_service.get_events_resource())
+
+    @patch('googleapiclient.http.HttpRequest.execute')
+    def test_events_are_listed_with_per_credential_http(self, mock_execute):
+        from google.oauth2.credentials import Credentials
+        mock_execute.return_value = {'items': [{'summary': 'Standup'}]}
+        credentials = Credentials(token='abc')
+        result = google_calendar_service.sync_calendar_events(credentials)
+        self.assertEqual(result['items'], [{'summary': 'Standup'}])
+        bound_http = mock_execute.call_args.kwargs['http']
+        self.assertIs(bound_http.credentials, credentials)
+
+
+class CalendarStoreTests(TestCase):
+    def setUp(self):
+        from google.oauth2.credentials import Credentials
+        self.user = User.objects.create_user(username='calendaruser', password='password123')
+        self.user.profile.set_google_credentials(Credentials(token='abc', refresh_token='refresh'))
+        self.client.login(username='calendaruser', password='password123')
+
+    def _event(self, event_id, days_ahead, summary='Event', status='confirmed'):
+        start = timezone.now() + datetime.timedelta(days=days_ahead)
+        return {'id': event_id, 'summary': summary, 'status': status,
+                'start': {'dateTime': start.isoformat()},
+                'end': {'dateTime': (start + datetime.timedelta(hours=1)).isoformat()}}
+
+    def _window(self):
+        return (timezone.now(), timezone.now() + datetime.timedelta(days=14))
+
+    @patch('advisor_app.services.google_calendar_service.sync_calendar_events')
+    def test_store_is_served_within_ttl(self, mock_sync):
+        mock_sync.return_value = {'items': [self._event('a', 1, 'Dentist')], 'next_sync_token': 'tok1', 'full_sync': True, 'window': self._window()}
+        self.assertContains(self.client.get(reverse('home')), 'Dentist')
+        self.assertContains(self.client.get(reverse('home')), 'Dentist')
+        self.assertEqual(mock_sync.call_count, 1)
+        self.assertEqual(CalendarEventCache.objects.get(profile=self.user.profile).sync_token, 'tok1')
+
+    @override_settings(GOOGLE_CALENDAR_SYNC_TTL=0)
+    @patch('advisor_app.services.google_calendar_service.sync_calendar_events')
+    def test_incremental_sync_applies_changes(self, mock_sync):
+        mock_sync.return_value = {'items': [self._event('a', 1, 'Dentist'), self._event('b', 2, 'Gym')], 'next_sync_token': 'tok1', 'full_sync': True, 'window': self._window()}
+        self.client.get(reverse('home'))
+        mock_sync.return_value = {'items': [self._event('a', 1, status='cancelled'), self._event('c', 3, 'Concert')], 'next_sync_token': 'tok2', 'full_sync': False, 'window': None}
+        response = self.client.get(reverse('home'))
+        self.assertEqual(mock_sync.call_args.kwargs, {'sync_token': 'tok1'})
+        self.assertNotContains(response, 'Dentist')
+        self.assertContains(response, 'Gym')
+        self.assertContains(response, 'Concert')
+
+    @patch('googleapiclient.http.HttpRequest.execute', autospec=True)
+    def test_expired_sync_token_falls_back_to_full_sync(self, mock_execute):
+        import httplib2
+        from googleapiclient.errors import HttpError
+        from google.oauth2.credentials import Credentials
+        def execute(request, http=None):
+            if 'syncToken=stale' in request.uri:
+                raise HttpError(httplib2.Response({'status': 410}), b'{"error": {"message": "Gone"}}')
+            return {'items': [self._event('a', 1)], 'nextSyncToken': 'fresh'}
+        mock_execute.side_effect = execute
+        result = google_calendar_service.sync_calendar_events(Credentials(token='abc'), sync_token='stale')
+        self.assertTrue(result['full_sync'])
+        self.assertEqual(result['next_sync_token'], 'fresh')
+        self.assertEqual(mock_execute.call_count, 2)
+
+
+class GoogleCredentialsMemoizationTests(TestCase):
+    def setUp(self):
+        from google.oauth2.credentials import Credentials
+        self.Credentials = Credentials
+        self.user = User.objects.create_user(username='credsuser', password='password123')
+        self.profile = self.user.profile
+        self.profile.set_google_credentials(Credentials(token='first', refresh_token='r'))
+        self.profile = UserProfile.objects.get(pk=self.user.pk)
+
+    def test_credentials_are_decoded_once_per_instance(self):
+        with patch('advisor_app.models.json.loads', wraps=json.loads) as mock_loads:
+            first = self.profile.get_google_credentials()
+            second = self.profile.get_google_credentials()
+            self.assertTrue(self.profile.has_valid_google_credentials)
+        self.assertIs(first, second)
+        self.assertEqual(mock_loads.call_count, 1)
+
+    def test_set_google_credentials_invalidates_cache(self):
+        self.assertEqual(self.profile.get_google_credentials().token, 'first')
+        self.profile.set_google_credentials(self.Credentials(token='second'))
+        self.assertEqual(self.profile.get_google_credentials().token, 'second')
+        self.profile.clear_google_credentials()
+        self.assertIsNone(self.profile.get_google_credentials())
+        self.assertFalse(UserProfile.objects.get(pk=self.user.pk).has_google_credentials)
+
+    @override_settings(GOOGLE_CREDENTIALS_LRU_SIZE=4)
+    def test_process_lru_shares_decoded_credentials_across_instances(self):
+        from .models import credentials_lru
+        credentials_lru.clear()
+        first = UserProfile.objects.get(pk=self.user.pk).get_google_credentials()
+        with patch('advisor_app.models.json.loads', wraps=json.loads) as mock_loads:
+            second = UserProfile.objects.get(pk=self.user.pk).get_google_credentials()
+        self.assertEqual(mock_loads.call_count, 0)
+        self.assertEqual(second.token, 'first')
+        # Each hit is a fresh object, so one request refreshing its copy can't change another's.
+        self.assertIsNot(first, second)
+        first.token = 'mutated'
+        self.assertEqual(UserProfile.objects.get(pk=self.user.pk).get_google_credentials().token, 'first')
+        credentials_lru.clear()
+
+
+class EncryptedCredentialStorageTests(TestCase):
+    def setUp(self):
+        from google.oauth2.credentials import Credentials
+        self.user = User.objects.create_user(username='vault', password='password123')
+        self.user.profile.set_google_credentials(Credentials(
+            token='secret-access-token', refresh_token='secret-refresh-token',
+            expiry=datetime.datetime(2030, 1, 1, 12, 0)))
+
+    def test_payload_is_encrypted_and_bound_to_the_profile(self):
+        from .credential_codec import CredentialDecodeError, decode
+        from .models import GoogleCredential
+        row = GoogleCredential.objects.get(pk=self.user.pk)
+        self.assertNotIn(b'secret-access-token', bytes(row.payload))
+        self.assertEqual(row.expiry, datetime.datetime(2030, 1, 1, 12, 0, tzinfo=datetime.timezone.utc))
+        self.assertTrue(row.has_refresh_token)
+        self.assertEqual(json.loads(row.credentials_json())['token'], 'secret-access-token')
+        with self.assertRaises(CredentialDecodeError):
+            decode(row.payload, self.user.pk + 1)
+
+    def test_profile_loads_without_the_credentials(self):
+        with CaptureQueriesContext(connection) as queries:
+            profile = UserProfile.objects.get(pk=self.user.pk)
+        self.assertNotIn('payload', queries[0]['sql'])
+        self.assertEqual(profile.get_google_credentials().refresh_token, 'secret-refresh-token')
+
+
+class CredentialMigrationTests(TransactionTestCase):
+    def _migrate_legacy_profiles(self, blobs):
+        """Creates a pre-0005 profile per blob (users legacy0, legacy1, ...), migrates, and returns the profiles by username."""
+        from django.db.migrations.executor import MigrationExecutor
+        before, after = [('advisor_app', '0004_geocoding')], [('advisor_app', '0006_remove_userprofile_google_credentials_json')]
+        executor = MigrationExecutor(connection)
+        executor.migrate(before)
+        old_apps = executor.loader.project_state(before).apps
+        OldUser, OldProfile = old_apps.get_model('auth', 'User'), old_apps.get_model('advisor_app', 'UserProfile')
+        for i, blob in enumerate(blobs):
+            OldProfile.objects.create(user=OldUser.objects.create(username=f'legacy{i}'), google_credentials_json=blob)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(after)
+        return {p.user.username: p for p in UserProfile.objects.select_related('user')}
+
+    def test_existing_json_is_moved_into_encrypted_rows(self):
+        profiles = self._migrate_legacy_profiles(
+            ['{"token": "t0", "refresh_token": "r", "expiry": "2030-01-01T00:00:00Z"}', '{"token": "t1"}', 'not json', None])
+        self.assertEqual(profiles['legacy0'].get_google_credentials().token, 't0')
+        self.assertEqual(profiles['legacy0'].google_credential.expiry.year, 2030)
+        self.assertFalse(profiles['legacy1'].google_credential.has_refresh_token)
+        self.assertFalse(profiles['legacy2'].has_google_credentials)
+        self.assertFalse(profiles['legacy3'].has_google_credentials)
+
+    def test_json_that_is_not_an_object_is_skipped(self):
+        profiles = self._migrate_legacy_profiles(['null', '[]', '"x"', '{"token": "t3"}'])
+        for username in ('legacy0', 'legacy1', 'legacy2'):
+            self.assertFalse(profiles[username].has_google_credentials)
+        self.assertEqual(profiles['legacy3'].get_google_credentials().token, 't3')
+
+
+class TokenRefresherTests(TestCase):
+    def _user_with_credentials(self, username, expires_in_minutes):
+        from google.oauth2.credentials import Credentials
+        user = User.objects.create_user(username=username, password='password123')
+        expiry = datetime.datetime.utcnow() + datetime.timedelta(minutes=expires_in_minutes)
+        user.profile.set_google_credentials(Credentials(token=f'{username}-old', refresh_token='r', expiry=expiry))
+        return user
+
+    def _stored_token(self, user):
+        return UserProfile.objects.get(pk=user.pk).get_google_credentials()
+
+    def test_command_refreshes_only_expiring_tokens(self):
+        from django.core.management import call_command
+        from io import StringIO
+        expiring = self._user_with_credentials('expiring', 5)
+        healthy = self._user_with_credentials('healthy', 600)
+
+        def fake_refresh(credentials, request):
+            credentials.token = 'new-token'
+            credentials.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        with patch('google.oauth2.credentials.Credentials.refresh', autospec=True, side_effect=fake_refresh) as mock_refresh:
+            out = StringIO()
+            call_command('refresh_google_tokens', '--window=900', '--batch-size=1', stdout=out)
+        self.assertEqual(mock_refresh.call_count, 1)
+        self.assertIn('Refreshed 1', out.getvalue())
+        self.assertEqual(self._stored_token(expiring).token, 'new-token')
+        self.assertEqual(self._stored_token(healthy).token, 'healthy-old')
+
+    def test_revoked_tokens_are_cleared(self):
+        from google.auth.exceptions import RefreshError
+        from .services import token_refresher
+        revoked = self._user_with_credentials('revoked', -5)
+        with patch('google.oauth2.credentials.Credentials.refresh', side_effect=RefreshError('invalid_grant')):
+            stats = token_refresher.refresh_expiring_credentials(window_seconds=60)
+        self.assertEqual(stats['revoked'], 1)
+        self.assertFalse(UserProfile.objects.get(pk=revoked.pk).has_google_credentials)
+
+
+@override_settings(OPENWEATHERMAP_API_KEY='test-key', EVENTBRITE_API_KEY='test-key')
+class PrewarmCommandTests(TestCase):
+    def setUp(self):
+        caching.clear()
+        resilience.reset_all()
+        for username, location in [('a', 'London,UK'), ('b', 'london, uk'), ('c', 'Paris,FR'), ('d', '')]:
+            user = User.objects.create_user(username=username, password='password123')
+            user.profile.location = location
+            user.profile.save()
+
+    @patch('advisor_app.services.geo._fetch_geocode', return_value={'found': False})
+    @patch('advisor_app.services.eventbrite_service._fetch_eventbrite_events', return_value={'events': []})
+    @patch('advisor_app.services.weather_service._fetch_weather_data', return_value={'main': {'temp': 10}, 'weather': []})
+    def test_prewarm_fetches_each_distinct_location_once(self, mock_weather, mock_events, mock_geocode):
+        from django.core.management import call_command
+        from io import StringIO
+        call_command('prewarm_advisor', '--rate=0', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(mock_weather.call_count, 2)
+        self.assertEqual(mock_events.call_count, 2)
+        # Dashboard reads are now served from the warmed cache.
+        weather_service.get_weather_data('Paris,FR')
+        self.assertEqual(mock_weather.call_count, 2)
+
+    @patch('advisor_app.services.geo._fetch_geocode', return_value={'found': True, 'lat': 51.5073, 'lon': -0.1276, 'name': 'London', 'country': 'GB'})
+    @patch('advisor_app.services.eventbrite_service._fetch_eventbrite_events', return_value={'events': []})
+    @patch('advisor_app.services.weather_service._fetch_weather_data', return_value={'main': {'temp': 10}, 'weather': []})
+    def test_prewarm_geocodes_profiles_without_coordinates(self, mock_weather, mock_events, mock_geocode):
+        from django.core.management import call_command
+        from io import StringIO
+        call_command('prewarm_advisor', '--rate=0', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(mock_geocode.call_count, 2)  # One lookup per distinct spelling.
+        self.assertEqual(UserProfile.objects.get(user__username='b').coordinates, (51.5073, -0.1276))
+        self.assertIsNone(UserProfile.objects.get(user__username='d').coordinates)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    @patch('advisor_app.services.weather_service._fetch_weather_data')
+    def test_prewarm_refuses_a_process_local_cache(self, mock_weather):
+        from django.core.management import call_command, CommandError
+        from io import StringIO
+        with self.assertRaisesMessage(CommandError, 'process-local'):
+            call_command('prewarm_advisor', '--rate=0', stdout=StringIO(), stderr=StringIO())
+        mock_weather.assert_not_called()
+
+
+@override_settings(OPENWEATHERMAP_API_KEY='test-key', EVENTBRITE_API_KEY='test-key')
+class DashboardSnapshotTests(TestCase):
+    def setUp(self):
+        caching.clear()
+        resilience.reset_all()
+        self.users = []
+        for username, location in [('a', 'London,UK'), ('b', 'london, uk'), ('c', 'Paris,FR'), ('d', '')]:
+            user = User.objects.create_user(username=username, password='password123')
+            user.profile.location = location
+            user.profile.save()
+            self.users.append(user)
+
+    @patch('advisor_app.services.eventbrite_service._fetch_eventbrite_events', return_value={'events': [EventSummary('Gig', None, 'https://example.com', None, None)]})
+    @patch('advisor_app.services.weather_service._fetch_weather_data', return_value={'main': {'temp': 10}, 'weather': []})
+    def test_command_streams_one_line_per_user_sharing_location_fetches(self, mock_weather, mock_events):
+        from django.core.management import call_command
+        from io import StringIO
+        out = StringIO()
+        with self.assertNumQueries(1):  # Profiles, credentials and calendar stores in one query.
+            call_command('export_dashboard_snapshots', *[str(user.pk) for user in self.users], '999999', stdout=out, stderr=StringIO())
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([line['user_id'] for line in lines], [user.pk for user in self.users] + [999999])
+        self.assertEqual(mock_weather.call_count, 2)
+        self.assertEqual(mock_events.call_count, 2)
+        self.assertEqual(lines[1]['weather']['main']['temp'], 10)
+        self.assertEqual(lines[1]['events']['events'][0]['name'], 'Gig')
+        self.assertIsNone(lines[3]['weather'])
+        self.assertEqual(lines[0]['calendar'], {'connected': False, 'events': None})
+        self.assertIn('error', lines[4])
+
+    @patch('advisor_app.services.google_calendar_service.sync_calendar_events')
+    def test_calendars_are_synced_into_the_store(self, mock_sync):
+        from google.oauth2.credentials import Credentials
+        from .services.dashboard_snapshots import build_dashboard_snapshots
+        user = self.users[3]
+        user.profile.set_google_credentials(Credentials(token='abc', refresh_token='refresh'))
+        start = timezone.now() + datetime.timedelta(days=1)
+        event = {'id': 'e1', 'summary': 'Dentist', 'status': 'confirmed', 'start': {'dateTime': start.isoformat()},
+                 'end': {'dateTime': (start + datetime.timedelta(hours=1)).isoformat()}}
+        mock_sync.return_value = {'items': [event], 'next_sync_token': 'tok1', 'full_sync': True,
+                                  'window': (timezone.now(), timezone.now() + datetime.timedelta(days=14))}
+        snapshot, = build_dashboard_snapshots([user.pk])
+        self.assertEqual(snapshot['calendar']['events'][0]['summary'], 'Dentist')
+        self.assertEqual(CalendarEventCache.objects.get(profile=user.profile).sync_token, 'tok1')
+        snapshot, = build_dashboard_snapshots([user.pk])  # Fresh store: no second sync.
+        self.assertEqual(mock_sync.call_count, 1)
+        self.assertEqual(snapshot['calendar']['events'][0]['id'], 'e1')
+
+
+@override_settings(OPENWEATHERMAP_API_KEY='test-key', EVENTBRITE_API_KEY='test-key', GEO_CELL_PRECISION=5)
+class GeoBucketingTests(TestCase):
+    def setUp(self):
+        caching.clear()
+        resilience.reset_all()
+
+    def test_geohash_matches_reference_encoding(self):
+        self.assertEqual(geo.geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        cell, latitude, longitude = geo.snap(57.64911, 10.40744)
+        self.assertEqual(cell, 'u4pru')
+        self.assertEqual(geo.geohash(latitude, longitude, 5), cell)
+
+    @patch('advisor_app.services.eventbrite_service._fetch_eventbrite_events', return_value={'events': []})
+    @patch('advisor_app.services.weather_service._fetch_weather_data', return_value={'main': {'temp': 10}, 'weather': []})
+    def test_nearby_coordinates_share_one_upstream_call(self, mock_weather, mock_events):
+        weather_service.get_weather_data('Mumbai', latitude=19.0760, longitude=72.8777)
+        weather_service.get_weather_data('mumbai, IN', latitude=19.0765, longitude=72.8770)
+        eventbrite_service.get_eventbrite_events(latitude=19.0760, longitude=72.8777)
+        eventbrite_service.get_eventbrite_events(latitude=19.0765, longitude=72.8770)
+        self.assertEqual(mock_weather.call_count, 1)
+        self.assertEqual(mock_events.call_count, 1)
+        # Upstreams are queried with the cell centre, not the user's own point.
+        self.assertEqual(mock_weather.call_args.args[3], geo.snap(19.0760, 72.8777)[1:])
+
+    @patch('advisor_app.services.geo._fetch_geocode', return_value={'found': True, 'lat': 51.5073, 'lon': -0.1276, 'name': 'London', 'country': 'GB'})
+    def test_location_is_geocoded_once_and_stored(self, mock_geocode):
+        from .models import GeocodedLocation
+        user = User.objects.create_user(username='geo', password='password123')
+        self.client.login(username='geo', password='password123')
+        self.client.post(reverse('profile'), {'location': 'London'})
+        other = User.objects.create_user(username='geo2', password='password123')
+        self.client.login(username='geo2', password='password123')
+        self.client.post(reverse('profile'), {'location': ' london '})
+
+        self.assertEqual(mock_geocode.call_count, 1)
+        self.assertEqual(GeocodedLocation.objects.get().query, 'london')
+        self.assertEqual(UserProfile.objects.get(pk=user.pk).coordinates, (51.5073, -0.1276))
+        self.assertEqual(UserProfile.objects.get(pk=other.pk).coordinates, (51.5073, -0.1276))
+
+
+class AsyncDashboardTests(TestCase):
+    def setUp(self):
+        caching.clear()
+        resilience.reset_all()
+        self.user = User.objects.create_user(username='asyncuser', password='password123')
+        self.user.profile.location = "London,UK"
+        self.user.profile.save()
+
+    def test_async_home_view_anonymous_redirects_to_login(self):
+        response = self.client.get(reverse('home_async'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response['Location'])
+
+    @patch('advisor_app.services.weather_service.get_weather_data_async', new_callable=AsyncMock)
+    @patch('advisor_app.services.eventbrite_service.get_eventbrite_events_async', new_callable=AsyncMock)
+    def test_async_home_view_renders_awaited_results(self, mock_eventbrite, mock_weather):
+        mock_weather.return_value = {'main': {'temp': 15}, 'weather': [{'description': 'drizzle', 'icon': '09d'}]}
+        mock_eventbrite.return_value = {'events': []}
+        self.client.login(username='asyncuser', password='password123')
+        response = self.client.get(reverse('home_async'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'drizzle')
+        mock_weather.assert_awaited_once_with('London,UK')
+
+    @override_settings(OPENWEATHERMAP_API_KEY='test-key', EVENTBRITE_API_KEY='test-key')
+    def test_async_home_view_closes_its_clients_under_wsgi(self):
+        import httpx
+        clients = []
+        get_async_client = http_sessions.get_async_client
+        def tracked(name):
+            client = get_async_client(name)
+            clients.append(client)
+            return client
+        transport = httpx.MockTransport(lambda request: httpx.Response(
+            200, json={'main': {'temp': 15}, 'weather': [{'description': 'drizzle', 'icon': '09d'}]}))
+        self.client.login(username='asyncuser', password='password123')
+        with patch('advisor_app.services.http_sessions.httpx.AsyncHTTPTransport', return_value=transport), \
+                patch('advisor_app.services.http_sessions.get_async_client', side_effect=tracked):
+            response = self.client.get(reverse('home_async'))  # WSGI: a fresh event loop per request.
+        self.assertContains(response, 'drizzle')
+        self.assertTrue(clients)
+        self.assertTrue(all(client.is_closed for client in clients))
+
+    @override_settings(ADVISOR_PROGRESSIVE_DASHBOARD=True)
+    @patch('advisor_app.services.weather_service.get_weather_data_async', new_callable=AsyncMock)
+    def test_async_home_view_renders_the_progressive_shell(self, mock_weather):
+        self.client.login(username='asyncuser', password='password123')
+        response = self.client.get(reverse('home_async'))
+        mock_weather.assert_not_awaited()
+        self.assertContains(response, reverse('dashboard_widget', args=['weather']))
+        self.assertContains(response, 'dashboard_widgets.js')
+
+    @override_settings(OPENWEATHERMAP_API_KEY='test-key')
+    @patch('advisor_app.services.http_sessions.async_request', new_callable=AsyncMock)
+    def test_async_weather_client_shares_cache_with_sync_client(self, mock_request):
+        import asyncio
+        import httpx
+        mock_request.return_value = httpx.Response(200, json={'main': {'temp': 21}, 'weather': []})
+        result = asyncio.run(weather_service.get_weather_data_async('Rome,IT'))
+        self.assertEqual(result['main']['temp'], 21)
+        with patch('advisor_app.services.weather_service.http_sessions.get_session') as mock_session:
+            self.assertEqual(weather_service.get_weather_data('rome, it')['main']['temp'], 21)
+            mock_session.assert_not_called()
+
+    def test_cancelled_leader_releases_waiting_followers(self):
+        import asyncio
+
+        async def scenario():
+            async def slow_fetch():
+                await asyncio.sleep(10)
+            leader = asyncio.ensure_future(caching._async_single_flight('flight', slow_fetch))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(caching._async_single_flight('flight', slow_fetch))
+            await asyncio.sleep(0)
+            leader.cancel()  # As home_view_async does at the page deadline.
+            with self.assertRaises(caching.FlightCancelled):
+                await asyncio.wait_for(follower, timeout=1)
+            self.assertTrue(leader.cancelled())
+
+        asyncio.run(scenario())
+
+
+@override_settings(EVENTBRITE_API_KEY='test-key', EVENTBRITE_MAX_EVENTS=3, EVENTBRITE_MAX_PAGES=2, EVENTBRITE_EXPAND='')
+class EventbriteCompactionTests(TestCase):
+    def setUp(self):
+        caching.clear()
+        resilience.reset_all()
+
+    def _page(self, count, has_more):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {
+            'events': [{
+                'name': {'text': f'Event {i}'}, 'url': f'https://example.com/{i}',
+                'start': {'local': '2030-01-01T19:30:00'}, 'description': {'html': 'x' * 10000},
+                'venue': {'name': 'Hall', 'address': {'localized_address_display': '1 Main St'}},
+            } for i in range(count)],
+            'pagination': {'has_more_items': has_more},
+        }
+        return response
+
+    @patch('advisor_app.services.eventbrite_service.http_sessions.get_session')
+    def test_events_are_compacted_paginated_and_limited(self, mock_session):
+        mock_get = mock_session.return_value.get
+        mock_get.side_effect = [self._page(2, True), self._page(2, True)]
+        events = eventbrite_service.get_eventbrite_events(location_address='Berlin')['events']
+        self.assertEqual(len(events), 3)
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(events[0], EventSummary('Event 0', datetime.datetime(2030, 1, 1, 19, 30), 'https://example.com/0', 'Hall', '1 Main St'))
+        self.assertNotIn('expand', mock_get.call_args.kwargs['params'])
+
+
+@override_settings(OPENWEATHERMAP_API_KEY='test-key', CIRCUIT_BREAKER_MIN_REQUESTS=3, CIRCUIT_BREAKER_FAILURE_RATE=0.5,
+                   CIRCUIT_BREAKER_OPEN_SECONDS=30, ADAPTIVE_TIMEOUT_FLOOR=0.5, ADAPTIVE_TIMEOUT_MULTIPLIER=2.0)
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        caching.clear()
+        resilience.reset_all()
+
+    @patch('advisor_app.services.weather_service.http_sessions.get_session')
+    def test_open_circuit_fails_fast(self, mock_session):
+        import requests
+        mock_get = mock_session.return_value.get
+        mock_get.side_effect = requests.exceptions.Timeout()
+        for city in ("A", "B", "C"):
+            self.assertTrue(weather_service.get_weather_data(city)['transient'])
+        result = weather_service.get_weather_data("D")
+        self.assertTrue(result['circuit_open'])
+        self.assertIn("temporarily unavailable", result['error'])
+        self.assertEqual(mock_get.call_count, 3)
+
+    @override_settings(CIRCUIT_BREAKER_OPEN_SECONDS=0)
+    def test_half_open_probe_closes_on_success(self):
+        breaker = resilience.get_breaker('test', max_timeout=10)
+        for _ in range(3):
+            breaker.record(False, 0.1)
+        self.assertEqual(breaker.state, resilience.OPEN)
+        self.assertTrue(breaker.allow())  # The probe.
+        self.assertFalse(breaker.allow())  # Only one probe at a time.
+        breaker.record(True, 0.1)
+        self.assertEqual(breaker.state, resilience.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_timeout_follows_latency_percentile(self):
+        breaker = resilience.get_breaker('test', max_timeout=10)
+        self.assertEqual(breaker.timeout(), 10)  # Too few samples: provider maximum.
+        for latency in (0.2, 0.3, 0.4, 0.5):
+            breaker.record(True, latency)
+        breaker._timeout_computed_at = 0
+        self.assertAlmostEqual(breaker.timeout(), 0.8)  # p95 (0.4) x 2
+        for _ in range(20):
+            breaker.record(True, 30)
+        breaker._timeout_computed_at = 0
+        self.assertEqual(breaker.timeout(), 10)  # Clamped to the maximum.
+
+
+class RateLimiterTests(TestCase):
+    def setUp(self):
+        import tempfile
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        limits = override_settings(
+            RATE_LIMIT_DB=f'{directory.name}/rate_limits.sqlite3',
+            RATE_LIMITS={'test': (0.01, 4)}, RATE_LIMIT_BUCKETS={'test_alias': 'test'},
+            RATE_LIMIT_BACKGROUND_RESERVE=0.5, RATE_LIMIT_MAX_WAIT={'interactive': 0, 'background': 0},
+        )
+        limits.enable()
+        self.addCleanup(limits.disable)
+        resilience.reset_all()
+        metrics.reset()
+
+    def test_background_calls_leave_the_reserve_to_interactive_ones(self):
+        with rate_limit.background():
+            self.assertEqual([rate_limit.acquire('test') for _ in range(3)], [True, True, False])
+        self.assertEqual([rate_limit.acquire('test_alias') for _ in range(3)], [True, True, False])
+        self.assertIn('advisor_rate_limited_total{outcome="shed",priority="background",provider="test"} 1',
+                      metrics.render_prometheus())
+
+    def test_async_acquire_updates_the_bucket_off_the_event_loop(self):
+        import asyncio
+        threads = []
+        original = rate_limit._try_take
+        def take(*args):
+            threads.append(threading.current_thread())
+            return original(*args)
+        with patch('advisor_app.services.rate_limit._try_take', side_effect=take):
+            self.assertTrue(asyncio.run(rate_limit.aacquire('test')))
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+        self.assertLess(rate_limit.remaining()['test'], 3.1)
+
+    def test_bucket_is_shared_across_connections(self):
+        # Each thread opens its own SQLite connection, as separate worker processes do.
+        worker = threading.Thread(target=lambda: [rate_limit.acquire('test') for _ in range(3)])
+        worker.start()
+        worker.join()
+        self.assertLess(rate_limit.remaining()['test'], 1.1)
+        self.assertIn('advisor_rate_limit_tokens{bucket="test"}', metrics.render_prometheus())
+
+    def test_shed_calls_skip_the_upstream_and_the_breaker(self):
+        fetch = MagicMock(return_value={'ok': True})
+        for _ in range(4):
+            resilience.call('test', 10, fetch, {"error": "unavailable"})
+        result = resilience.call('test', 10, fetch, {"error": "unavailable"})
+        self.assertTrue(result['rate_limited'])
+        self.assertEqual(fetch.call_count, 4)
+        self.assertEqual(resilience.get_breaker('test', 10).state, resilience.CLOSED)
+
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        caching.clear()
+        metrics.reset()
+        self.user = User.objects.create_user(username='metricsuser', password='password123')
+        self.client.login(username='metricsuser', password='password123')
+
+    def test_counters_and_histograms_render_as_prometheus_text(self):
+        metrics.inc('advisor_cache_requests_total', namespace='weather', result='hit')
+        worker = threading.Thread(target=metrics.inc, args=('advisor_cache_requests_total',), kwargs={'namespace': 'weather', 'result': 'hit'})
+        worker.start()
+        worker.join()  # Recorded in the worker's own shard, summed at scrape time.
+        metrics.observe('advisor_phase_seconds', 0.2, phase='weather')
+        with override_settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('advisor_cache_requests_total{namespace="weather",result="hit"} 2', body)
+        self.assertIn('advisor_phase_seconds_bucket{phase="weather",le="0.25"} 1', body)
+        self.assertIn('advisor_phase_seconds_count{phase="weather"} 1', body)
+
+    def test_exited_threads_fold_their_shard_into_the_totals(self):
+        import gc
+        from concurrent.futures import ThreadPoolExecutor
+        shards_before = len(metrics._shards)
+        for _ in range(5):  # As get_weather_batch does: a new short-lived pool per call.
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(lambda _: metrics.inc('advisor_circuit_rejections_total', provider='test'), range(4)))
+        del executor  # Its thread set is the last reference to the finished threads.
+        gc.collect()
+        self.assertLessEqual(len(metrics._shards), shards_before)
+        self.assertIn('advisor_circuit_rejections_total{provider="test"} 20', metrics.render_prometheus())
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_metrics_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_metrics_are_hidden_without_a_token_or_staff_user(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        User.objects.create_user(username='metricsstaff', password='password123', is_staff=True)
+        self.client.login(username='metricsstaff', password='password123')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    @override_settings(SERVER_TIMING_ENABLED=True)
+    @patch('advisor_app.views.weather_service.get_weather_data')
+    @patch('advisor_app.views.eventbrite_service.get_eventbrite_events')
+    def test_dashboard_reports_server_timing(self, mock_events, mock_weather):
+        mock_weather.return_value = {'main': {'temp': 20}, 'weather': [{'description': 'sunny'}]}
+        mock_events.return_value = {'events': []}
+        self.user.profile.location = "Rome"
+        self.user.profile.save()
+        response = self.client.get(reverse('home'))
+        timing = response['Server-Timing']
+        for phase in ('weather', 'eventbrite', 'db', 'render', 'total'):
+            self.assertIn(f"{phase};dur=", timing)
+
+
+class LoggingPipelineTests(TestCase):
+    def _record(self, msg, *args, level=logging.DEBUG, **extra):
+        record = logging.LogRecord('advisor_app.test', level, __file__, 1, msg, args, None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_sampling_keeps_one_in_n_per_call_site(self):
+        from .log_handlers import SamplingFilter
+        sampler = SamplingFilter(rate=10)
+        kept = [sampler.filter(self._record("Cache hit for %s.", i)) for i in range(30)]
+        self.assertEqual(sum(kept), 3)
+        self.assertTrue(sampler.filter(self._record("Another site %s.", 1)))
+        self.assertTrue(all(sampler.filter(self._record("Failed %s.", i, level=logging.WARNING)) for i in range(5)))
+
+    def test_json_formatter_includes_extra_fields(self):
+        from .log_handlers import JsonFormatter
+        line = JsonFormatter().format(self._record("Fetched %d events", 4, level=logging.INFO, provider='eventbrite'))
+        document = json.loads(line)
+        self.assertEqual(document['message'], "Fetched 4 events")
+        self.assertEqual(document['level'], 'INFO')
+        self.assertEqual(document['provider'], 'eventbrite')
+
+    def test_queue_handler_writes_in_background_and_drops_when_full(self):
+        from io import StringIO
+        from .log_handlers import AsyncQueueHandler
+        stream = StringIO()
+        handler = AsyncQueueHandler(maxsize=2, stream=stream)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        handler.listener.stop()  # Hold the queue so it fills up.
+        for message in ("first %s", "second %s", "third %s"):
+            handler.handle(self._record(message, 'record'))
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(stream.getvalue(), '')
+        handler.start()
+        handler.stop()  # Drains the queue.
+        self.assertEqual(stream.getvalue().splitlines(), ["Log queue full: 1 records dropped.", "first record", "second record"])
+
+    def test_settings_logging_config_can_be_applied(self):
+        import copy
+        import logging.config
+        from io import StringIO
+        stream = StringIO()
+        config = copy.deepcopy(settings.LOGGING)
+        config['handlers']['console']['stream'] = stream
+        self.addCleanup(logging.config.dictConfig, settings.LOGGING)
+        logging.config.dictConfig(config)
+        logging.getLogger('advisor_app.tests').warning("Configured %s.", 'console')
+        handler, = logging.getLogger('advisor_app').handlers
+        getattr(handler, 'stop', handler.flush)()  # The async handler writes on its listener thread.
+        self.assertIn("Configured console.", stream.getvalue())
@@ -13,8 +13,14 @@ urlpatterns = [
     # This is the pattern that defines the name 'home'.
     # It maps the root path of this app's included URLs to the home_view.
     path('', views.home_view, name='home'),
+    # Same dashboard as an async view; it only pays off when served under ASGI.
+    path('async/', views.home_view_async, name='home_async'),
+    # Single widgets (weather, eventbrite, calendar) for the progressive dashboard.
+    path('widgets/<str:widget>/', views.dashboard_widget_view, name='dashboard_widget'),
 
     path('profile/', views.profile_view, name='profile'),
+    # Prometheus text format; see METRICS_TOKEN and METRICS_ALLOWED_IPS in settings.
+    path('metrics/', views.metrics_view, name='metrics'),
 
     # Google Calendar OAuth URLs
     path('calendar/auth/init/', views.google_calendar_init_view, name='google_calendar_init'),
@@ -1,17 +1,25 @@
 # smart_advisor_project/advisor_app/views.py
 
+import asyncio
+import hashlib
 import os
+import time
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages
 from django.urls import reverse
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden, Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 
 from .models import UserProfile
-from .services import weather_service, google_calendar_service, eventbrite_service
+from .signals import location_changed
+from .services import weather_service, google_calendar_service, eventbrite_service, concurrency, http_sessions, calendar_store, metrics, geo
 
-from google.auth.exceptions import RefreshError
 from google.oauth2.credentials import Credentials
 import logging
 
@@ -22,99 +30,333 @@ if settings.DEBUG:
         os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
         logger.warning("Setting OAUTHLIB_INSECURE_TRANSPORT=1 in code for development...")
     elif os.environ['OAUTHLIB_INSECURE_TRANSPORT'] != '1':
-        logger.warning(f"OAUTHLIB_INSECURE_TRANSPORT is '{os.environ['OAUTHLIB_INSECURE_TRANSPORT']}', expected '1' for local HTTP dev.")
+        logger.warning("OAUTHLIB_INSECURE_TRANSPORT is '%s', expected '1' for local HTTP dev.", os.environ['OAUTHLIB_INSECURE_TRANSPORT'])
 
-@login_required
-def home_view(request: HttpRequest) -> HttpResponse:
-    user_profile = request.user.profile
-    context = {
+# Per-widget placeholders used when a fetch misses the page deadline or fails unexpectedly.
+WIDGET_UNAVAILABLE = {
+    'weather_data': {"error": "Weather data is temporarily unavailable.", "unavailable": True},
+    'eventbrite_data': {"events": None, "error": "Local events are temporarily unavailable.", "unavailable": True},
+    'calendar_data': {"events": None, "error": "Google Calendar is temporarily unavailable.", "needs_reauth": False, "unavailable": True},
+}
+
+def _new_dashboard_context(user_profile) -> dict:
+    return {
         'user_profile': user_profile,
         'weather_data': None,
         'calendar_data': {"events": None, "error": None, "needs_reauth": False},
         'eventbrite_data': {"events": None, "error": None}, # Initialize to handle potential errors
         'google_auth_url': None,
+        'fragment_cache_ttl': settings.DASHBOARD_FRAGMENT_CACHE_TTL,
     }
 
-    # Fetch Weather Data
-    if user_profile.location:
-        logger.debug(f"Fetching weather for user {request.user.username}, location: {user_profile.location}")
-        context['weather_data'] = weather_service.get_weather_data(user_profile.location)
+def _fingerprint(*parts) -> str:
+    """Identifies widget data for template fragment keys: equal data renders equal HTML."""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+def _add_widget_versions(context: dict):
+    """
+    Keys for the cached widget fragments in home.html. Weather and events depend
+    only on the (location-keyed) data, so users in one city share the fragment;
+    the calendar also depends on the user's connection state and is cached per user.
+    """
+    user_profile = context['user_profile']
+    context['widget_versions'] = {
+        'weather': _fingerprint(context['weather_data']),
+        'eventbrite': _fingerprint(context['eventbrite_data']),
+        'calendar': _fingerprint(context['calendar_data'], context['google_auth_url'], user_profile.has_google_credentials),
+    }
+
+def _resolve_google_credentials(request: HttpRequest, user_profile):
+    """
+    Returns the stored Google credentials if a calendar sync can use them, or None.
+    Expired tokens are not refreshed here: refresh_google_tokens renews them ahead of
+    time, and a sync refreshes any it missed inside the page deadline.
+    """
+    google_credentials = user_profile.get_google_credentials()
+    if google_credentials and (google_credentials.valid or (google_credentials.expired and google_credentials.refresh_token)):
+        return google_credentials
+    if google_credentials: messages.warning(request, "Your Google connection needs to be re-established.")
+    return None
+
+def _plan_calendar(request: HttpRequest, user_profile, google_credentials, context: dict):
+    """
+    Decides how the calendar widget is filled. Returns (calendar_cache, sync_kwargs):
+    sync_kwargs is None when no sync is needed (fresh store, or not connected).
+    """
+    if not google_credentials:
+        try: context['google_auth_url'] = reverse('google_calendar_init')
+        except Exception as e:
+            logger.error("Could not reverse 'google_calendar_init': %s", e)
+            messages.error(request, "Error setting up Google Calendar connection link.")
+        return None, None
+
+    # Events are served from the per-user store; it is synced incrementally once its short TTL lapses.
+    calendar_cache = calendar_store.load(user_profile)
+    if calendar_cache.is_fresh(settings.GOOGLE_CALENDAR_SYNC_TTL):
+        logger.debug("Serving Google Calendar events for %s from the local store", request.user.username)
+        context['calendar_data']['events'] = calendar_store.upcoming_events(calendar_cache)
+        return calendar_cache, None
+    logger.debug("Syncing Google Calendar events for %s", request.user.username)
+    return calendar_cache, calendar_store.sync_arguments(calendar_cache)
+
+def _apply_results(request: HttpRequest, context: dict, user_profile, calendar_cache, requested, results: dict):
+    """Copies fetch results into the context; `requested` widgets missing from results render as unavailable."""
+    for widget in requested:
+        if widget not in results:
+            logger.warning("%s unavailable for %s (deadline or error).", widget, request.user.username)
+            results[widget] = dict(WIDGET_UNAVAILABLE[widget])
+
+    if 'weather_data' in results:
+        context['weather_data'] = results['weather_data']
         if context['weather_data'].get('error'):
-            logger.warning(f"Weather service error for {request.user.username}: {context['weather_data']['error']}")
-    else:
-        logger.info(f"User {request.user.username} has no location set for weather.")
+            logger.warning("Weather service error for %s: %s", request.user.username, context['weather_data']['error'])
 
-    # Fetch Eventbrite Data
-    if user_profile.location:
-        logger.debug(f"Fetching Eventbrite events for user {request.user.username}, location: {user_profile.location}")
-        # The value of user_profile.location is passed to the service.
-        # If this is "India", the service will call Eventbrite with location.address=India.
-        context['eventbrite_data'] = eventbrite_service.get_eventbrite_events(location_address=user_profile.location)
+    if 'eventbrite_data' in results:
+        context['eventbrite_data'] = results['eventbrite_data']
         if context['eventbrite_data'].get('error'):
-            logger.warning(f"Eventbrite service error for {request.user.username}: {context['eventbrite_data']['error']}")
+            logger.warning("Eventbrite service error for %s: %s", request.user.username, context['eventbrite_data']['error'])
             # Optionally, add a Django message to show the user (template needs to display it)
             # messages.warning(request, f"Eventbrite: {context['eventbrite_data']['error']}")
-    else:
-        logger.info(f"User {request.user.username} has no location set for Eventbrite.")
 
-    # Handle Google Calendar
-    google_credentials = user_profile.get_google_credentials()
-    if not google_credentials or not google_credentials.valid:
-        if google_credentials and google_credentials.expired and google_credentials.refresh_token:
-            try:
-                logger.info(f"Attempting to refresh Google token for user {request.user.username}")
-                from google.auth.transport.requests import Request as GoogleAuthRequest
-                google_credentials.refresh(GoogleAuthRequest())
-                user_profile.set_google_credentials(google_credentials)
-                logger.info(f"Google token refreshed for {request.user.username}.")
-                messages.info(request, "Google session refreshed.")
-            except RefreshError as e:
-                logger.error(f"Google token refresh failed for {request.user.username}: {e}. Forcing re-auth.")
-                messages.error(request, "Your Google session has expired and could not be refreshed. Please connect again.")
-                user_profile.google_credentials_json = None
-                user_profile.save()
-                google_credentials = None
-            except Exception as e:
-                logger.error(f"Unexpected error during Google token refresh for {request.user.username}: {e}")
-                messages.error(request, "An unexpected error occurred with your Google session. Please connect again.")
-                user_profile.google_credentials_json = None
-                user_profile.save()
-                google_credentials = None
+    if 'calendar_data' in results:
+        calendar_api_result = results['calendar_data']
+        if not calendar_api_result.get('error'):
+            calendar_store.apply_sync_result(calendar_cache, calendar_api_result)
+            context['calendar_data']['events'] = calendar_store.upcoming_events(calendar_cache)
+        elif calendar_cache.synced_at and not calendar_api_result.get('needs_reauth'):
+            logger.warning("Calendar sync failed for %s; serving last known events: %s", request.user.username, calendar_api_result['error'])
+            context['calendar_data']['events'] = calendar_store.upcoming_events(calendar_cache)
         else:
-            if google_credentials: messages.warning(request, "Your Google connection needs to be re-established.")
-            google_credentials = None
-
-    if google_credentials and google_credentials.valid:
-        logger.debug(f"Fetching Google Calendar events for {request.user.username}")
-        calendar_api_result = google_calendar_service.get_calendar_events(google_credentials)
-        context['calendar_data'].update(calendar_api_result)
-        if calendar_api_result.get('error') and not calendar_api_result.get('needs_reauth'):
-            messages.warning(request, f"Google Calendar: {calendar_api_result['error']}")
+            context['calendar_data'].update(calendar_api_result)
+            if not calendar_api_result.get('needs_reauth') and not calendar_api_result.get('unavailable'):
+                messages.warning(request, f"Google Calendar: {calendar_api_result['error']}")
         if calendar_api_result.get('refreshed_credentials'):
             logger.info("Credentials were refreshed by the calendar service. Re-saving.")
             user_profile.set_google_credentials(calendar_api_result['refreshed_credentials'])
+        elif calendar_api_result.get('revoked'):
+            # Google rejected the refresh token: forget it and offer to connect again.
+            logger.error("Google token refresh rejected for %s. Forcing re-auth.", request.user.username)
+            user_profile.clear_google_credentials()
+            context['google_auth_url'] = reverse('google_calendar_init')
+
+# Dashboard widgets: {name: (context key, template)}. Also served one at a time by dashboard_widget_view.
+WIDGETS = {
+    'weather': ('weather_data', 'advisor_app/widgets/weather.html'),
+    'eventbrite': ('eventbrite_data', 'advisor_app/widgets/eventbrite.html'),
+    'calendar': ('calendar_data', 'advisor_app/widgets/calendar.html'),
+}
+# Part of every widget ETag; bump it when a widget template changes so browsers don't keep old HTML.
+WIDGET_TEMPLATE_VERSION = 1
+
+def _load_widgets(request: HttpRequest, user_profile, context: dict, widgets=tuple(WIDGETS)):
+    """
+    Fetches the data for `widgets` into `context`. Returns the calendar store
+    (or None) for _widget_last_modified.
+    """
+    # All upstream fetches share one page deadline and run concurrently on the
+    # bounded executor, so the page waits for the slowest provider, not the sum.
+    deadline = time.monotonic() + settings.ADVISOR_DASHBOARD_DEADLINE
+    pending = {}
+
+    # Start Weather and Eventbrite fetches
+    if user_profile.location:
+        logger.debug("Fetching %s for user %s, location: %s", ', '.join(widgets), request.user.username, user_profile.location)
+        # Stored coordinates key the caches by grid cell; until the location has been
+        # geocoded (on save, or by prewarm_advisor) the services fall back to the free-text location.
+        coordinates = geo.location_arguments(user_profile)
+        if 'weather' in widgets:
+            pending['weather_data'] = concurrency.submit(metrics.timed_call('weather', weather_service.get_weather_data), user_profile.location, **coordinates)
+        if 'eventbrite' in widgets:
+            # Without coordinates the text goes to Eventbrite as is:
+            # if this is "India", the service will call Eventbrite with location.address=India.
+            pending['eventbrite_data'] = concurrency.submit(metrics.timed_call('eventbrite', eventbrite_service.get_eventbrite_events), **(coordinates or {'location_address': user_profile.location}))
     else:
-        try: context['google_auth_url'] = reverse('google_calendar_init')
-        except Exception as e:
-            logger.error(f"Could not reverse 'google_calendar_init': {e}")
-            messages.error(request, "Error setting up Google Calendar connection link.")
+        logger.info("User %s has no location set for weather or Eventbrite.", request.user.username)
+
+    # Handle Google Calendar (an expired token is refreshed by the sync, under the same deadline)
+    calendar_cache = None
+    if 'calendar' in widgets:
+        google_credentials = _resolve_google_credentials(request, user_profile)
+        calendar_cache, calendar_sync_kwargs = _plan_calendar(request, user_profile, google_credentials, context)
+        if calendar_sync_kwargs is not None:
+            pending['calendar_data'] = concurrency.submit(metrics.timed_call('calendar', google_calendar_service.sync_calendar_events), google_credentials, **calendar_sync_kwargs)
+
+    results = concurrency.gather(pending, deadline)
+    _apply_results(request, context, user_profile, calendar_cache, pending, results)
+    _add_widget_versions(context)
+    return calendar_cache
+
+@login_required
+def home_view(request: HttpRequest) -> HttpResponse:
+    user_profile = request.profile
+    context = _new_dashboard_context(user_profile)
+    if settings.ADVISOR_PROGRESSIVE_DASHBOARD:
+        # Shell only: the page loads each widget from dashboard_widget_view in parallel,
+        # so the first byte doesn't wait for any upstream API.
+        context['progressive'] = True
+        context['widget_names'] = list(WIDGETS)
+    else:
+        _load_widgets(request, user_profile, context)
+    with metrics.timed('render'):
+        return render(request, 'advisor_app/home.html', context)
+
+def _load_cached_widget(request: HttpRequest, user_profile, context: dict, widget: str):
+    """
+    Fills `context` for `widget` as _load_widgets would, but only from fresh cache
+    entries and the calendar store. Returns (loaded, calendar_cache); loaded is
+    False when the widget needs an upstream call.
+    """
+    calendar_cache = None
+    if widget == 'calendar':
+        google_credentials = _resolve_google_credentials(request, user_profile)
+        calendar_cache, calendar_sync_kwargs = _plan_calendar(request, user_profile, google_credentials, context)
+        if calendar_sync_kwargs is not None:
+            return False, None
+    elif user_profile.location:
+        coordinates = geo.location_arguments(user_profile)
+        if widget == 'weather':
+            cached = weather_service.get_cached_weather(user_profile.location, **coordinates)
+        else:
+            cached = eventbrite_service.get_cached_events(**(coordinates or {'location_address': user_profile.location}))
+        if cached is None:
+            return False, None
+        context[WIDGETS[widget][0]] = cached
+    _add_widget_versions(context)
+    return True, calendar_cache
+
+def _widget_last_modified(widget: str, context: dict, calendar_cache):
+    """Epoch seconds the widget's data was produced, where the source says so."""
+    if widget == 'weather':
+        return context['weather_data'].get('dt') if context['weather_data'] else None  # OpenWeatherMap's calculation time
+    if widget == 'calendar' and calendar_cache is not None and calendar_cache.synced_at:
+        return int(calendar_cache.synced_at.timestamp())
+    return None
+
+@login_required
+def dashboard_widget_view(request: HttpRequest, widget: str) -> HttpResponse:
+    """
+    One dashboard widget as an HTML fragment, for the progressive dashboard.
+    Answers If-None-Match / If-Modified-Since with 304 when the data hasn't changed.
+    When the data is fresh in the cache (or the calendar store) the validators come
+    from it, so a revalidation costs no upstream call or executor task.
+    """
+    if widget not in WIDGETS:
+        raise Http404(f"Unknown widget '{widget}'.")
+    context_key, template = WIDGETS[widget]
+    user_profile = request.profile
+    context = _new_dashboard_context(user_profile)
+    loaded, calendar_cache = _load_cached_widget(request, user_profile, context, widget)
+    if not loaded:
+        context = _new_dashboard_context(user_profile)
+        calendar_cache = _load_widgets(request, user_profile, context, widgets=(widget,))
+
+    etag = f'"{WIDGET_TEMPLATE_VERSION}-{context["widget_versions"][widget]}"'
+    last_modified = _widget_last_modified(widget, context, calendar_cache)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        with metrics.timed('render'):
+            response = render(request, template, context)
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)  # Browsers may keep it, but must revalidate.
+    return response
+
+async def home_view_async(request: HttpRequest) -> HttpResponse:
+    """
+    Async twin of home_view for ASGI deployments. Upstream calls are awaited
+    together on the shared async HTTP clients instead of occupying threads;
+    only ORM, session and template work is handed to sync_to_async.
+    """
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+    user_profile = await sync_to_async(UserProfile.objects.for_user)(user)
+    context = _new_dashboard_context(user_profile)
+    if settings.ADVISOR_PROGRESSIVE_DASHBOARD:
+        # Shell only, as in home_view: the widgets are loaded from dashboard_widget_view.
+        context['progressive'] = True
+        context['widget_names'] = list(WIDGETS)
+    else:
+        try:
+            await _load_widgets_async(request, user, user_profile, context)
+        finally:
+            if not isinstance(request, ASGIRequest):
+                # Under WSGI, async_to_sync runs each request on a new event loop; the pooled
+                # clients are bound to it, so close them rather than leak their sockets.
+                await http_sessions.aclose_all()
+    return await metrics.timed_await('render', sync_to_async(render)(request, 'advisor_app/home.html', context))
+
+async def _load_widgets_async(request: HttpRequest, user, user_profile, context: dict):
+    """Async counterpart of _load_widgets, for all widgets, awaiting the upstream calls together."""
+    deadline = time.monotonic() + settings.ADVISOR_DASHBOARD_DEADLINE
+    pending = {}
+    if user_profile.location:
+        logger.debug("Fetching weather and Eventbrite events (async) for user %s, location: %s", user.username, user_profile.location)
+        coordinates = geo.location_arguments(user_profile)
+        pending['weather_data'] = asyncio.ensure_future(metrics.timed_await('weather', weather_service.get_weather_data_async(user_profile.location, **coordinates)))
+        pending['eventbrite_data'] = asyncio.ensure_future(metrics.timed_await('eventbrite', eventbrite_service.get_eventbrite_events_async(**(coordinates or {'location_address': user_profile.location}))))
+    else:
+        logger.info("User %s has no location set for weather or Eventbrite.", user.username)
+
+    google_credentials = await sync_to_async(_resolve_google_credentials)(request, user_profile)
+    calendar_cache, calendar_sync_kwargs = await sync_to_async(_plan_calendar)(request, user_profile, google_credentials, context)
+    if calendar_sync_kwargs is not None:
+        pending['calendar_data'] = asyncio.ensure_future(metrics.timed_await(
+            'calendar', google_calendar_service.sync_calendar_events_async(google_credentials, **calendar_sync_kwargs)
+        ))
+
+    results = {}
+    if pending:
+        done, not_done = await asyncio.wait(pending.values(), timeout=max(0.0, deadline - time.monotonic()))
+        for task in not_done:
+            task.cancel()
+        for name, task in pending.items():
+            if task in done and task.exception() is None:
+                results[name] = task.result()
+            elif task in done:
+                logger.error("Async fetch '%s' raised an unexpected error: %s", name, task.exception())
+
+    await sync_to_async(_apply_results)(request, context, user_profile, calendar_cache, pending, results)
+    _add_widget_versions(context)
+
+def _may_read_metrics(request: HttpRequest) -> bool:
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') == f"Bearer {settings.METRICS_TOKEN}":
+        return True
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
 
-    return render(request, 'advisor_app/home.html', context)
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """
+    Prometheus scrape endpoint, for staff users, scrapers sending METRICS_TOKEN as
+    a bearer token (Authorization: Bearer <token>) and METRICS_ALLOWED_IPS.
+    Without a token configured, other clients are told it doesn't exist.
+    """
+    if not _may_read_metrics(request):
+        if settings.METRICS_TOKEN:
+            return HttpResponseForbidden("Invalid or missing metrics token.")
+        raise Http404("No metrics here.")
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 # ... (profile_view and Google OAuth views remain the same as previous robust versions) ...
 
 @login_required
 def profile_view(request: HttpRequest) -> HttpResponse:
-    user_profile = request.user.profile
+    user_profile = request.profile
     if request.method == 'POST':
         location = request.POST.get('location', '').strip()
         if location:
-            user_profile.location = location
-            user_profile.save()
-            logger.info(f"User {request.user.username} updated location to: {location}")
+            if location != user_profile.location:
+                old_location, user_profile.location = user_profile.location, location
+                user_profile.latitude = user_profile.longitude = None
+                user_profile.save(update_fields=['location', 'latitude', 'longitude'])
+                geo.locate_profile(user_profile)  # Geocode now (usually a stored lookup) rather than on the dashboard.
+                location_changed.send(sender=UserProfile, profile=user_profile, old_location=old_location)
+            logger.info("User %s updated location to: %s", request.user.username, location)
             messages.success(request, 'Location updated successfully!')
         else:
-            logger.warning(f"User {request.user.username} attempted to set an empty location.")
+            logger.warning("User %s attempted to set an empty location.", request.user.username)
             messages.error(request, 'Location cannot be empty.')
         return redirect('profile')
     return render(request, 'advisor_app/profile.html', {'user_profile': user_profile})
@@ -127,14 +369,14 @@ def google_calendar_init_view(request: HttpRequest) -> HttpResponse:
             access_type='offline', prompt='consent', include_granted_scopes='true'
         )
         request.session['oauth_state'] = state
-        logger.info(f"Google OAuth: Initiating flow for {request.user.username}. State: {state}")
+        logger.info("Google OAuth: Initiating flow for %s. State: %s", request.user.username, state)
         return redirect(authorization_url)
     except ValueError as e:
-        logger.critical(f"Google OAuth configuration error during init: {e}")
+        logger.critical("Google OAuth configuration error during init: %s", e)
         messages.error(request, "Google Calendar integration is not configured correctly by the site administrator.")
         return redirect('home')
     except Exception as e:
-        logger.error(f"Unexpected error initiating Google OAuth flow for {request.user.username}: {e}")
+        logger.error("Unexpected error initiating Google OAuth flow for %s: %s", request.user.username, e)
         messages.error(request, "Could not start Google Calendar connection. Please try again.")
         return redirect('home')
 
@@ -143,65 +385,62 @@ def google_calendar_oauth2callback_view(request: HttpRequest) -> HttpResponse:
     state_from_session = request.session.pop('oauth_state', None)
     state_from_google = request.GET.get('state')
     if not state_from_session or state_from_session != state_from_google:
-        logger.error(f"OAuth state mismatch for user {request.user.username}. Session: '{state_from_session}', Google: '{state_from_google}'")
+        logger.error("OAuth state mismatch for user %s. Session: '%s', Google: '%s'", request.user.username, state_from_session, state_from_google)
         messages.error(request, "Authentication failed due to a state mismatch. Please try connecting again.")
         return redirect('home')
     if 'error' in request.GET:
         error = request.GET.get('error')
-        logger.warning(f"Google OAuth callback error for user {request.user.username}: {error}")
+        logger.warning("Google OAuth callback error for user %s: %s", request.user.username, error)
         messages.error(request, f"Google declined the connection: {error}. Please try again.")
         return redirect('home')
     try:
         flow = google_calendar_service.get_google_auth_flow()
         flow.fetch_token(authorization_response=request.build_absolute_uri())
     except ValueError as e:
-        logger.critical(f"Google OAuth configuration error on callback: {e}")
+        logger.critical("Google OAuth configuration error on callback: %s", e)
         messages.error(request, "Google Calendar integration is not configured correctly (callback).")
         return redirect('home')
     except Exception as e:
-        logger.error(f"Failed to fetch Google OAuth token for {request.user.username}: {e}. URL: {request.build_absolute_uri()}", exc_info=True)
+        logger.error("Failed to fetch Google OAuth token for %s: %s. URL: %s", request.user.username, e, request.build_absolute_uri(), exc_info=True)
         error_message = str(e)
         if "MismatchingRedirectURIError" in error_message: messages.error(request, "OAuth Redirect URI mismatch. Check Google Cloud Console and Django settings.")
         elif "insecure_transport" in error_message.lower(): messages.error(request, "OAuth connection failed due to insecure transport. Check server logs.")
         else: messages.error(request, f"Failed to finalize Google Calendar connection: {e}. Ensure cookies are enabled and try again.")
         return redirect('home')
     if not flow.credentials:
-        logger.error(f"Google OAuth flow completed but no credentials obtained for {request.user.username}.")
+        logger.error("Google OAuth flow completed but no credentials obtained for %s.", request.user.username)
         messages.error(request, "Could not obtain Google credentials after authentication. Please try again.")
         return redirect('home')
-    user_profile = request.user.profile
+    user_profile = request.profile
     user_profile.set_google_credentials(flow.credentials)
-    logger.info(f"Google Calendar successfully connected for user {request.user.username}.")
+    logger.info("Google Calendar successfully connected for user %s.", request.user.username)
     messages.success(request, "Successfully connected to Google Calendar!")
     return redirect('home')
 
 @login_required
 def google_calendar_revoke_view(request: HttpRequest) -> HttpResponse:
-    user_profile = request.user.profile
+    user_profile = request.profile
     credentials = user_profile.get_google_credentials()
     if credentials and credentials.token:
         try:
-            import requests as http_client
             revoke_url = 'https://oauth2.googleapis.com/revoke'
-            response = http_client.post(revoke_url, params={'token': credentials.token},
+            response = http_sessions.get_session('google').post(revoke_url, params={'token': credentials.token},
                                        headers={'content-type': 'application/x-www-form-urlencoded'})
             if response.status_code == 200:
-                logger.info(f"Google token successfully revoked on Google's side for {request.user.username}.")
+                logger.info("Google token successfully revoked on Google's side for %s.", request.user.username)
                 messages.success(request, "Google Calendar access revoked from Google.")
             else:
-                logger.warning(f"Failed to revoke token on Google's side for {request.user.username}. Status: {response.status_code}, Body: {response.text[:200]}")
+                logger.warning("Failed to revoke token on Google's side for %s. Status: %s, Body: %s", request.user.username, response.status_code, response.text[:200])
                 messages.warning(request, f"Could not fully revoke token with Google (status: {response.status_code}), but local access will be removed.")
         except Exception as e:
-            logger.error(f"Error during Google token server-side revocation for {request.user.username}: {e}")
+            logger.error("Error during Google token server-side revocation for %s: %s", request.user.username, e)
             messages.warning(request, f"An error occurred trying to revoke Google access: {e}. Local access will be removed.")
         finally:
-            user_profile.google_credentials_json = None
-            user_profile.save()
-            logger.info(f"Local Google credentials removed for user {request.user.username}.")
-    elif user_profile.google_credentials_json:
-        user_profile.google_credentials_json = None
-        user_profile.save()
-        logger.info(f"Malformed local Google credentials cleared for {request.user.username}.")
+            user_profile.clear_google_credentials()
+            logger.info("Local Google credentials removed for user %s.", request.user.username)
+    elif user_profile.has_google_credentials:
+        user_profile.clear_google_credentials()
+        logger.info("Malformed local Google credentials cleared for %s.", request.user.username)
         messages.info(request, "Local Google Calendar connection data cleared.")
     else:
         messages.info(request, "No Google Calendar connection was active.")
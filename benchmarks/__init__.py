@@ -0,0 +1,22 @@
+# smart_advisor_project/benchmarks/__init__.py
+"""
+Stand-alone benchmarks for the advisor app. Run them from the project root,
+e.g. `python -m benchmarks.calendar_discovery`, or `python -m benchmarks.dashboard_load`
+for the end-to-end load test against local fake upstreams (benchmarks.fake_upstreams).
+"""
+
+import os
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    """Configures Django for a benchmark run without needing a .env file."""
+    if str(PROJECT_ROOT) not in sys.path:
+        sys.path.insert(0, str(PROJECT_ROOT))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smart_advisor_project.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark-only-secret-key')
+    import django
+    django.setup()
@@ -0,0 +1,46 @@
+# smart_advisor_project/benchmarks/calendar_discovery.py
+"""
+Compares building the Google Calendar client the old way (build() per request,
+re-parsing the discovery document) with the shared resource from
+google_calendar_service. No network calls are made; only request construction
+is timed.
+
+    python -m benchmarks.calendar_discovery [--iterations N]
+"""
+
+import argparse
+import timeit
+
+from benchmarks import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from googleapiclient.discovery import build
+    from google.oauth2.credentials import Credentials
+    from advisor_app.services import google_calendar_service
+
+    credentials = Credentials(token='benchmark-token')
+
+    def cold():
+        service = build('calendar', 'v3', credentials=credentials, cache_discovery=False)
+        service.events().list(calendarId='primary', maxResults=10)
+
+    def warm():
+        google_calendar_service.authorized_http(credentials)
+        google_calendar_service.get_events_resource().list(calendarId='primary', maxResults=10)
+
+    warm()  # Build the shared resource once, as the first request in a process would.
+    cold_s = timeit.timeit(cold, number=args.iterations) / args.iterations
+    warm_s = timeit.timeit(warm, number=args.iterations) / args.iterations
+    print(f"cold build() per request: {cold_s * 1000:8.3f} ms")
+    print(f"warm shared resource:     {warm_s * 1000:8.3f} ms")
+    print(f"speedup:                  {cold_s / warm_s:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
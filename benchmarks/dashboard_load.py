@@ -0,0 +1,246 @@
+# smart_advisor_project/benchmarks/dashboard_load.py
+"""
+Load-tests the dashboard against local stand-in upstreams (benchmarks.fake_upstreams).
+For every combination of view (sync home_view / async home_view_async), cache
+(on / off) and concurrency level, it issues --requests dashboard requests from
+--users logged-in users and reports throughput, p50/p95/p99 latency, error
+count and upstream calls. Results are written as one JSON document so runs can
+be diffed over time. A throwaway SQLite database is used; nothing touches db.sqlite3.
+
+    python -m benchmarks.dashboard_load [--concurrency 1 8 32] [--requests 200]
+        [--paths sync async] [--cache on off] [--latency-ms 50] [--error-rate 0.01]
+        [--provider eventbrite:latency_ms=800] [--output results.json]
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import PROJECT_ROOT, setup_django
+from benchmarks.fake_upstreams import FakeUpstreams, add_behaviour_arguments, behaviours_from_args
+
+CITIES = ["London,UK", "Paris,FR", "Berlin,DE", "Madrid,ES", "Rome,IT", "Oslo,NO", "Lisbon,PT", "Vienna,AT", "Prague,CZ", "Dublin,IE"]
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def create_users(count: int, token_uri: str, expired_fraction: float):
+    from django.contrib.auth.models import User
+    from google.oauth2.credentials import Credentials
+
+    users = []
+    expired_every = int(1 / expired_fraction) if expired_fraction > 0 else 0
+    for i in range(count):
+        user = User.objects.create_user(username=f"bench{i}", password='unused-benchmark-password')
+        profile = user.profile
+        profile.location = CITIES[i % len(CITIES)]
+        expired = expired_every and i % expired_every == 0
+        profile.set_google_credentials(Credentials(
+            token=f"token-{i}",
+            refresh_token=f"refresh-{i}",
+            token_uri=token_uri,
+            client_id='benchmark-client',
+            client_secret='benchmark-secret',
+            scopes=['https://www.googleapis.com/auth/calendar.readonly'],
+            expiry=datetime.datetime.utcnow() + datetime.timedelta(hours=-1 if expired else 1),
+        ))
+        users.append(user)
+    return users
+
+
+def reset_state(users, token_uri: str, expired_fraction: float):
+    """Puts caches, breakers, calendar stores and tokens back where a fresh scenario expects them."""
+    from django.contrib.auth.models import User
+    from advisor_app.services import caching, resilience
+
+    caching.clear()
+    resilience.reset_all()
+    User.objects.filter(pk__in=[user.pk for user in users]).delete()  # Cascades to profiles and calendar stores.
+    return create_users(len(users), token_uri, expired_fraction)
+
+
+def run_sync(clients, path: str, total: int, concurrency: int):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker(worker_index):
+        nonlocal errors
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            client = clients[i % len(clients)]
+            started = time.perf_counter()
+            response = client.get(path)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != 200:
+                    errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def run_async(clients, path: str, total: int, concurrency: int):
+    from django.test import AsyncClient
+    from advisor_app.services import http_sessions
+
+    async def main():
+        async_clients = []
+        for client in clients:
+            async_client = AsyncClient()
+            async_client.cookies = client.cookies  # Reuse the sessions logged in by the sync clients.
+            async_clients.append(async_client)
+        latencies, errors = [], 0
+        counter = iter(range(total))
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                started = time.perf_counter()
+                response = await async_clients[i % len(async_clients)].get(path)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        await http_sessions.aclose_all()
+        return latencies, errors, elapsed
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=200, help="Dashboard requests per scenario.")
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--paths', nargs='+', choices=['sync', 'async'], default=['sync', 'async'])
+    parser.add_argument('--cache', nargs='+', choices=['on', 'off'], default=['on', 'off'])
+    parser.add_argument('--calendar-sync-ttl', type=int, default=0,
+                        help="GOOGLE_CALENDAR_SYNC_TTL during the run (0 = sync the calendar on every request).")
+    parser.add_argument('--expired-fraction', type=float, default=0.1,
+                        help="Share of users whose Google token starts expired (exercises the OAuth refresh).")
+    parser.add_argument('--output', help="Write the JSON results here instead of stdout.")
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    upstreams = FakeUpstreams(**behaviours_from_args(args)).start()
+    os.environ.update(upstreams.settings_overrides())
+    os.environ.setdefault('OPENWEATHERMAP_API_KEY', 'benchmark-key')
+    os.environ.setdefault('EVENTBRITE_API_KEY', 'benchmark-key')
+    os.environ['GOOGLE_CALENDAR_SYNC_TTL'] = str(args.calendar_sync_ttl)
+    setup_django()
+    logging.disable(logging.INFO)  # Per-request INFO logs would dominate the timings.
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    db_dir = tempfile.TemporaryDirectory(prefix='advisor-bench-')
+    connection.settings_dict['TEST']['NAME'] = os.path.join(db_dir.name, 'bench.sqlite3')  # File, so worker threads share it.
+    connection.creation.create_test_db(verbosity=0, serialize=False)
+
+    cache_settings = {
+        'on': settings.CACHES,
+        'off': {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    }
+    paths = {'sync': '/', 'async': '/async/'}
+    results = []
+    users = create_users(args.users, upstreams.token_uri, args.expired_fraction)
+    try:
+        for view in args.paths:
+            for cache_mode in args.cache:
+                for concurrency in args.concurrency:
+                    with override_settings(CACHES=cache_settings[cache_mode]):
+                        users = reset_state(users, upstreams.token_uri, args.expired_fraction)
+                        clients = []
+                        for user in users:
+                            client = Client()
+                            client.force_login(user)
+                            clients.append(client)
+                        upstreams.reset_counts()
+                        runner = run_sync if view == 'sync' else run_async
+                        latencies, errors, elapsed = runner(clients, paths[view], args.requests, concurrency)
+                    scenario = {'view': view, 'cache': cache_mode, 'concurrency': concurrency}
+                    result = dict(scenario, **summarize(latencies, errors, elapsed), upstream_calls=upstreams.reset_counts())
+                    results.append(result)
+                    print(f"{view:5} cache={cache_mode:3} c={concurrency:<3} "
+                          f"{result['throughput_rps']:8.1f} req/s  p50 {result['p50_ms']:8.1f} ms  "
+                          f"p95 {result['p95_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  errors {errors}",
+                          file=sys.stderr)
+    finally:
+        connection.creation.destroy_test_db(settings.DATABASES['default']['NAME'], verbosity=0)
+        db_dir.cleanup()
+        upstreams.stop()
+
+    document = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'requests_per_scenario': args.requests,
+            'users': args.users,
+            'calendar_sync_ttl': args.calendar_sync_ttl,
+            'expired_fraction': args.expired_fraction,
+            'upstreams': {name: vars(behaviour) for name, behaviour in upstreams.behaviours.items()},
+        },
+        'results': results,
+    }
+    output = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
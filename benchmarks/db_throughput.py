@@ -0,0 +1,180 @@
+# smart_advisor_project/benchmarks/db_throughput.py
+"""
+Measures concurrent database throughput on the paths the dashboard writes and
+reads: session-user loads (user + profile), profile location updates and
+Google token saves. Reader and writer threads run for a fixed time against a
+fresh database per variant; ops/s, latency percentiles and lock errors are
+reported as JSON.
+
+With the default SQLite profile two variants are compared on throwaway files:
+'default' (no pragmas: rollback journal, FULL sync) and 'tuned' (SQLITE_PRAGMAS).
+With DATABASE_PROFILE=server the configured server database is measured once,
+using a test database created next to it.
+
+    python -m benchmarks.db_throughput [--seconds 5] [--readers 8] [--writers 4] [--users 200] [--output db.json]
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import setup_django
+from benchmarks.dashboard_load import percentile
+
+
+def seed(count: int):
+    from django.contrib.auth.models import User
+    from advisor_app.models import UserProfile
+
+    users = User.objects.bulk_create([User(username=f"dbbench{i}") for i in range(count)])
+    UserProfile.objects.bulk_create_for_users(users)
+    return [user.pk for user in User.objects.filter(username__startswith='dbbench').only('pk')]
+
+
+def read_session_user(pk):
+    from django.contrib.auth.models import User
+    User.objects.select_related('profile').get(pk=pk)  # What ProfileModelBackend does per request.
+
+
+def update_location(pk):
+    from advisor_app.models import UserProfile
+    profile = UserProfile.objects.get(pk=pk)
+    profile.location = random.choice(["London,UK", "Paris,FR", "Berlin,DE"])
+    profile.save(update_fields=['location'])
+
+
+def save_token(pk):
+    from google.oauth2.credentials import Credentials
+    from advisor_app.models import UserProfile
+    profile = UserProfile.objects.select_related('user').get(pk=pk)
+    profile.set_google_credentials(Credentials(
+        token=f"token-{time.time_ns()}", refresh_token='refresh', token_uri='https://oauth2.googleapis.com/token',
+        client_id='benchmark-client', client_secret='benchmark-secret',
+        expiry=datetime.datetime.utcnow() + datetime.timedelta(hours=1),
+    ))
+
+
+def run_mix(pks, seconds: float, readers: int, writers: int) -> dict:
+    from django.db import DatabaseError, connection
+
+    stop_at = time.monotonic() + seconds
+    samples = {'read_session_user': [], 'update_location': [], 'save_token': []}
+    errors = {name: 0 for name in samples}
+    lock = threading.Lock()
+
+    def worker(operations):
+        local = {name: [] for name in samples}
+        local_errors = {name: 0 for name in samples}
+        try:
+            while time.monotonic() < stop_at:
+                operation = random.choice(operations)
+                started = time.perf_counter()
+                try:
+                    operation(random.choice(pks))
+                    local[operation.__name__].append(time.perf_counter() - started)
+                except DatabaseError:  # e.g. "database is locked" after the busy timeout
+                    local_errors[operation.__name__] += 1
+        finally:
+            connection.close()
+        with lock:
+            for name in samples:
+                samples[name].extend(local[name])
+                errors[name] += local_errors[name]
+
+    threads = [threading.Thread(target=worker, args=([read_session_user],)) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=([update_location, save_token],)) for _ in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = {}
+    for name, latencies in samples.items():
+        latencies.sort()
+        result[name] = {
+            'ops': len(latencies),
+            'ops_per_s': round(len(latencies) / elapsed, 1),
+            'errors': errors[name],
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        }
+    return result
+
+
+def run_variant(name: str, args, test_db_name=None, pragmas=None) -> dict:
+    from django.conf import settings
+    from django.db import connection
+
+    if pragmas is not None:
+        settings.SQLITE_PRAGMAS = pragmas
+    if test_db_name:
+        connection.settings_dict['TEST']['NAME'] = test_db_name
+    original_name = settings.DATABASES['default']['NAME']
+    connection.creation.create_test_db(verbosity=0, serialize=False)
+    try:
+        pks = seed(args.users)
+        connection.close()  # Workers open their own connections (and get the pragmas).
+        result = run_mix(pks, args.seconds, args.readers, args.writers)
+    finally:
+        connection.creation.destroy_test_db(original_name, verbosity=0)
+    print(f"{name:8} " + "  ".join(f"{op} {r['ops_per_s']:8.1f}/s (errors {r['errors']})" for op, r in result.items()),
+          file=sys.stderr)
+    return dict(result, variant=name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--seconds', type=float, default=5.0, help="Duration of each variant.")
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--output', help="Write the JSON results here instead of stdout.")
+    args = parser.parse_args()
+
+    setup_django()
+    logging.disable(logging.INFO)  # Per-save DEBUG logs would dominate the timings.
+    from django.conf import settings
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+
+    results = []
+    if settings.DATABASE_PROFILE == 'server':
+        results.append(run_variant('server', args))
+    else:
+        with tempfile.TemporaryDirectory(prefix='advisor-dbbench-') as tmp:
+            tuned = dict(settings.SQLITE_PRAGMAS)
+            # 'default' keeps SQLite's own defaults but the same busy wait, so it isn't just failing fast.
+            baseline = {'busy_timeout': tuned['busy_timeout']}
+            results.append(run_variant('default', args, os.path.join(tmp, 'default.sqlite3'), baseline))
+            results.append(run_variant('tuned', args, os.path.join(tmp, 'tuned.sqlite3'), tuned))
+            settings.SQLITE_PRAGMAS = tuned
+
+    document = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'database_profile': settings.DATABASE_PROFILE,
+            'sqlite_pragmas': settings.SQLITE_PRAGMAS if settings.DATABASE_PROFILE != 'server' else None,
+            'seconds': args.seconds, 'readers': args.readers, 'writers': args.writers, 'users': args.users,
+        },
+        'results': results,
+    }
+    output = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
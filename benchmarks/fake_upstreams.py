@@ -0,0 +1,248 @@
+# smart_advisor_project/benchmarks/fake_upstreams.py
+"""
+Local stand-ins for OpenWeatherMap, Eventbrite, Google OAuth and the Calendar
+API, with configurable latency, error rate and payload size per provider.
+One threaded HTTP server answers for all of them under different prefixes;
+settings_overrides() gives the base URLs to point the app at.
+
+    python -m benchmarks.fake_upstreams [--port 8765] [--latency-ms 50] [--error-rate 0.01]
+"""
+
+import argparse
+import datetime
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+PROVIDERS = ('weather', 'eventbrite', 'google_oauth', 'calendar')
+
+
+class Behaviour:
+    """How one fake provider responds: latency (mean and jitter, ms), error rate and status, payload size."""
+    def __init__(self, latency_ms=50.0, jitter_ms=10.0, error_rate=0.0, error_status=503, items=10, description_bytes=500):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.items = items
+        self.description_bytes = description_bytes
+
+    def delay(self):
+        seconds = random.gauss(self.latency_ms, self.jitter_ms) / 1000.0
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+class FakeUpstreams:
+    """
+    Runs the fake providers on 127.0.0.1 in a background thread.
+
+        with FakeUpstreams(eventbrite=Behaviour(latency_ms=800)) as upstreams:
+            os.environ.update(upstreams.settings_overrides())
+    """
+    def __init__(self, port: int = 0, **behaviours):
+        unknown = set(behaviours) - set(PROVIDERS)
+        if unknown:
+            raise ValueError(f"Unknown providers: {', '.join(sorted(unknown))}")
+        self.behaviours = {name: behaviours.get(name) or Behaviour() for name in PROVIDERS}
+        self.calls = {name: 0 for name in PROVIDERS}
+        self._calls_lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), _handler_for(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def settings_overrides(self) -> dict:
+        return {
+            'OPENWEATHERMAP_API_URL': f"{self.base_url}/weather/data/2.5",
+            'OPENWEATHERMAP_GEOCODING_URL': f"{self.base_url}/weather/geo/1.0",
+            'EVENTBRITE_API_URL': f"{self.base_url}/eventbrite/v3",
+            'GOOGLE_CALENDAR_API_URL': f"{self.base_url}/google/calendar/v3",
+        }
+
+    @property
+    def token_uri(self) -> str:
+        """Use as the token_uri of benchmark credentials so refreshes hit the fake OAuth server."""
+        return f"{self.base_url}/google/token"
+
+    def count(self, provider: str):
+        with self._calls_lock:
+            self.calls[provider] += 1
+
+    def reset_counts(self) -> dict:
+        with self._calls_lock:
+            calls, self.calls = self.calls, {name: 0 for name in PROVIDERS}
+        return calls
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-upstreams', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _weather(query: dict, behaviour: Behaviour) -> dict:
+    city = query.get('q', ['Somewhere'])[0]
+    return {
+        'name': city.split(',')[0],
+        'main': {'temp': 18.5, 'feels_like': 17.9, 'humidity': 60},
+        'weather': [{'description': 'scattered clouds', 'icon': '03d'}],
+        'wind': {'speed': 3.2},
+    }
+
+
+def _geocode(query: dict, behaviour: Behaviour) -> list:
+    city = query.get('q', ['Somewhere'])[0]
+    seed = sum(map(ord, city.lower()))  # Same place for the same spelling, different cities apart.
+    return [{'name': city.split(',')[0], 'lat': -60 + seed % 120 + 0.01, 'lon': -170 + seed * 7 % 340 + 0.01, 'country': 'XX'}]
+
+
+def _eventbrite(query: dict, behaviour: Behaviour) -> dict:
+    page = int(query.get('page', ['1'])[0])
+    page_size = int(query.get('page_size', [str(behaviour.items)])[0])
+    count = min(page_size, behaviour.items)
+    start = datetime.datetime.now() + datetime.timedelta(days=1)
+    return {
+        'events': [{
+            'name': {'text': f"Benchmark event {page}-{i}"},
+            'url': f"https://example.com/events/{page}-{i}",
+            'start': {'local': (start + datetime.timedelta(hours=i)).strftime('%Y-%m-%dT%H:%M:%S')},
+            'description': {'html': 'x' * behaviour.description_bytes},
+            'venue': {'name': 'Benchmark Hall', 'address': {'localized_address_display': '1 Test Street'}},
+        } for i in range(count)],
+        'pagination': {'page_number': page, 'has_more_items': page < 3},
+    }
+
+
+def _calendar(query: dict, behaviour: Behaviour) -> dict:
+    if 'syncToken' in query:
+        return {'items': [], 'nextSyncToken': f"sync-{time.time_ns()}"}  # Incremental sync: no changes.
+    start = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=2)
+    return {
+        'items': [{
+            'id': f"event-{i}",
+            'status': 'confirmed',
+            'summary': f"Meeting {i}",
+            'description': 'x' * behaviour.description_bytes,
+            'start': {'dateTime': (start + datetime.timedelta(hours=i)).isoformat()},
+            'end': {'dateTime': (start + datetime.timedelta(hours=i, minutes=30)).isoformat()},
+        } for i in range(behaviour.items)],
+        'nextSyncToken': f"sync-{time.time_ns()}",
+    }
+
+
+def _token(query: dict, behaviour: Behaviour) -> dict:
+    return {'access_token': f"fake-access-{time.time_ns()}", 'expires_in': 3600, 'token_type': 'Bearer'}
+
+
+ROUTES = {
+    ('GET', '/weather/data/2.5/weather'): ('weather', _weather),
+    ('GET', '/weather/geo/1.0/direct'): ('weather', _geocode),
+    ('GET', '/eventbrite/v3/events/search/'): ('eventbrite', _eventbrite),
+    ('POST', '/google/token'): ('google_oauth', _token),
+    ('GET', '/google/calendar/v3/calendars/primary/events'): ('calendar', _calendar),
+}
+
+
+def _handler_for(upstreams: FakeUpstreams):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, like the real providers.
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            self._dispatch('POST')
+
+        def _dispatch(self, method):
+            url = urlsplit(self.path)
+            route = ROUTES.get((method, url.path))
+            if route is None:
+                return self._send(404, {'error': 'NOT_FOUND', 'error_description': f"No fake for {url.path}"})
+            provider, build = route
+            behaviour = upstreams.behaviours[provider]
+            upstreams.count(provider)
+            behaviour.delay()
+            if behaviour.should_fail():
+                return self._send(behaviour.error_status, {'error': 'FAKE_FAILURE', 'error_description': 'Injected failure'})
+            self._send(200, build(parse_qs(url.query), behaviour))
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Thousands of requests per run; stay quiet.
+
+    return Handler
+
+
+def add_behaviour_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency-ms', type=float, default=50.0, help="Mean upstream latency.")
+    parser.add_argument('--jitter-ms', type=float, default=10.0, help="Standard deviation of upstream latency.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of upstream calls answered with 503.")
+    parser.add_argument('--items', type=int, default=10, help="Events per Eventbrite page / Calendar listing.")
+    parser.add_argument('--description-bytes', type=int, default=500, help="Size of each event description.")
+    parser.add_argument('--provider', action='append', default=[], metavar='NAME:KEY=VALUE[,KEY=VALUE]',
+                        help="Per-provider override, e.g. eventbrite:latency_ms=800,error_rate=0.2")
+
+
+def behaviours_from_args(args) -> dict:
+    defaults = dict(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                    items=args.items, description_bytes=args.description_bytes)
+    behaviours = {name: dict(defaults) for name in PROVIDERS}
+    for spec in args.provider:
+        name, _, overrides = spec.partition(':')
+        if name not in behaviours:
+            raise SystemExit(f"Unknown provider '{name}'; expected one of {', '.join(PROVIDERS)}.")
+        for pair in filter(None, overrides.split(',')):
+            key, _, value = pair.partition('=')
+            behaviours[name][key] = int(value) if key in ('items', 'description_bytes', 'error_status') else float(value)
+    return {name: Behaviour(**values) for name, values in behaviours.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--port', type=int, default=8765)
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    upstreams = FakeUpstreams(port=args.port, **behaviours_from_args(args)).start()
+    for name, value in upstreams.settings_overrides().items():
+        print(f"{name}={value}")
+    print(f"# Google token_uri for test credentials: {upstreams.token_uri}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        upstreams.stop()
+
+
+if __name__ == '__main__':
+    main()
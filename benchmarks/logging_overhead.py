@@ -0,0 +1,123 @@
+# smart_advisor_project/benchmarks/logging_overhead.py
+"""
+Measures what a log call costs the calling thread: eager f-string versus lazy
+%-style messages at a filtered level, and a synchronous StreamHandler versus
+the queue-backed AsyncQueueHandler when records are written. Several threads
+log at once, as request workers do. Output goes to a temporary file whose
+writes take --write-delay-us extra, standing in for a slow or contended stderr
+(a pipe to a log shipper, a terminal). Results (mean and p99 microseconds
+per call) are reported as JSON.
+
+    python -m benchmarks.logging_overhead [--threads 8] [--calls 20000] [--write-delay-us 100] [--output logging.json]
+"""
+
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import setup_django
+from benchmarks.dashboard_load import percentile
+
+
+class SlowStream:
+    """File wrapper whose writes block (releasing the GIL) like a busy pipe would."""
+    def __init__(self, f, delay_seconds: float):
+        self.f = f
+        self.delay_seconds = delay_seconds
+
+    def write(self, text):
+        if self.delay_seconds:
+            time.sleep(self.delay_seconds)
+        return self.f.write(text)
+
+    def flush(self):
+        self.f.flush()
+
+
+def measure(logger, log_call, threads: int, calls: int) -> dict:
+    samples = []
+    lock = threading.Lock()
+    location, user = "London,UK", {'username': 'benchmark', 'id': 42}
+
+    def worker():
+        local = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            log_call(logger, location, user)
+            local.append(time.perf_counter() - started)
+        with lock:
+            samples.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    samples.sort()
+    return {
+        'calls': len(samples),
+        'mean_us': round(sum(samples) / len(samples) * 1e6, 3),
+        'p99_us': round(percentile(samples, 0.99) * 1e6, 3),
+    }
+
+
+def eager(logger, location, user):
+    logger.debug(f"Fetching weather for user {user}, location: {location}")
+
+
+def lazy(logger, location, user):
+    logger.debug("Fetching weather for user %s, location: %s", user, location)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--calls', type=int, default=20000, help="Log calls per thread and variant.")
+    parser.add_argument('--write-delay-us', type=float, default=100.0, help="Extra time each stream write takes.")
+    parser.add_argument('--output', help="Write the JSON results here instead of stdout.")
+    args = parser.parse_args()
+
+    setup_django()
+    from advisor_app.log_handlers import AsyncQueueHandler
+
+    results = []
+    with tempfile.TemporaryFile('w') as f:
+        sink = SlowStream(f, args.write_delay_us / 1e6)
+        formatter = logging.Formatter('{levelname} {asctime} {module}: {message}', style='{')
+        sync_handler = logging.StreamHandler(sink)
+        async_handler = AsyncQueueHandler(maxsize=args.threads * args.calls, stream=sink)  # Large enough to drop nothing.
+        for handler in (sync_handler, async_handler):
+            handler.setFormatter(formatter)
+
+        variants = [
+            ('filtered-eager', logging.INFO, sync_handler, eager),
+            ('filtered-lazy', logging.INFO, sync_handler, lazy),
+            ('written-sync', logging.DEBUG, sync_handler, lazy),
+            ('written-async', logging.DEBUG, async_handler, lazy),
+        ]
+        for name, level, handler, log_call in variants:
+            logger = logging.getLogger(f'benchmarks.logging.{name}')
+            logger.propagate = False
+            logger.setLevel(level)
+            logger.addHandler(handler)
+            result = dict(variant=name, **measure(logger, log_call, args.threads, args.calls))
+            if handler is async_handler:
+                async_handler.stop()  # Include the drain in the run, but not in the per-call numbers.
+            results.append(result)
+            print(f"{name:15} mean {result['mean_us']:8.2f} us  p99 {result['p99_us']:8.2f} us", file=sys.stderr)
+
+    meta = {'threads': args.threads, 'calls_per_thread': args.calls, 'write_delay_us': args.write_delay_us}
+    output = json.dumps({'meta': meta, 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
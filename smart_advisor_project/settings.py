@@ -40,22 +40,28 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'advisor_app.middleware.RequestMetricsMiddleware', # First, so it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'advisor_app.middleware.ProfileMiddleware', # Lazy request.profile; needs request.user
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'smart_advisor_project.urls' # Points to your project's main urls.py
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader', # Replaces APP_DIRS, which can't be combined with 'loaders'
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'], # For global templates like registration/
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -63,19 +69,71 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compiled templates are kept in memory in production; DEBUG re-reads them on every render.
+            'loaders': TEMPLATE_LOADERS if DEBUG else [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)],
         },
     },
 ]
+# Seconds a rendered dashboard widget (weather, events, calendar) is reused. Fragment keys
+# include a fingerprint of the widget's data, so new data always renders fresh HTML.
+DASHBOARD_FRAGMENT_CACHE_TTL = int(os.getenv('DASHBOARD_FRAGMENT_CACHE_TTL', '300'))
 
 WSGI_APPLICATION = 'smart_advisor_project.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# DATABASE_PROFILE picks the database setup:
+#   'sqlite' (default): a local file, tuned on every new connection with SQLITE_PRAGMAS
+#       (busy wait, fsync level, mmap). SQLITE_JOURNAL_MODE is different: the journal mode is
+#       stored in the database file, so it is opt-in (set SQLITE_JOURNAL_MODE=WAL on deployments,
+#       so readers don't block on credential saves); left empty, the file's own mode is kept
+#       and the checked-in development database isn't rewritten.
+#   'server': a client/server database (PostgreSQL by default) configured from DB_* variables,
+#       with persistent connections (DB_CONN_MAX_AGE seconds, checked before reuse).
+DATABASE_PROFILE = os.getenv('DATABASE_PROFILE', 'sqlite')
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', '')
+SQLITE_PRAGMAS = {
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    # NORMAL is durable with WAL except on power loss; rollback journals need FULL for that.
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL' if SQLITE_JOURNAL_MODE.upper() == 'WAL' else 'FULL'),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024))),
+    'temp_store': 'MEMORY',
 }
 
+if DATABASE_PROFILE == 'server':
+    DATABASES = {
+        'default': {
+            'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
+            'NAME': os.getenv('DB_NAME', 'smart_advisor'),
+            'USER': os.getenv('DB_USER', ''),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', ''),
+            # Each worker thread keeps one connection open, so the connection count is
+            # processes x threads; size the server (or a pgbouncer in front) for that.
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5'))},
+        }
+    }
+    if os.getenv('DB_POOL_MAX_SIZE'):
+        import django
+        if django.VERSION < (5, 1):
+            raise ValueError("DB_POOL_MAX_SIZE needs Django 5.1+ (psycopg connection pool); use DB_CONN_MAX_AGE instead.")
+        # A pool replaces persistent connections.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE')),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', '10')),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000},
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -95,6 +153,12 @@ STATIC_ROOT = BASE_DIR / 'collected_static' # For production
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Authentication settings
+# ProfileModelBackend loads the session user with its profile in one query. ModelBackend
+# stays listed so sessions created before it was added remain valid.
+AUTHENTICATION_BACKENDS = [
+    'advisor_app.backends.ProfileModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
 LOGIN_URL = 'login'  # The name of your login URL pattern
 LOGIN_REDIRECT_URL = 'home' # This tells Django where to redirect after successful login.
                             # It MUST be a valid URL name.
@@ -107,24 +171,176 @@ GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
 GOOGLE_PROJECT_ID = os.getenv('GOOGLE_PROJECT_ID')
 GOOGLE_REDIRECT_URI = os.getenv('GOOGLE_REDIRECT_URI')
 EVENTBRITE_API_KEY = os.getenv('EVENTBRITE_API_KEY')
+# Upstream base URLs; overridden to point at local stand-ins by the benchmarks.
+OPENWEATHERMAP_API_URL = os.getenv('OPENWEATHERMAP_API_URL', 'https://api.openweathermap.org/data/2.5')
+EVENTBRITE_API_URL = os.getenv('EVENTBRITE_API_URL', 'https://www.eventbriteapi.com/v3')
+GOOGLE_CALENDAR_API_URL = os.getenv('GOOGLE_CALENDAR_API_URL', 'https://www.googleapis.com/calendar/v3')
+OPENWEATHERMAP_GEOCODING_URL = os.getenv('OPENWEATHERMAP_GEOCODING_URL', 'https://api.openweathermap.org/geo/1.0')
+# Profile locations are geocoded once (results kept in GeocodedLocation; misses retried after
+# GEOCODE_NOT_FOUND_TTL seconds). Weather and Eventbrite lookups by coordinates are snapped to
+# geohash cells of GEO_CELL_PRECISION characters (5 = about 5km x 5km) and cached per cell.
+GEOCODE_NOT_FOUND_TTL = int(os.getenv('GEOCODE_NOT_FOUND_TTL', '86400'))
+GEO_CELL_PRECISION = int(os.getenv('GEO_CELL_PRECISION', '5'))
+# Eventbrite search: results per page, pages fetched at most, events kept, and optional
+# expansions (comma-separated; 'venue' is all the dashboard needs, empty disables them).
+EVENTBRITE_PAGE_SIZE = int(os.getenv('EVENTBRITE_PAGE_SIZE', '20'))
+EVENTBRITE_MAX_PAGES = int(os.getenv('EVENTBRITE_MAX_PAGES', '1'))
+EVENTBRITE_MAX_EVENTS = int(os.getenv('EVENTBRITE_MAX_EVENTS', '10'))
+EVENTBRITE_EXPAND = os.getenv('EVENTBRITE_EXPAND', 'venue')
 
 GOOGLE_CALENDAR_SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
+# Stored Google credentials are encrypted with AES-256-GCM. GOOGLE_CREDENTIALS_KEY is a
+# urlsafe-base64 32-byte key; without one a key is derived from SECRET_KEY. Retired keys
+# (comma-separated) stay in GOOGLE_CREDENTIALS_OLD_KEYS until rows are re-encrypted.
+GOOGLE_CREDENTIALS_KEY = os.getenv('GOOGLE_CREDENTIALS_KEY', '')
+GOOGLE_CREDENTIALS_OLD_KEYS = [key for key in os.getenv('GOOGLE_CREDENTIALS_OLD_KEYS', '').split(',') if key]
+# Process-wide LRU of decoded Google credentials (entries); 0 disables it.
+GOOGLE_CREDENTIALS_LRU_SIZE = int(os.getenv('GOOGLE_CREDENTIALS_LRU_SIZE', '0'))
+# Background token refresh (manage.py refresh_google_tokens): tokens expiring within the
+# window are refreshed ahead of time in parallel batches.
+GOOGLE_TOKEN_REFRESH_WINDOW = int(os.getenv('GOOGLE_TOKEN_REFRESH_WINDOW', '900'))
+GOOGLE_TOKEN_REFRESH_WORKERS = int(os.getenv('GOOGLE_TOKEN_REFRESH_WORKERS', '8'))
+GOOGLE_TOKEN_REFRESH_BATCH_SIZE = int(os.getenv('GOOGLE_TOKEN_REFRESH_BATCH_SIZE', '100'))
+GOOGLE_CALENDAR_TIMEOUT = float(os.getenv('GOOGLE_CALENDAR_TIMEOUT', '10'))  # Seconds per Calendar API call
+# Per-user Calendar event store: served as-is for GOOGLE_CALENDAR_SYNC_TTL seconds, then
+# synced incrementally. Full syncs cover the next GOOGLE_CALENDAR_SYNC_WINDOW_DAYS days.
+GOOGLE_CALENDAR_SYNC_TTL = int(os.getenv('GOOGLE_CALENDAR_SYNC_TTL', '120'))
+GOOGLE_CALENDAR_SYNC_WINDOW_DAYS = int(os.getenv('GOOGLE_CALENDAR_SYNC_WINDOW_DAYS', '14'))
+
+# Dashboard aggregation: upstream fetches run concurrently on a bounded thread pool,
+# and the page renders whatever finished within one overall deadline (seconds).
+ADVISOR_FETCH_MAX_WORKERS = int(os.getenv('ADVISOR_FETCH_MAX_WORKERS', '16'))
+ADVISOR_DASHBOARD_DEADLINE = float(os.getenv('ADVISOR_DASHBOARD_DEADLINE', '8'))
+# Progressive dashboard: the home page returns a shell immediately and loads each widget
+# from /widgets/<name>/ in parallel, so time-to-first-byte no longer waits on upstream APIs.
+ADVISOR_PROGRESSIVE_DASHBOARD = os.getenv('ADVISOR_PROGRESSIVE_DASHBOARD', 'False').lower() in ('true', '1', 't')
+# Bulk snapshots (advisor_app/services/dashboard_snapshots.py): users loaded and grouped per batch,
+# and the thread pool for calendar syncs and Eventbrite fetches.
+DASHBOARD_SNAPSHOT_BATCH_SIZE = int(os.getenv('DASHBOARD_SNAPSHOT_BATCH_SIZE', '500'))
+DASHBOARD_SNAPSHOT_WORKERS = int(os.getenv('DASHBOARD_SNAPSHOT_WORKERS', '8'))
+
+# Caching. The default backend must be shared by all worker processes (and the prewarm
+# command): Redis when REDIS_URL is set (needs the redis package), otherwise a cache directory on local disk.
+# CACHE_BACKEND/CACHE_LOCATION override both; a process-local backend such as LocMemCache
+# also turns off the per-process tier below, which would only duplicate it.
+REDIS_URL = os.getenv('REDIS_URL', '')
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache' if REDIS_URL
+                             else 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', REDIS_URL or str(BASE_DIR / '.advisor_cache')),
+        # Bump to make every existing entry unreadable (e.g. after a deploy that changes cached formats).
+        'VERSION': int(os.getenv('CACHE_VERSION', '1')),
+    }
+}
+# Django's file, database and in-memory backends cull past MAX_ENTRIES. Redis and memcached
+# hand OPTIONS to their client libraries (which reject it) and bound memory on the server.
+if CACHES['default']['BACKEND'].rsplit('.', 1)[-1] in ('FileBasedCache', 'DatabaseCache', 'LocMemCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '10000'))}
+# Service results also go through a per-process LRU (advisor_app.services.caching.LocalCache)
+# holding up to ADVISOR_LOCAL_CACHE_MAX_BYTES of pickled entries (0 disables it). A local copy is
+# kept at most ADVISOR_LOCAL_CACHE_TTL seconds, so other processes' refreshes show up within that.
+ADVISOR_LOCAL_CACHE_MAX_BYTES = int(os.getenv('ADVISOR_LOCAL_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+ADVISOR_LOCAL_CACHE_TTL = float(os.getenv('ADVISOR_LOCAL_CACHE_TTL', '30'))
+# Cache TTLs are spread by up to +/- this fraction, so entries written together don't expire together.
+CACHE_TTL_JITTER = float(os.getenv('CACHE_TTL_JITTER', '0.1'))
+# Weather responses are cached per normalized location; stale entries are served
+# for WEATHER_CACHE_STALE_TTL more seconds while a background refresh runs.
+WEATHER_CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', '600'))
+WEATHER_CACHE_STALE_TTL = int(os.getenv('WEATHER_CACHE_STALE_TTL', '1800'))
+WEATHER_NEGATIVE_CACHE_TTL = int(os.getenv('WEATHER_NEGATIVE_CACHE_TTL', '120'))
+# weather_service.get_weather_batch: threads for locations without a bulk endpoint.
+WEATHER_BATCH_MAX_WORKERS = int(os.getenv('WEATHER_BATCH_MAX_WORKERS', '8'))
+EVENTBRITE_CACHE_TTL = int(os.getenv('EVENTBRITE_CACHE_TTL', '1800'))
+EVENTBRITE_CACHE_STALE_TTL = int(os.getenv('EVENTBRITE_CACHE_STALE_TTL', '3600'))
+EVENTBRITE_NEGATIVE_CACHE_TTL = int(os.getenv('EVENTBRITE_NEGATIVE_CACHE_TTL', '300'))
+
+# Outbound HTTP: one pooled keep-alive session per provider (see advisor_app.services.http_sessions).
+# HTTP_POOL_CONNECTIONS is the number of per-host pools kept, HTTP_POOL_MAXSIZE the connections per host.
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '2'))
+HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.3'))
+# Longest Retry-After (seconds) worth waiting for inside a request; longer asks aren't retried.
+HTTP_RETRY_AFTER_MAX = float(os.getenv('HTTP_RETRY_AFTER_MAX', '2'))
+
+# Per-provider circuit breakers (advisor_app/services/resilience.py). A provider's circuit
+# opens when at least CIRCUIT_BREAKER_MIN_REQUESTS calls in the last CIRCUIT_BREAKER_WINDOW
+# seconds failed at CIRCUIT_BREAKER_FAILURE_RATE or more; calls then fail fast (stale cache
+# entries are still served) until a probe succeeds after CIRCUIT_BREAKER_OPEN_SECONDS.
+CIRCUIT_BREAKER_WINDOW = int(os.getenv('CIRCUIT_BREAKER_WINDOW', '60'))
+CIRCUIT_BREAKER_MIN_REQUESTS = int(os.getenv('CIRCUIT_BREAKER_MIN_REQUESTS', '10'))
+CIRCUIT_BREAKER_FAILURE_RATE = float(os.getenv('CIRCUIT_BREAKER_FAILURE_RATE', '0.5'))
+CIRCUIT_BREAKER_OPEN_SECONDS = int(os.getenv('CIRCUIT_BREAKER_OPEN_SECONDS', '30'))
+# Request timeouts follow p95 latency x ADAPTIVE_TIMEOUT_MULTIPLIER, never below the floor
+# nor above each provider's fixed maximum.
+ADAPTIVE_TIMEOUT_FLOOR = float(os.getenv('ADAPTIVE_TIMEOUT_FLOOR', '1.0'))
+ADAPTIVE_TIMEOUT_MULTIPLIER = float(os.getenv('ADAPTIVE_TIMEOUT_MULTIPLIER', '3.0'))
+
+# Shared outbound rate limits (advisor_app/services/rate_limit.py): one token bucket per provider
+# quota, {bucket: (requests per second, burst)}, kept in the RATE_LIMIT_DB SQLite file so every
+# worker process draws on the same budget. Providers missing here (or with rate 0) are unlimited;
+# RATE_LIMIT_BUCKETS maps providers that share another's quota onto its bucket.
+RATE_LIMITS = {
+    'openweathermap': (float(os.getenv('OPENWEATHERMAP_RATE_LIMIT', '1')), int(os.getenv('OPENWEATHERMAP_RATE_BURST', '60'))),
+    'eventbrite': (float(os.getenv('EVENTBRITE_RATE_LIMIT', '0.5')), int(os.getenv('EVENTBRITE_RATE_BURST', '50'))),
+    'google_calendar': (float(os.getenv('GOOGLE_CALENDAR_RATE_LIMIT', '10')), int(os.getenv('GOOGLE_CALENDAR_RATE_BURST', '100'))),
+}
+RATE_LIMIT_BUCKETS = {'openweathermap_geo': 'openweathermap'}
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', BASE_DIR / 'rate_limits.sqlite3')
+# Background calls (prewarming, stale-entry refreshes) leave this fraction of each burst to
+# interactive requests. A call waits up to RATE_LIMIT_MAX_WAIT[priority] seconds for a token
+# and is then shed (answered as "temporarily unavailable", or from a stale cache entry).
+RATE_LIMIT_BACKGROUND_RESERVE = float(os.getenv('RATE_LIMIT_BACKGROUND_RESERVE', '0.5'))
+RATE_LIMIT_MAX_WAIT = {
+    'interactive': float(os.getenv('RATE_LIMIT_INTERACTIVE_MAX_WAIT', '1')),
+    'background': float(os.getenv('RATE_LIMIT_BACKGROUND_MAX_WAIT', '30')),
+}
+
+# Request metrics (advisor_app/middleware.py). /metrics/ serves Prometheus text to staff users,
+# to scrapers sending METRICS_TOKEN as "Authorization: Bearer <token>", and to the addresses
+# in METRICS_ALLOWED_IPS (comma-separated); everyone else gets a 404 (403 once a token is set).
+# SERVER_TIMING_ENABLED adds a per-phase Server-Timing header to every response.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', str(DEBUG)).lower() in ('true', '1', 't')
 
 # Logging Configuration (from previous response, ensure it's suitable)
 LOGGING_CONFIG = None
 LOGLEVEL = os.getenv('DJANGO_LOG_LEVEL', 'INFO').upper()
-logging.config.dictConfig({
+# The app's own level; DEBUG lines cost a level check and nothing else when it's INFO.
+ADVISOR_LOG_LEVEL = os.getenv('ADVISOR_LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO').upper()
+# LOG_FORMAT: 'simple' (text) or 'json' (one object per line, for log shippers).
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'simple')
+# With LOG_ASYNC, records go through a bounded queue (LOG_QUEUE_SIZE; overflow is dropped
+# and counted) to a background writer thread instead of blocking on stderr.
+LOG_ASYNC = os.getenv('LOG_ASYNC', 'True').lower() in ('true', '1', 't')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Keep 1 in LOG_DEBUG_SAMPLE_RATE DEBUG records per call site (1 keeps them all).
+LOG_DEBUG_SAMPLE_RATE = int(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1'))
+if LOG_ASYNC:
+    # A '()' factory rather than 'class': from Python 3.12 dictConfig wires up 'class' QueueHandlers
+    # itself (expecting 'handlers'/'listener' keys), while this one owns its listener and stream.
+    CONSOLE_HANDLER = {'()': 'advisor_app.log_handlers.AsyncQueueHandler', 'maxsize': LOG_QUEUE_SIZE}
+else:
+    CONSOLE_HANDLER = {'class': 'logging.StreamHandler'}
+LOGGING = {
     'version': 1, 'disable_existing_loggers': False,
     'formatters': {
         'verbose': {'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}', 'style': '{'},
         'simple': {'format': '{levelname} {asctime} {module}: {message}', 'style': '{'},
+        'json': {'()': 'advisor_app.log_handlers.JsonFormatter'},
     },
-    'handlers': {'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'}},
+    'filters': {
+        'sample_debug': {'()': 'advisor_app.log_handlers.SamplingFilter', 'rate': LOG_DEBUG_SAMPLE_RATE},
+    },
+    'handlers': {'console': dict(CONSOLE_HANDLER, formatter=LOG_FORMAT, filters=['sample_debug'])},
     'root': {'handlers': ['console'], 'level': LOGLEVEL},
     'loggers': {
         'django': {'handlers': ['console'], 'level': LOGLEVEL, 'propagate': False},
         'django.db.backends': {'handlers': ['console'], 'level': 'DEBUG' if DEBUG else 'INFO', 'propagate': False},
-        'advisor_app': {'handlers': ['console'], 'level': 'DEBUG', 'propagate': False},
+        'advisor_app': {'handlers': ['console'], 'level': ADVISOR_LOG_LEVEL, 'propagate': False},
         'googleapiclient': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False}
     },
-})
\ No newline at end of file
+}
+logging.config.dictConfig(LOGGING)
\ No newline at end of file
@@ -0,0 +1,29 @@
+// smart_advisor_project/staticfiles/js/dashboard_widgets.js
+// Progressive dashboard: loads every widget placeholder ([data-widget-src]) in parallel
+// and swaps in the returned HTML fragment as soon as it arrives.
+(function () {
+    function showError(slot) {
+        slot.innerHTML = '<p class="error-message">This section could not be loaded. Please refresh the page.</p>';
+    }
+
+    function loadWidget(slot) {
+        // Default cache mode: the browser revalidates with If-None-Match and reuses its copy on 304.
+        return fetch(slot.dataset.widgetSrc, {credentials: 'same-origin', headers: {'X-Requested-With': 'fetch'}})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error('HTTP ' + response.status);
+                }
+                return response.text();
+            })
+            .then(function (html) {
+                slot.outerHTML = html;
+            })
+            .catch(function () {
+                showError(slot);
+            });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('[data-widget-src]').forEach(loadWidget);
+    });
+})();